@@ -0,0 +1,7 @@
+"""Scriptworker benchmarks.
+
+Run ``python -m benchmarks.bench --help`` (or ``tox -e bench``) from the repo
+root for the microbenchmarks, and ``python -m benchmarks.load --help`` for the
+end to end load test of the worker loop.
+
+"""
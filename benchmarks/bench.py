@@ -0,0 +1,491 @@
+#!/usr/bin/env python
+"""Benchmark scriptworker's hot paths.
+
+Each benchmark runs ``--repeat`` times after ``--warmup`` untimed runs, and
+reports the min, median, mean and standard deviation of the wall clock time,
+plus the throughput in the benchmark's unit (MB, files, lines, or tasks) per
+second.  Network benchmarks run against ``FakeTaskcluster`` on 127.0.0.1, with
+``--latency-ms`` of added latency per request.
+
+``--output`` writes the results, and the scriptworker, python and platform
+versions, as json.  ``--compare`` reads a previous ``--output`` file and exits
+non-zero if any benchmark's median got slower by more than ``--threshold``
+percent, which is how to check a change for regressions::
+
+    python -m benchmarks.bench --output before.json
+    # ... make the change ...
+    python -m benchmarks.bench --compare before.json
+
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from copy import deepcopy
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from unittest import mock
+
+import yaml
+from taskcluster.aio import Queue
+
+import scriptworker
+from benchmarks.fake_taskcluster import FakeTaskcluster, SyntheticGraph
+from scriptworker.artifacts import compress_artifact_if_supported, download_artifacts, get_artifact_url, upload_artifacts
+from scriptworker.config import apply_product_config
+from scriptworker.constants import DEFAULT_CONFIG
+from scriptworker.context import Context
+from scriptworker.cot.verify import ChainOfTrust, verify_chain_of_trust
+from scriptworker.log import pipe_to_log
+from scriptworker.serialization import JSON_BACKENDS, YAML_BACKENDS, Serializer
+from scriptworker.utils import filepaths_in_dir, get_hash, makedirs, scriptworker_session
+
+MB = 1024 * 1024
+
+BENCHMARKS: Dict[str, Any] = {}
+
+
+def benchmark(name: str, unit: str) -> Callable[..., Any]:
+    """Register a benchmark.
+
+    The decorated coroutine gets a ``BenchEnv`` and returns an async callable
+    that runs one iteration and returns the amount of work it did, in ``unit``.
+    """
+
+    def wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
+        BENCHMARKS[name] = (func, unit)
+        return func
+
+    return wrapper
+
+
+# BenchEnv {{{1
+class BenchEnv(object):
+    """Shared state for one benchmark run.
+
+    Attributes:
+        opts (argparse.Namespace): the commandline options.
+        tmp (str): a scratch directory, removed afterwards.
+        fake (FakeTaskcluster): the running fake Taskcluster.
+        session (aiohttp.ClientSession): the http session.
+
+    """
+
+    def __init__(self, opts: argparse.Namespace, tmp: str, fake: FakeTaskcluster, session: Any) -> None:
+        """Initialize BenchEnv."""
+        self.opts = opts
+        self.tmp = tmp
+        self.fake = fake
+        self.session = session
+        self._counter = 0
+
+    @property
+    def graph(self) -> SyntheticGraph:
+        """SyntheticGraph: the graph the fake is serving."""
+        return self.fake.graph
+
+    def scratch_dir(self) -> str:
+        """Return a new, empty directory under ``tmp``."""
+        self._counter += 1
+        path = os.path.join(self.tmp, "scratch{}".format(self._counter))
+        makedirs(path)
+        return path
+
+    def make_context(self, task_id: Optional[str] = None, claim: bool = False) -> Context:
+        """Return a Context pointed at the fake, with fresh work and artifact dirs.
+
+        Args:
+            task_id (str, optional): the task to set as ``context.task``.
+                Defaults to the first target task.
+            claim (bool, optional): set ``claim_task`` too, which creates
+                ``temp_queue`` for uploads.  Defaults to False.
+
+        """
+        task_id = task_id or self.graph.target_task_ids[0]
+        base_dir = self.scratch_dir()
+        context = Context()
+        context.session = self.session
+        config = dict(deepcopy(DEFAULT_CONFIG))
+        config.update(
+            self.fake.config(
+                work_dir=os.path.join(base_dir, "work"),
+                artifact_dir=os.path.join(base_dir, "artifacts"),
+                task_log_dir=os.path.join(base_dir, "artifacts", "public", "logs"),
+            )
+        )
+        context.config = apply_product_config(config)
+        makedirs(context.config["work_dir"])
+        makedirs(context.config["artifact_dir"])
+        context.queue = Queue(session=self.session, options={"rootUrl": self.fake.root_url})
+        if claim:
+            context.claim_task = self.graph.claim(task_id)
+        else:
+            context.task = deepcopy(self.graph.tasks[task_id])
+        return context
+
+
+# benchmarks {{{1
+@benchmark("get_hash", unit="MB")
+async def bench_get_hash(env: BenchEnv) -> Callable[[], Awaitable[float]]:
+    """Hash one large file."""
+    path = os.path.join(env.scratch_dir(), "hash.bin")
+    with open(path, "wb") as fh:
+        fh.write(os.urandom(env.opts.size_mb * MB))
+
+    async def run() -> float:
+        get_hash(path, "sha256")
+        return env.opts.size_mb
+
+    return run
+
+
+@benchmark("filepaths_in_dir", unit="files")
+async def bench_filepaths_in_dir(env: BenchEnv) -> Callable[[], Awaitable[float]]:
+    """Walk an artifact tree of ``--num-files`` files, 100 per directory."""
+    path = env.scratch_dir()
+    for number in range(env.opts.num_files):
+        subdir = os.path.join(path, "public", "dir{}".format(number // 100))
+        makedirs(subdir)
+        with open(os.path.join(subdir, "file{}.txt".format(number)), "w") as fh:
+            fh.write("x")
+
+    async def run() -> float:
+        filepaths_in_dir(path)
+        return env.opts.num_files
+
+    return run
+
+
+@benchmark("compress_artifact_if_supported", unit="MB")
+async def bench_compress(env: BenchEnv) -> Callable[[], Awaitable[float]]:
+    """Gzip a text log, as ``upload_artifacts`` does for ``.log`` files."""
+    line = b"[task 2030-01-01T00:00:00.000Z] 12:00:00     INFO - compiling something/somewhere.cpp\n"
+    contents = line * (env.opts.size_mb * MB // len(line))
+    path = os.path.join(env.scratch_dir(), "live_backing.log")
+
+    async def run() -> float:
+        # Compression replaces the file, so rewrite it every time.
+        with open(path, "wb") as fh:
+            fh.write(contents)
+        compress_artifact_if_supported(path)
+        return len(contents) / MB
+
+    return run
+
+
+@benchmark("pipe_to_log", unit="lines")
+async def bench_pipe_to_log(env: BenchEnv) -> Callable[[], Awaitable[float]]:
+    """Copy task output to the task log, as ``run_task`` does."""
+    num_lines = env.opts.num_files * 10
+    data = b"".join(b"line %d of task output, long enough to look like a compiler warning\n" % number for number in range(num_lines))
+    path = os.path.join(env.scratch_dir(), "live_backing.log")
+
+    async def run() -> float:
+        pipe = asyncio.StreamReader()
+        pipe.feed_data(data)
+        pipe.feed_eof()
+        with open(path, "w") as fh:
+            await pipe_to_log(pipe, filehandles=[fh])
+        return num_lines
+
+    return run
+
+
+@benchmark("download_artifacts", unit="MB")
+async def bench_download_artifacts(env: BenchEnv) -> Callable[[], Awaitable[float]]:
+    """Download every build artifact of the last build layer."""
+    graph = env.graph
+    downloads = [(task_id, name) for task_id in graph.build_layers[-1] for name in sorted(graph.artifacts[task_id]) if name.startswith("public/build/")]
+    total = sum(len(graph.artifacts[task_id][name]) for task_id, name in downloads) / MB
+
+    async def run() -> float:
+        context = env.make_context()
+        urls = [get_artifact_url(context, task_id, name) for task_id, name in downloads]
+        await download_artifacts(context, urls)
+        return total
+
+    return run
+
+
+@benchmark("upload_artifacts", unit="MB")
+async def bench_upload_artifacts(env: BenchEnv) -> Callable[[], Awaitable[float]]:
+    """Upload ``--upload-files`` artifacts of ``--size-mb`` / ``--upload-files`` MB each."""
+    size = env.opts.size_mb * MB // env.opts.upload_files
+    contents = os.urandom(size)
+
+    async def run() -> float:
+        context = env.make_context(claim=True)
+        files = []
+        for number in range(env.opts.upload_files):
+            target_path = "public/build/upload-{}.bin".format(number)
+            path = os.path.join(context.config["artifact_dir"], target_path)
+            makedirs(os.path.dirname(path))
+            with open(path, "wb") as fh:
+                fh.write(contents)
+            files.append(target_path)
+        await upload_artifacts(context, files)
+        return size * len(files) / MB
+
+    return run
+
+
+@benchmark("verify_chain_of_trust", unit="tasks")
+async def bench_verify_chain_of_trust(env: BenchEnv) -> Callable[[], Awaitable[float]]:
+    """Verify the full chain of trust of the first signing task."""
+    num_links = 1 + sum(len(layer) for layer in env.graph.build_layers)
+
+    async def run() -> float:
+        context = env.make_context()
+        chain = ChainOfTrust(context, "signing", task_id=env.graph.target_task_ids[0])
+        # The real .taskcluster.yml url is hardcoded to hg.mozilla.org / github.
+        with mock.patch("scriptworker.cot.verify.build_taskcluster_yml_url", env.fake.taskcluster_yml_url):
+            await verify_chain_of_trust(chain)
+        return num_links
+
+    return run
+
+
+def _slugid(number: int) -> str:
+    return base64.urlsafe_b64encode(hashlib.sha256(str(number).encode()).digest()[:16]).decode().rstrip("=")
+
+
+def big_task_graph(env: BenchEnv, num_tasks: int) -> Dict[str, Any]:
+    """Return a ``task-graph.json`` of ``num_tasks`` tasks, like a decision task's."""
+    definitions = [defn for task_id, defn in sorted(env.graph.tasks.items()) if task_id != env.graph.decision_task_id]
+    task_ids = [_slugid(number) for number in range(num_tasks)]
+    task_graph = {}
+    for number, task_id in enumerate(task_ids):
+        defn = deepcopy(definitions[number % len(definitions)])
+        label = "{}-{}".format(defn["metadata"]["name"], number)
+        defn["metadata"]["name"] = label
+        defn["dependencies"] = task_ids[max(number - 3, 0) : number]
+        task_graph[task_id] = {
+            "attributes": {"kind": label.split("-")[0], "build_platform": "linux64", "build_type": "opt", "run_on_projects": ["all"]},
+            "dependencies": {"dep-{}".format(index): dep for index, dep in enumerate(defn["dependencies"])},
+            "kind": label.split("-")[0],
+            "label": label,
+            "optimization": None,
+            "task": defn,
+            "task_id": task_id,
+        }
+    return task_graph
+
+
+def _serialization_benchmarks() -> None:
+    for backend in JSON_BACKENDS:
+        try:
+            Serializer(json_backend=backend)
+        except ValueError:
+            continue
+
+        @benchmark("load_json[{}]".format(backend), unit="MB")
+        async def bench_load_json(env: BenchEnv, backend: str = backend) -> Callable[[], Awaitable[float]]:
+            """Parse a ``--graph-tasks`` task-graph.json, as chain of trust verification does."""
+            serializer = Serializer(json_backend=backend)
+            body = json.dumps(big_task_graph(env, env.opts.graph_tasks), indent=2, sort_keys=True)
+
+            async def run() -> float:
+                serializer.loads_json(body)
+                return len(body) / MB
+
+            return run
+
+        @benchmark("dump_json[{}]".format(backend), unit="MB")
+        async def bench_dump_json(env: BenchEnv, backend: str = backend) -> Callable[[], Awaitable[float]]:
+            """Dump a ``--graph-tasks`` task-graph.json as non-canonical json."""
+            serializer = Serializer(json_backend=backend)
+            task_graph = big_task_graph(env, env.opts.graph_tasks)
+
+            async def run() -> float:
+                return len(serializer.dumps_json(task_graph, canonical=False)) / MB
+
+            return run
+
+    for backend in YAML_BACKENDS:
+        try:
+            Serializer(yaml_backend=backend)
+        except ValueError:
+            continue
+
+        @benchmark("load_yaml[{}]".format(backend), unit="MB")
+        async def bench_load_yaml(env: BenchEnv, backend: str = backend) -> Callable[[], Awaitable[float]]:
+            """Parse a yaml file of ``--graph-tasks`` / 20 tasks, the size of a big projects.yml."""
+            serializer = Serializer(yaml_backend=backend)
+            body = yaml.safe_dump(big_task_graph(env, max(env.opts.graph_tasks // 20, 1)))
+
+            async def run() -> float:
+                serializer.loads_yaml(body)
+                return len(body) / MB
+
+            return run
+
+
+_serialization_benchmarks()
+
+
+# run {{{1
+def summarize(name: str, unit: str, times: List[float], work: float) -> Dict[str, Any]:
+    """Summarize the timings of one benchmark.
+
+    Args:
+        name (str): the benchmark name.
+        unit (str): the unit ``work`` is in.
+        times (list): the wall clock seconds of each timed run.
+        work (float): the work done per run, in ``unit``.
+
+    Returns:
+        dict: the summary.
+
+    """
+    median = statistics.median(times)
+    return {
+        "name": name,
+        "unit": unit,
+        "repeat": len(times),
+        "min": min(times),
+        "median": median,
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "work": work,
+        "throughput": work / median if median else 0.0,
+    }
+
+
+async def run_benchmarks(opts: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Run the selected benchmarks.
+
+    Args:
+        opts (argparse.Namespace): the commandline options.
+
+    Returns:
+        list: one summary dict per benchmark.
+
+    """
+    graph = SyntheticGraph(
+        builds_per_layer=opts.builds,
+        depth=opts.depth,
+        artifacts_per_build=opts.artifacts_per_build,
+        artifact_size=opts.artifact_size_mb * MB,
+        optional_artifacts=opts.optional_artifacts,
+        wildcard=opts.wildcard,
+    )
+    results = []
+    tmp = tempfile.mkdtemp(prefix="scriptworker-bench-")
+    try:
+        async with FakeTaskcluster(graph, latency=opts.latency_ms / 1000) as fake, scriptworker_session() as session:
+            env = BenchEnv(opts, tmp, fake, session)
+            for name, (func, unit) in BENCHMARKS.items():
+                if opts.benchmark and not any(pattern in name for pattern in opts.benchmark):
+                    continue
+                run = await func(env)
+                for _ in range(opts.warmup):
+                    await run()
+                times = []
+                for _ in range(opts.repeat):
+                    start = time.perf_counter()
+                    work = await run()
+                    times.append(time.perf_counter() - start)
+                result = summarize(name, unit, times, work)
+                print("{name:32} median {median:8.4f}s  min {min:8.4f}s  stdev {stdev:7.4f}s  {throughput:12.1f} {unit}/s".format(**result), file=sys.stderr)
+                results.append(result)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Compare results against a baseline.
+
+    Args:
+        results (list): the summaries from ``run_benchmarks``.
+        baseline (dict): a previous ``--output`` document.
+        threshold (float): the allowed slowdown of the median, in percent.
+
+    Returns:
+        list: a message for each benchmark that regressed.
+
+    """
+    baseline_by_name = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = baseline_by_name.get(result["name"])
+        if before is None:
+            continue
+        change = (result["median"] - before["median"]) / before["median"] * 100
+        print("{:32} {:+7.1f}% vs baseline".format(result["name"], change), file=sys.stderr)
+        if change > threshold:
+            regressions.append("{} regressed {:.1f}% ({:.4f}s -> {:.4f}s)".format(result["name"], change, before["median"], result["median"]))
+    return regressions
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the commandline parser."""
+    parser = argparse.ArgumentParser(description="Benchmark scriptworker hot paths.")
+    parser.add_argument("--benchmark", "-b", action="append", help="only run benchmarks whose names contain this; repeatable", default=[])
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per benchmark")
+    parser.add_argument("--size-mb", type=int, default=64, help="file size for the hash, compression and upload benchmarks")
+    parser.add_argument("--num-files", type=int, default=5000, help="files for filepaths_in_dir; pipe_to_log pipes 10 times as many lines")
+    parser.add_argument("--upload-files", type=int, default=16, help="number of files upload_artifacts uploads")
+    parser.add_argument("--builds", type=int, default=4, help="build tasks per layer of the synthetic graph")
+    parser.add_argument("--depth", type=int, default=2, help="build layers in the synthetic graph")
+    parser.add_argument("--artifacts-per-build", type=int, default=4, help="artifacts per build task")
+    parser.add_argument("--artifact-size-mb", type=int, default=4, help="size of each build artifact")
+    parser.add_argument("--optional-artifacts", type=int, default=0, help="missing optional upstream artifacts per build task")
+    parser.add_argument("--wildcard", action="store_true", help="request upstream artifacts with a glob rather than by name")
+    parser.add_argument("--graph-tasks", type=int, default=20000, help="tasks in the task-graph.json the serialization benchmarks parse")
+    parser.add_argument("--latency-ms", type=float, default=0, help="latency the fake Taskcluster adds to each request")
+    parser.add_argument("--output", "-o", help="write the results to this json file")
+    parser.add_argument("--compare", help="compare against a previous --output file")
+    parser.add_argument("--threshold", type=float, default=10, help="allowed median slowdown vs --compare, in percent")
+    parser.add_argument("--verbose", "-v", action="store_true", help="show scriptworker's log output")
+    return parser
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    """Run the benchmarks from the commandline.
+
+    Returns:
+        int: the exit status; 1 if ``--compare`` found a regression.
+
+    """
+    opts = get_parser().parse_args(args)
+    if opts.list:
+        for name, (func, unit) in BENCHMARKS.items():
+            print("{:32} {}".format(name, func.__doc__.splitlines()[0]))
+        return 0
+    logging.basicConfig(level=logging.DEBUG if opts.verbose else logging.WARNING)
+    results = asyncio.run(run_benchmarks(opts))
+    document = {
+        "scriptworker_version": scriptworker.__version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "options": vars(opts),
+        "results": results,
+    }
+    if opts.output:
+        with open(opts.output, "w") as fh:
+            json.dump(document, fh, indent=2, sort_keys=True)
+    if opts.compare:
+        with open(opts.compare) as fh:
+            regressions = compare(results, json.load(fh), opts.threshold)
+        for message in regressions:
+            print(message, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""A configurable stand-in ``task_script`` for the load harness.
+
+The workload flags combine, so a task can e.g. burn CPU, then write an
+artifact, then log heavily::
+
+    dummy_task.py --artifact-dir DIR --cpu-mb 200 --io-mb 50 --log-lines 100000
+
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+MB = 1024 * 1024
+
+
+def main(args=None):
+    """Run the requested workload."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--artifact-dir", required=True, help="the scriptworker artifact_dir")
+    parser.add_argument("--cpu-mb", type=int, default=0, help="sha256 this many MB in memory")
+    parser.add_argument("--io-mb", type=int, default=0, help="write, fsync and re-read a public/build/output.bin artifact of this many MB")
+    parser.add_argument("--log-lines", type=int, default=0, help="write this many lines to stdout")
+    parser.add_argument("--sleep-ms", type=int, default=0, help="sleep this many milliseconds")
+    opts = parser.parse_args(args)
+
+    if opts.cpu_mb:
+        buf = os.urandom(MB)
+        digest = hashlib.sha256()
+        for _ in range(opts.cpu_mb):
+            digest.update(buf)
+        print("cpu: {}".format(digest.hexdigest()))
+    if opts.io_mb:
+        path = os.path.join(opts.artifact_dir, "public", "build", "output.bin")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        buf = os.urandom(MB)
+        with open(path, "wb") as fh:
+            for _ in range(opts.io_mb):
+                fh.write(buf)
+            fh.flush()
+            os.fsync(fh.fileno())
+        with open(path, "rb") as fh:
+            while fh.read(MB):
+                pass
+        print("io: wrote {} MB".format(opts.io_mb))
+    for number in range(opts.log_lines):
+        sys.stdout.write("[task] log line {} of {}: the quick brown fox jumps over the lazy dog\n".format(number, opts.log_lines))
+    if opts.sleep_ms:
+        time.sleep(opts.sleep_ms / 1000)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
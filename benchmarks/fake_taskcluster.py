@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+"""A local stand-in for the Taskcluster queue and artifact storage.
+
+``SyntheticGraph`` builds an hg-push task graph for the ``firefox`` cot
+product: one decision task, ``depth`` layers of ``builds_per_layer`` generic-
+worker build tasks, and ``num_target_tasks`` scriptworker signing tasks whose
+``upstreamArtifacts`` point at the last build layer.  Every upstream task has an
+ed25519-signed ``chain-of-trust.json``, and the decision task publishes the
+``task-graph.json``, ``.taskcluster.yml``, pushlog and ``projects.yml`` that
+``verify_chain_of_trust`` needs, so a full verification runs without touching
+the network.
+
+``FakeTaskcluster`` serves the graph over HTTP on 127.0.0.1, and also accepts
+``claimWork``, ``reclaimTask``, ``createArtifact``, artifact uploads, and the
+``report*`` calls, so the worker loop can run against it.
+
+"""
+
+import asyncio
+import gzip
+import hashlib
+import random
+import time
+from copy import deepcopy
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import unquote
+
+from aiohttp import web
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+from scriptworker.constants import DEFAULT_CONFIG
+from scriptworker.ed25519 import ed25519_private_key_to_string, ed25519_public_key_to_string
+from scriptworker.utils import format_json
+
+REPO = "https://hg.mozilla.org/mozilla-central"
+REVISION = "c5429a8112e41dfabe22da0d7d0876fe05a17e67"
+BASE_REVISION = "bc6ae80f588dde349aa0b1570657c4626ec69062"
+CREATED = "2030-01-01T00:00:00.000Z"
+DEADLINE = "2030-01-02T00:00:00.000Z"
+EXPIRES = "2031-01-01T00:00:00.000Z"
+
+
+def _slugid(rng: random.Random) -> str:
+    # Not a real slugid, but the same length and alphabet.
+    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_"
+    return "".join(rng.choice(alphabet) for _ in range(22))
+
+
+def _base_task(name: str, decision_task_id: str, source_path: str) -> Dict[str, Any]:
+    return {
+        "created": CREATED,
+        "deadline": DEADLINE,
+        "expires": EXPIRES,
+        "dependencies": [],
+        "extra": {},
+        "metadata": {"name": name, "description": name, "owner": "release@mozilla.com", "source": "{}/{}".format(REPO, source_path)},
+        "priority": "lowest",
+        "requires": "all-completed",
+        "retries": 5,
+        "routes": [],
+        "schedulerId": "gecko-level-3",
+        "scopes": [],
+        "tags": {},
+        "taskGroupId": decision_task_id,
+    }
+
+
+# SyntheticGraph {{{1
+class SyntheticGraph(object):
+    """A synthetic, signed, verifiable chain of trust task graph.
+
+    Attributes:
+        decision_task_id (str): the decision taskId.
+        build_layers (list): lists of build taskIds, one list per layer.
+        target_task_ids (list): the signing taskIds to verify or claim.
+        tasks (dict): maps taskId to task definition.
+        artifacts (dict): maps taskId to a dict of artifact name to bytes.
+        public_key (str): the base64 ed25519 public key the cot artifacts
+            are signed with.
+
+    """
+
+    def __init__(
+        self,
+        builds_per_layer: int = 2,
+        depth: int = 1,
+        artifacts_per_build: int = 2,
+        artifact_size: int = 1024 * 1024,
+        num_target_tasks: int = 1,
+        optional_artifacts: int = 0,
+        wildcard: bool = False,
+        seed: int = 0,
+    ) -> None:
+        """Build the graph.
+
+        Args:
+            builds_per_layer (int, optional): the build tasks per layer.
+            depth (int, optional): the number of build layers.  Each build
+                depends on a build in the layer below through its
+                ``chainOfTrust.inputs``.
+            artifacts_per_build (int, optional): the artifacts each build
+                publishes and each signing task downloads.
+            artifact_size (int, optional): the size of each build artifact, in bytes.
+            num_target_tasks (int, optional): the number of signing tasks.
+            optional_artifacts (int, optional): how many extra artifacts per
+                build the signing tasks mark optional.  These are never
+                published, so downloading them fails.
+            wildcard (bool, optional): request build artifacts with an
+                optional ``public/build/*.bin`` glob rather than by name.
+            seed (int, optional): the random seed for ids and contents.
+
+        """
+        rng = random.Random(seed)
+        self._signing_key = Ed25519PrivateKey.generate()
+        self.public_key = ed25519_public_key_to_string(self._signing_key.public_key())
+        self.decision_task_id = _slugid(rng)
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.artifacts: Dict[str, Dict[str, bytes]] = {}
+
+        decision = _base_task("Gecko Decision Task", self.decision_task_id, "raw-file/{}/.taskcluster.yml".format(REVISION))
+        decision.update(
+            {
+                "provisionerId": "gecko-3",
+                "workerType": "decision",
+                "payload": {
+                    "image": "mozillareleases/gecko_decision:4.0.0",
+                    "features": {"taskclusterProxy": True, "chainOfTrust": True},
+                    "env": {"GECKO_BASE_REPOSITORY": REPO, "GECKO_HEAD_REPOSITORY": REPO, "GECKO_HEAD_REV": REVISION},
+                    "command": ["/builds/worker/bin/run-task", "--", "./mach", "taskgraph", "decision"],
+                    "maxRunTime": 1800,
+                },
+            }
+        )
+        decision["extra"] = {"tasks_for": "hg-push"}
+        self.tasks[self.decision_task_id] = decision
+
+        self.build_layers: List[List[str]] = []
+        content = rng.randbytes(artifact_size)
+        for layer in range(depth):
+            layer_ids = []
+            for index in range(builds_per_layer):
+                task_id = _slugid(rng)
+                build = _base_task("build-{}-{}".format(layer, index), self.decision_task_id, "file/{}/taskcluster/ci/build".format(REVISION))
+                build.update(
+                    {
+                        "provisionerId": "gecko-3",
+                        "workerType": "b-linux",
+                        "dependencies": [self.decision_task_id],
+                        "payload": {
+                            "mounts": [],
+                            "osGroups": [],
+                            "env": {"GECKO_HEAD_REPOSITORY": REPO, "GECKO_HEAD_REV": REVISION},
+                            "command": [["./mach", "build"]],
+                            "maxRunTime": 3600,
+                        },
+                    }
+                )
+                if layer:
+                    input_task_id = self.build_layers[-1][index]
+                    build["dependencies"].append(input_task_id)
+                    build["extra"] = {"chainOfTrust": {"inputs": {"build": input_task_id}}}
+                self.tasks[task_id] = build
+                # Vary the first bytes so every artifact has its own hash.
+                self.artifacts[task_id] = {
+                    "public/build/artifact-{}.bin".format(number): task_id.encode() + number.to_bytes(4, "big") + content[len(task_id) + 4 :]
+                    for number in range(artifacts_per_build)
+                }
+                layer_ids.append(task_id)
+            self.build_layers.append(layer_ids)
+
+        self.target_task_ids = []
+        for index in range(num_target_tasks):
+            task_id = _slugid(rng)
+            upstream_artifacts = []
+            for build_task_id in self.build_layers[-1]:
+                if wildcard:
+                    upstream_artifacts.append(
+                        {"taskId": build_task_id, "taskType": "build", "paths": ["public/build/*.bin"], "formats": ["autograph_gpg"], "optional": True}
+                    )
+                else:
+                    paths = sorted(self.artifacts[build_task_id])
+                    upstream_artifacts.append({"taskId": build_task_id, "taskType": "build", "paths": paths, "formats": ["autograph_gpg"]})
+                if optional_artifacts:
+                    missing = ["public/build/missing-{}.bin".format(number) for number in range(optional_artifacts)]
+                    upstream_artifacts.append({"taskId": build_task_id, "taskType": "build", "paths": missing, "formats": [], "optional": True})
+            signing = _base_task("signing-{}".format(index), self.decision_task_id, "file/{}/taskcluster/ci/signing".format(REVISION))
+            signing.update(
+                {
+                    "provisionerId": "scriptworker-k8s",
+                    "workerType": "gecko-3-signing",
+                    "dependencies": sorted(self.build_layers[-1]),
+                    "payload": {"upstreamArtifacts": upstream_artifacts, "maxRunTime": 600},
+                }
+            )
+            self.tasks[task_id] = signing
+            self.target_task_ids.append(task_id)
+
+        task_graph = {task_id: {"task": defn, "label": defn["metadata"]["name"]} for task_id, defn in self.tasks.items() if task_id != self.decision_task_id}
+        self.artifacts[self.decision_task_id] = {
+            "public/task-graph.json": format_json(task_graph).encode(),
+            "public/actions.json": format_json({"actions": [], "variables": {}, "version": 1}).encode(),
+            "public/parameters.yml": b"project: mozilla-central\nlevel: '3'\n",
+        }
+        for task_id in self.artifacts:
+            self._sign(task_id)
+
+        self.taskcluster_yml = format_json({"version": 1, "tasks": [decision]})
+        self.pushlog = format_json(
+            {
+                "lastpushid": 1,
+                "pushes": {"1": {"changesets": [{"node": REVISION, "desc": " ", "parents": [BASE_REVISION]}], "date": 1545243227, "user": "ffxbld"}},
+            }
+        )
+        self.projects_yml = format_json({"mozilla-central": {"repo": REPO, "repo_type": "hg", "access": "scm_level_3", "trust_domain": "gecko"}})
+
+    @property
+    def private_key(self) -> str:
+        """str: the base64 ed25519 private key the cot artifacts are signed with."""
+        return ed25519_private_key_to_string(self._signing_key)
+
+    def _sign(self, task_id: str) -> None:
+        artifacts = self.artifacts[task_id]
+        cot = {
+            "artifacts": {name: {"sha256": hashlib.sha256(contents).hexdigest()} for name, contents in sorted(artifacts.items())},
+            "chainOfTrustVersion": 1,
+            "environment": {},
+            "runId": 0,
+            "task": self.tasks[task_id],
+            "taskId": task_id,
+            "workerGroup": "fake",
+            "workerId": "fake",
+        }
+        body = format_json(cot).encode()
+        artifacts["public/chain-of-trust.json"] = body
+        artifacts["public/chain-of-trust.json.sig"] = self._signing_key.sign(body)
+
+    def claim(self, task_id: str, worker_group: str = "fake", worker_id: str = "fake") -> Dict[str, Any]:
+        """Return a ``claimWork`` task entry for ``task_id``."""
+        return {
+            "status": {"taskId": task_id},
+            "runId": 0,
+            "workerGroup": worker_group,
+            "workerId": worker_id,
+            "task": deepcopy(self.tasks[task_id]),
+            "credentials": {"clientId": "fake", "accessToken": "fake"},
+            "takenUntil": DEADLINE,
+        }
+
+
+# FakeTaskcluster {{{1
+class FakeTaskcluster(object):
+    """Serve a ``SyntheticGraph`` like Taskcluster would.
+
+    Use as an async context manager, or call ``start`` and ``stop``.
+
+    Attributes:
+        graph (SyntheticGraph): the graph being served.
+        latency (float): seconds to sleep before answering each request.
+        root_url (str): the server's root url, once started.
+        pending (list): the taskIds ``claimWork`` hands out, in order.
+        resolutions (dict): maps taskId to the reported resolution.
+        uploaded (dict): maps ``taskId/name`` to the uploaded byte count.
+        kept_uploads (dict): maps ``taskId/name`` to the uploaded, gunzipped
+            contents, for artifact names in ``keep_uploads``.
+        claimed_at (dict): maps taskId to the ``time.monotonic()`` it was claimed at.
+        first_upload_at (dict): maps taskId to the ``time.monotonic()`` of its
+            first ``createArtifact``.
+        resolved_at (dict): maps taskId to the ``time.monotonic()`` it was resolved at.
+        request_count (int): the number of requests served.
+
+    """
+
+    def __init__(self, graph: SyntheticGraph, latency: float = 0.0, keep_uploads: Sequence[str] = ()) -> None:
+        """Initialize FakeTaskcluster.
+
+        Args:
+            graph (SyntheticGraph): the graph to serve.
+            latency (float, optional): seconds to sleep before answering each
+                request.  Defaults to 0.
+            keep_uploads (list, optional): the artifact names whose uploaded
+                contents to keep.  Defaults to ().
+
+        """
+        self.graph = graph
+        self.latency = latency
+        self.keep_uploads = keep_uploads
+        self.root_url = ""
+        self.pending: List[str] = []
+        self.resolutions: Dict[str, str] = {}
+        self.uploaded: Dict[str, int] = {}
+        self.kept_uploads: Dict[str, bytes] = {}
+        self.claimed_at: Dict[str, float] = {}
+        self.first_upload_at: Dict[str, float] = {}
+        self.resolved_at: Dict[str, float] = {}
+        self.request_count = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def __aenter__(self) -> "FakeTaskcluster":
+        """Start the server."""
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        """Stop the server."""
+        await self.stop()
+
+    async def start(self) -> None:
+        """Start serving on a free 127.0.0.1 port."""
+        app = web.Application(middlewares=[self._middleware], client_max_size=1024**3)
+        queue = "/api/queue/v1"
+        app.router.add_get(queue + "/task/{taskId}", self._task)
+        app.router.add_get(queue + "/task/{taskId}/artifacts", self._list_artifacts)
+        app.router.add_get(queue + "/task/{taskId}/artifacts/{name:.*}", self._get_artifact)
+        app.router.add_post(queue + "/claim-work/{taskQueueId:.*}", self._claim_work)
+        app.router.add_post(queue + "/task/{taskId}/runs/{runId}/reclaim", self._reclaim)
+        app.router.add_post(queue + "/task/{taskId}/runs/{runId}/artifacts/{name:.*}", self._create_artifact)
+        app.router.add_post(queue + "/task/{taskId}/runs/{runId}/{resolution:completed|failed|exception}", self._resolve)
+        app.router.add_put("/upload/{taskId}/{name:.*}", self._upload)
+        app.router.add_get("/.taskcluster.yml", self._text(self.graph.taskcluster_yml))
+        app.router.add_get("/json-pushes", self._text(self.graph.pushlog))
+        app.router.add_get("/projects.yml", self._text(self.graph.projects_yml))
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        self.root_url = "http://127.0.0.1:{}".format(port)
+
+    async def stop(self) -> None:
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def config(self, **overrides: Any) -> Dict[str, Any]:
+        """Return the config overrides that point scriptworker at this server.
+
+        Args:
+            **overrides: extra config to apply on top.
+
+        Returns:
+            dict: config keys and values to update a ``DEFAULT_CONFIG`` copy with.
+
+        """
+        public_keys = dict(DEFAULT_CONFIG["ed25519_public_keys"])
+        for worker_impl in ("docker-worker", "generic-worker", "scriptworker"):
+            public_keys[worker_impl] = (self.graph.public_key,)
+        config = {
+            "taskcluster_root_url": self.root_url,
+            "cot_product": "firefox",
+            "verify_chain_of_trust": True,
+            "verify_cot_signature": True,
+            "ed25519_public_keys": public_keys,
+            "project_configuration_url": self.root_url + "/projects.yml",
+            "pushlog_url": self.root_url + "/json-pushes?changeset={revision}&version=2&full=1",
+            "valid_artifact_rules": (
+                {
+                    "schemes": ("http",),
+                    "netlocs": (self.root_url.split("://")[1],),
+                    "path_regexes": (r"^/api/queue/v1/task/(?P<taskId>[^/]+)(/runs/\d+)?/artifacts/(?P<filepath>.*)$",),
+                },
+            ),
+        }
+        config.update(overrides)
+        return config
+
+    def taskcluster_yml_url(self, link: Any) -> str:
+        """Replace ``scriptworker.cot.verify.build_taskcluster_yml_url``.
+
+        The real function only knows about hg.mozilla.org and github.com.
+        """
+        return self.root_url + "/.taskcluster.yml"
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler: Any) -> web.StreamResponse:
+        self.request_count += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    def _text(self, text: str) -> Any:
+        async def handler(request: web.Request) -> web.Response:
+            return web.Response(text=text)
+
+        return handler
+
+    async def _task(self, request: web.Request) -> web.Response:
+        task = self.graph.tasks.get(request.match_info["taskId"])
+        if task is None:
+            return web.json_response({"code": "ResourceNotFound", "message": "no such task"}, status=404)
+        return web.json_response(task)
+
+    async def _list_artifacts(self, request: web.Request) -> web.Response:
+        artifacts = self.graph.artifacts.get(request.match_info["taskId"], {})
+        listing = [{"name": name, "storageType": "s3", "contentType": "application/octet-stream", "expires": EXPIRES} for name in sorted(artifacts)]
+        return web.json_response({"artifacts": listing})
+
+    async def _get_artifact(self, request: web.Request) -> web.Response:
+        artifacts = self.graph.artifacts.get(request.match_info["taskId"], {})
+        contents = artifacts.get(unquote(request.match_info["name"]))
+        if contents is None:
+            return web.Response(status=404, text="no such artifact")
+        return web.Response(body=contents, content_type="application/octet-stream")
+
+    async def _claim_work(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        tasks = []
+        while self.pending and len(tasks) < payload.get("tasks", 1):
+            task_id = self.pending.pop(0)
+            self.claimed_at[task_id] = time.monotonic()
+            tasks.append(self.graph.claim(task_id, payload["workerGroup"], payload["workerId"]))
+        return web.json_response({"tasks": tasks})
+
+    async def _reclaim(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": {"taskId": request.match_info["taskId"]}, "runId": 0, "credentials": {}, "takenUntil": DEADLINE})
+
+    async def _create_artifact(self, request: web.Request) -> web.Response:
+        task_id = request.match_info["taskId"]
+        name = request.match_info["name"]
+        self.first_upload_at.setdefault(task_id, time.monotonic())
+        payload = await request.json()
+        return web.json_response(
+            {"storageType": payload["storageType"], "putUrl": "{}/upload/{}/{}".format(self.root_url, task_id, name), "expires": EXPIRES, "contentType": "x"}
+        )
+
+    async def _upload(self, request: web.Request) -> web.Response:
+        key = "{}/{}".format(request.match_info["taskId"], request.match_info["name"])
+        if request.match_info["name"] in self.keep_uploads:
+            body = await request.read()
+            self.uploaded[key] = len(body)
+            # aiohttp may or may not have decoded a gzip Content-Encoding already.
+            self.kept_uploads[key] = gzip.decompress(body) if body[:2] == b"\x1f\x8b" else body
+        else:
+            size = 0
+            async for chunk in request.content.iter_chunked(1024 * 1024):
+                size += len(chunk)
+            self.uploaded[key] = size
+        return web.Response(status=200)
+
+    async def _resolve(self, request: web.Request) -> web.Response:
+        task_id = request.match_info["taskId"]
+        self.resolutions[task_id] = request.match_info["resolution"]
+        self.resolved_at[task_id] = time.monotonic()
+        return web.json_response({"status": {"taskId": task_id, "state": request.match_info["resolution"]}, "time": time.time()})
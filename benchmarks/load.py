@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+"""End to end load test of the scriptworker loop.
+
+This runs the real ``scriptworker.worker.main`` in a subprocess, pointed at a
+``FakeTaskcluster`` on 127.0.0.1 that hands out ``--tasks`` signing tasks.  Each
+task goes through chain of trust verification (with signatures), runs
+``benchmarks/dummy_task.py`` with the requested CPU, I/O, logging and sleep
+workload, generates and signs its own chain of trust artifact, and uploads its
+artifacts to the fake.
+
+When every task is resolved, the worker gets a SIGTERM, and the harness
+reports:
+
+* tasks/hour, between the first claim and the last resolution.
+* p50/p90/p99/max latency per stage, from each task's uploaded
+  ``public/logs/timings.json``, plus ``upload_and_complete`` (first
+  ``createArtifact`` to resolution) and ``end_to_end`` (claim to resolution)
+  as seen by the fake.
+* the worker's peak RSS and peak number of open file descriptors, sampled
+  from ``/proc`` (Linux only).
+
+Compare two runs of ``--output`` to check worker loop changes, e.g.::
+
+    python -m benchmarks.load --tasks 50 --cpu-mb 100 --output before.json
+
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+from unittest import mock
+
+import scriptworker
+from benchmarks.fake_taskcluster import FakeTaskcluster, SyntheticGraph
+from scriptworker.config import get_unfrozen_copy
+
+MB = 1024 * 1024
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMINGS_ARTIFACT = "public/logs/timings.json"
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """Return the nearest-rank ``percent`` percentile of ``values``."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize_stages(fake: FakeTaskcluster) -> Dict[str, Dict[str, float]]:
+    """Return latency percentiles per stage across all resolved tasks.
+
+    Args:
+        fake (FakeTaskcluster): the fake, after the run.
+
+    Returns:
+        dict: maps stage name to a dict of count, p50, p90, p99 and max seconds.
+
+    """
+    durations: Dict[str, List[float]] = {}
+    for task_id, resolved_at in fake.resolved_at.items():
+        timings = fake.kept_uploads.get("{}/{}".format(task_id, TIMINGS_ARTIFACT))
+        if timings:
+            for stage, seconds in json.loads(timings)["stages"].items():
+                durations.setdefault(stage, []).append(seconds)
+        if task_id in fake.first_upload_at:
+            durations.setdefault("upload_and_complete", []).append(resolved_at - fake.first_upload_at[task_id])
+        durations.setdefault("end_to_end", []).append(resolved_at - fake.claimed_at[task_id])
+    return {
+        stage: {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+            "max": max(values),
+        }
+        for stage, values in sorted(durations.items())
+    }
+
+
+# ProcessSampler {{{1
+class ProcessSampler(object):
+    """Track the peak RSS and open file descriptors of a process via ``/proc``.
+
+    Attributes:
+        pid (int): the process to sample.
+        peak_rss (int): the peak resident set size in bytes, or 0 if unknown.
+        peak_fds (int): the peak number of open file descriptors, or 0 if unknown.
+
+    """
+
+    def __init__(self, pid: int) -> None:
+        """Initialize ProcessSampler."""
+        self.pid = pid
+        self.peak_rss = 0
+        self.peak_fds = 0
+
+    def sample(self) -> None:
+        """Read the current values from ``/proc``, if it's there."""
+        try:
+            with open("/proc/{}/status".format(self.pid)) as fh:
+                for line in fh:
+                    # VmHWM is the kernel's own peak RSS, so samples can't miss a spike.
+                    if line.startswith("VmHWM:"):
+                        self.peak_rss = max(self.peak_rss, int(line.split()[1]) * 1024)
+            self.peak_fds = max(self.peak_fds, len(os.listdir("/proc/{}/fd".format(self.pid))))
+        except OSError:
+            pass
+
+    async def run(self, interval: float = 0.1) -> None:
+        """Sample every ``interval`` seconds until cancelled."""
+        while True:
+            self.sample()
+            await asyncio.sleep(interval)
+
+
+# worker config {{{1
+def write_worker_config(opts: argparse.Namespace, fake: FakeTaskcluster, tmp: str) -> str:
+    """Write the worker's config file.
+
+    Args:
+        opts (argparse.Namespace): the commandline options.
+        fake (FakeTaskcluster): the running fake.
+        tmp (str): the directory to put the config and worker dirs in.
+
+    Returns:
+        str: the config path.
+
+    """
+    key_path = os.path.join(tmp, "ed25519_private_key")
+    with open(key_path, "w") as fh:
+        fh.write(fake.graph.private_key)
+    artifact_dir = os.path.join(tmp, "artifacts")
+    task_script = [sys.executable, os.path.join(REPO_ROOT, "benchmarks", "dummy_task.py"), "--artifact-dir", artifact_dir]
+    for flag in ("cpu_mb", "io_mb", "log_lines", "sleep_ms"):
+        task_script.extend(["--{}".format(flag.replace("_", "-")), str(getattr(opts, flag))])
+    config = get_unfrozen_copy(
+        fake.config(
+            provisioner_id="scriptworker-k8s",
+            worker_type="gecko-3-signing",
+            worker_group="load",
+            worker_id="load-1",
+            credentials={"clientId": "load", "accessToken": "load"},
+            work_dir=os.path.join(tmp, "work"),
+            log_dir=os.path.join(tmp, "log"),
+            artifact_dir=artifact_dir,
+            task_log_dir=os.path.join(artifact_dir, "public", "logs"),
+            task_script=task_script,
+            poll_interval=opts.poll_interval,
+            cot_job_type="signing",
+            sign_chain_of_trust=True,
+            ed25519_private_key_path=key_path,
+            verbose=opts.verbose,
+        )
+    )
+    path = os.path.join(tmp, "scriptworker.json")
+    # json is valid yaml, and doesn't need tuples converted.
+    with open(path, "w") as fh:
+        json.dump(config, fh, indent=2)
+    return path
+
+
+def run_worker(config_path: str) -> None:
+    """Run ``scriptworker.worker.main`` against the fake.
+
+    This is the load harness' worker subprocess.  The real
+    ``build_taskcluster_yml_url`` only knows about hg.mozilla.org and
+    github.com, so point it at the fake first.
+    """
+    from scriptworker import worker
+
+    def taskcluster_yml_url(link: Any) -> str:
+        return link.context.config["taskcluster_root_url"] + "/.taskcluster.yml"
+
+    with mock.patch("scriptworker.cot.verify.build_taskcluster_yml_url", taskcluster_yml_url):
+        sys.argv = [sys.argv[0], config_path]
+        worker.main()
+
+
+# run_load {{{1
+async def run_load(opts: argparse.Namespace) -> Dict[str, Any]:
+    """Run the worker until all tasks are resolved, and measure it.
+
+    Args:
+        opts (argparse.Namespace): the commandline options.
+
+    Returns:
+        dict: the results.
+
+    Raises:
+        TimeoutError: if the tasks aren't all resolved within ``--timeout`` seconds.
+
+    """
+    graph = SyntheticGraph(
+        builds_per_layer=opts.builds,
+        depth=opts.depth,
+        artifacts_per_build=opts.artifacts_per_build,
+        artifact_size=opts.artifact_size_mb * MB,
+        num_target_tasks=opts.tasks,
+    )
+    tmp = tempfile.mkdtemp(prefix="scriptworker-load-")
+    try:
+        async with FakeTaskcluster(graph, latency=opts.latency_ms / 1000, keep_uploads=(TIMINGS_ARTIFACT,)) as fake:
+            fake.pending = list(graph.target_task_ids)
+            config_path = write_worker_config(opts, fake, tmp)
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+            worker_log_path = os.path.join(tmp, "worker-output.log")
+            start = time.monotonic()
+            with open(worker_log_path, "wb") as worker_log:
+                proc = await asyncio.create_subprocess_exec(
+                    sys.executable, "-m", "benchmarks.load", "--worker-config", config_path, stdout=worker_log, stderr=worker_log, env=env
+                )
+            sampler = ProcessSampler(proc.pid)
+            sampler_fut = asyncio.ensure_future(sampler.run())
+            try:
+                while len(fake.resolved_at) < opts.tasks:
+                    if proc.returncode is not None:
+                        raise RuntimeError("The worker exited with {}".format(proc.returncode))
+                    if time.monotonic() - start > opts.timeout:
+                        raise TimeoutError("Only {} of {} tasks resolved after {} seconds".format(len(fake.resolved_at), opts.tasks, opts.timeout))
+                    await asyncio.sleep(0.1)
+                sampler.sample()
+            except Exception:
+                with open(worker_log_path) as fh:
+                    print(fh.read()[-20000:], file=sys.stderr)
+                raise
+            finally:
+                sampler_fut.cancel()
+                if proc.returncode is None:
+                    proc.send_signal(signal.SIGTERM)
+                    try:
+                        await asyncio.wait_for(proc.wait(), 60)
+                    except asyncio.TimeoutError:
+                        proc.kill()
+                        await proc.wait()
+            if opts.verbose:
+                with open(worker_log_path) as fh:
+                    print(fh.read(), file=sys.stderr)
+            peak_rss = sampler.peak_rss
+            if not peak_rss:
+                # Without /proc, fall back to the largest waited-for descendant.
+                peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+            wall = max(fake.resolved_at.values()) - min(fake.claimed_at.values())
+            return {
+                "tasks": opts.tasks,
+                "resolutions": dict(Counter(fake.resolutions.values())),
+                "wall_seconds": wall,
+                "tasks_per_hour": opts.tasks / wall * 3600 if wall else 0.0,
+                "stages": summarize_stages(fake),
+                "peak_rss_mb": peak_rss / MB,
+                "peak_open_fds": sampler.peak_fds,
+                "requests": fake.request_count,
+                "uploaded_mb": sum(fake.uploaded.values()) / MB,
+            }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    """Print a human readable summary of ``results`` to stderr."""
+    print(
+        "{tasks} tasks {resolutions} in {wall_seconds:.1f}s: {tasks_per_hour:.0f} tasks/hour, "
+        "peak RSS {peak_rss_mb:.1f} MB, peak fds {peak_open_fds}, {requests} requests".format(**results),
+        file=sys.stderr,
+    )
+    print("{:32} {:>6} {:>9} {:>9} {:>9} {:>9}".format("stage", "count", "p50", "p90", "p99", "max"), file=sys.stderr)
+    for stage, stats in results["stages"].items():
+        print("{:32} {count:6} {p50:9.4f} {p90:9.4f} {p99:9.4f} {max:9.4f}".format(stage, **stats), file=sys.stderr)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the commandline parser."""
+    parser = argparse.ArgumentParser(description="Load test the scriptworker loop against a fake Taskcluster.")
+    parser.add_argument("--tasks", type=int, default=20, help="the number of tasks to run")
+    parser.add_argument("--cpu-mb", type=int, default=0, help="MB each task sha256s in memory")
+    parser.add_argument("--io-mb", type=int, default=0, help="MB each task writes, fsyncs, re-reads and uploads as an artifact")
+    parser.add_argument("--log-lines", type=int, default=0, help="lines each task writes to its log")
+    parser.add_argument("--sleep-ms", type=int, default=0, help="milliseconds each task sleeps")
+    parser.add_argument("--builds", type=int, default=2, help="build tasks per layer of the synthetic graph")
+    parser.add_argument("--depth", type=int, default=1, help="build layers in the synthetic graph")
+    parser.add_argument("--artifacts-per-build", type=int, default=2, help="artifacts each task downloads per build task")
+    parser.add_argument("--artifact-size-mb", type=int, default=1, help="size of each build artifact")
+    parser.add_argument("--latency-ms", type=float, default=0, help="latency the fake Taskcluster adds to each request")
+    parser.add_argument("--poll-interval", type=int, default=1, help="the worker's poll_interval, in seconds")
+    parser.add_argument("--timeout", type=float, default=3600, help="give up after this many seconds")
+    parser.add_argument("--output", "-o", help="write the results to this json file")
+    parser.add_argument("--verbose", "-v", action="store_true", help="verbose worker logging, printed at the end")
+    parser.add_argument("--worker-config", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    """Run the load test from the commandline.
+
+    Returns:
+        int: the exit status.
+
+    """
+    opts = get_parser().parse_args(args)
+    if opts.worker_config:
+        run_worker(opts.worker_config)
+        return 0
+    results = asyncio.run(run_load(opts))
+    print_results(results)
+    if opts.output:
+        document = {"scriptworker_version": scriptworker.__version__, "options": vars(opts), "results": results}
+        with open(opts.output, "w") as fh:
+            json.dump(document, fh, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,11 +6,11 @@ in S3.
 """
 
 import asyncio
-import fnmatch
 import gzip
 import logging
 import mimetypes
 import os
+import time
 from pathlib import Path
 
 import aiohttp
@@ -18,9 +18,13 @@ import arrow
 import async_timeout
 from taskcluster.exceptions import TaskclusterFailure
 
+from scriptworker.circuit import breakers, get_queue_url
 from scriptworker.client import validate_artifact_url
 from scriptworker.exceptions import DownloadError, ScriptWorkerRetryException, ScriptWorkerTaskException
+from scriptworker.metrics import registry
 from scriptworker.task import get_decision_task_id, get_run_id, get_task_id
+from scriptworker.trace import span
+from scriptworker.upstream import compile_artifact_pattern
 from scriptworker.utils import add_enumerable_item_to_dict, download_file, get_loggable_url, raise_future_exceptions, retry_async, semaphore_wrapper
 
 log = logging.getLogger(__name__)
@@ -52,6 +56,9 @@ async def upload_artifacts(context, files):
     the same.  So if we want the files in ``public/...``, create an
     ``artifact_dir/public`` and put the files in there.
 
+    If ``context.artifact_manifest`` has been scanned, only the files that
+    compression changed get stat'ed again, and the sizes come from the manifest.
+
     Args:
         context (scriptworker.context.Context): the scriptworker context.
         files (list of str): files that should be uploaded as artifacts
@@ -60,12 +67,18 @@ async def upload_artifacts(context, files):
         Exception: any exceptions the tasks raise.
 
     """
+    manifest = context.artifact_manifest
 
     def to_upload_future(target_path):
         path = os.path.join(context.config["artifact_dir"], target_path)
         content_type, content_encoding = compress_artifact_if_supported(path)
+        kwargs = {}
+        if manifest is not None and manifest.path == context.config["artifact_dir"]:
+            entry = manifest.refresh(target_path)
+            if entry is not None:
+                kwargs["size"] = entry.size
         return asyncio.ensure_future(
-            retry_create_artifact(context, path, target_path=target_path, content_type=content_type, content_encoding=content_encoding)
+            retry_create_artifact(context, path, target_path=target_path, content_type=content_type, content_encoding=content_encoding, **kwargs)
         )
 
     tasks = list(map(to_upload_future, files))
@@ -137,7 +150,7 @@ async def retry_create_artifact(*args, **kwargs):
 
 
 # create_artifact {{{1
-async def create_artifact(context, path, target_path, content_type, content_encoding, storage_type="s3", expires=None):
+async def create_artifact(context, path, target_path, content_type, content_encoding, storage_type="s3", expires=None, size=None):
     """Create an artifact and upload it.
 
     This should support s3 and azure out of the box; we'll need some tweaking
@@ -155,6 +168,8 @@ async def create_artifact(context, path, target_path, content_type, content_enco
             Defaults to 's3'
         expires (str, optional): datestring of when the artifact expires.
             Defaults to None.
+        size (int, optional): the size of the file, if already known.
+            Defaults to None.
 
     Raises:
         ScriptWorkerRetryException: on failure.
@@ -163,12 +178,16 @@ async def create_artifact(context, path, target_path, content_type, content_enco
     payload = {"storageType": storage_type, "expires": expires or get_expiration_arrow(context).isoformat(), "contentType": content_type}
     args = [get_task_id(context.claim_task), get_run_id(context.claim_task), target_path, payload]
 
-    tc_response = await context.temp_queue.createArtifact(*args)
+    async with breakers.guard(context.config["taskcluster_root_url"]):
+        tc_response = await context.temp_queue.createArtifact(*args)
     skip_auto_headers = [aiohttp.hdrs.CONTENT_TYPE]
     loggable_url = get_loggable_url(tc_response["putUrl"])
     log.info("uploading {path} to {url}...".format(path=path, url=loggable_url))
-    with open(path, "rb") as fh:
-        async with async_timeout.timeout(context.config["artifact_upload_timeout"]):
+    start = time.monotonic()
+    if size is None:
+        size = os.path.getsize(path)
+    with span("create_artifact", taskId=args[0], artifact=target_path, url=loggable_url, bytes=size), open(path, "rb") as fh:
+        async with breakers.guard(tc_response["putUrl"]), async_timeout.timeout(context.config["artifact_upload_timeout"]):
             async with context.session.put(
                 tc_response["putUrl"],
                 data=fh,
@@ -180,7 +199,9 @@ async def create_artifact(context, path, target_path, content_type, content_enco
                 response_text = await resp.text()
                 log.info(response_text)
                 if resp.status not in (200, 204):
-                    raise ScriptWorkerRetryException("Bad status {}".format(resp.status))
+                    raise ScriptWorkerRetryException("Bad status {}".format(resp.status), status=resp.status)
+    registry.inc("upload_bytes_total", size)
+    registry.observe("upload_duration_seconds", time.monotonic() - start)
 
 
 def _craft_artifact_put_headers(content_type, encoding=None):
@@ -230,7 +251,8 @@ async def list_latest_artifacts(queue, task_id):
     def pagination_handler(response):
         artifacts.extend(response["artifacts"])
 
-    await queue.listLatestArtifacts(task_id, paginationHandler=pagination_handler)
+    async with breakers.guard(get_queue_url(queue)):
+        await queue.listLatestArtifacts(task_id, paginationHandler=pagination_handler)
     return artifacts
 
 
@@ -329,14 +351,11 @@ def get_upstream_artifacts_full_paths_per_task_id(context):
         scriptworker.exceptions.ScriptWorkerTaskException: when an artifact doesn't exist.
 
     """
-    upstream_artifacts = context.task["payload"]["upstreamArtifacts"]
-    task_ids_and_relative_paths = [(artifact_definition["taskId"], artifact_definition["paths"]) for artifact_definition in upstream_artifacts]
-
-    optional_artifacts_per_task_id = get_optional_artifacts_per_task_id(upstream_artifacts)
+    upstream_artifacts = context.upstream_artifacts
 
     upstream_artifacts_full_paths_per_task_id = {}
     failed_paths_per_task_id = {}
-    for task_id, paths in task_ids_and_relative_paths:
+    for task_id, _, paths, _ in upstream_artifacts.definitions:
         for path in paths:
             try:
                 if "*" in path:
@@ -346,7 +365,7 @@ def get_upstream_artifacts_full_paths_per_task_id(context):
                     path_to_add = get_and_check_single_upstream_artifact_full_path(context, task_id, path)
                     add_enumerable_item_to_dict(dict_=upstream_artifacts_full_paths_per_task_id, key=task_id, item=path_to_add)
             except ScriptWorkerTaskException:
-                if path in optional_artifacts_per_task_id.get(task_id, []):
+                if upstream_artifacts.is_optional(task_id, path):
                     log.warning('Optional artifact "{}" of task "{}" not found'.format(path, task_id))
                     add_enumerable_item_to_dict(dict_=failed_paths_per_task_id, key=task_id, item=path)
                 else:
@@ -447,6 +466,6 @@ def get_artifacts_matching_glob(context, task_id, pattern):
     for root, _, files in os.walk(parent_dir):
         for f in files:
             relpath = os.path.relpath(os.path.join(root, f), parent_dir)
-            if fnmatch.fnmatch(relpath, pattern):
+            if compile_artifact_pattern(pattern).match(relpath):
                 matching.append(os.path.join(root, f))
     return matching
@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+"""Per-host circuit breakers and retry budgets.
+
+Each call to ``retry_async`` retries on its own, so during a brownout of S3 or
+the queue every concurrent download and upload keeps hitting the failing host
+for all of its attempts.  To avoid making outages worse, the worker keeps one
+``HostCircuit`` per host, shared by every caller:
+
+* the circuit opens after ``failure_threshold`` consecutive host failures
+  (connection errors, timeouts, 5xx).  While it is open, ``guard`` raises
+  ``CircuitOpenError`` right away, or, with ``fail_fast=False``, waits.
+* ``reset_seconds`` after opening, the next caller becomes the recovery
+  probe.  Everyone else waits for the probe: if it succeeds the circuit
+  closes, if it fails it opens again.
+* retries of a failed host call take a token from the host's retry budget,
+  which refills at ``retries_per_minute``.  Once it is empty, ``retry_async``
+  gives up instead of retrying.
+
+``request``, ``download_file``, ``create_artifact`` and the queue calls run
+their network calls inside ``breakers.guard(url)``; ``retry_async`` charges
+its retries to whichever host failed.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+    CLOSED (str): the state of a healthy circuit.
+    OPEN (str): the state of a circuit whose calls are rejected.
+    HALF_OPEN (str): the state of a circuit whose recovery probe is running.
+    breakers (CircuitBreakers): the process-wide circuit breakers.
+
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+from taskcluster.exceptions import TaskclusterConnectionError, TaskclusterRestFailure
+
+from scriptworker.constants import DEFAULT_CONFIG
+from scriptworker.exceptions import BaseDownloadError, CircuitOpenError, ScriptWorkerRetryException
+from scriptworker.metrics import registry
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# The host of the last guarded call that failed in the current task.
+_failed_host: ContextVar[Optional[str]] = ContextVar("scriptworker_failed_host", default=None)
+
+
+def get_host(url: Optional[str]) -> Optional[str]:
+    """Return the host of ``url``, or ``url`` itself if it's already a host.
+
+    Args:
+        url (str): a url or a host, e.g. ``https://queue.example.com/v1`` or
+            ``queue.example.com``.  May be None.
+
+    Returns:
+        str: the host, or None if there isn't one.
+
+    """
+    if not url or not isinstance(url, str):
+        return None
+    if "://" not in url:
+        return url
+    return urlparse(url).netloc or None
+
+
+def is_host_failure(exc: BaseException) -> bool:
+    """Whether ``exc`` means the host is unhealthy, rather than the request bad.
+
+    Args:
+        exc (BaseException): the exception from a network call.
+
+    Returns:
+        bool: True for connection errors, timeouts and 5xx responses.
+
+    """
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if isinstance(exc, TaskclusterRestFailure):
+        return exc.status_code is None or exc.status_code >= 500
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500
+    if isinstance(exc, (ScriptWorkerRetryException, BaseDownloadError)):
+        # e.g. a truncated or changed artifact isn't the host's fault.
+        return exc.status is not None and exc.status >= 500
+    return isinstance(exc, (TaskclusterConnectionError, aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def get_queue_url(queue: Any) -> Optional[str]:
+    """Return the root url of a taskcluster client, to guard its calls with.
+
+    Args:
+        queue (taskcluster.aio.Queue): the taskcluster client.
+
+    Returns:
+        str: the root url, or None if it isn't known.
+
+    """
+    options = getattr(queue, "options", None)
+    if not isinstance(options, dict):
+        return None
+    return options.get("rootUrl")
+
+
+def take_failed_host() -> Optional[str]:
+    """Return and forget the host of the last failed guarded call in this task.
+
+    Returns:
+        str: the host, or None if no guarded call failed since the last call.
+
+    """
+    host = _failed_host.get()
+    _failed_host.set(None)
+    return host
+
+
+# RetryBudget {{{1
+class RetryBudget(object):
+    """A token bucket that limits the retries against one host.
+
+    Attributes:
+        retries_per_minute (int): the refill rate, which is also the bucket
+            size.  0 means unlimited retries.
+
+    """
+
+    def __init__(self, retries_per_minute: int) -> None:
+        """Initialize RetryBudget.
+
+        Args:
+            retries_per_minute (int): the refill rate and bucket size.  0 means
+                unlimited retries.
+
+        """
+        self.retries_per_minute = retries_per_minute
+        self._tokens = float(retries_per_minute)
+        self._updated = time.monotonic()
+
+    @property
+    def tokens(self) -> float:
+        """float: the retries currently available."""
+        now = time.monotonic()
+        self._tokens = min(float(self.retries_per_minute), self._tokens + (now - self._updated) * self.retries_per_minute / 60)
+        self._updated = now
+        return self._tokens
+
+    def withdraw(self) -> bool:
+        """Take a token for a retry, if there is one.
+
+        Returns:
+            bool: True if the retry may go ahead.
+
+        """
+        if not self.retries_per_minute:
+            return True
+        if self.tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+# HostCircuit {{{1
+class HostCircuit(object):
+    """The circuit breaker and retry budget for one host.
+
+    Attributes:
+        host (str): the host.
+        failure_threshold (int): the consecutive failures that open the
+            circuit.  0 never opens it.
+        reset_seconds (int): how long the circuit stays open before a
+            recovery probe is let through.
+        budget (RetryBudget): the host's retry budget.
+        state (str): one of ``CLOSED``, ``OPEN`` or ``HALF_OPEN``.
+        consecutive_failures (int): the host failures since the last success.
+
+    """
+
+    def __init__(self, host: str, failure_threshold: int, reset_seconds: int, retries_per_minute: int) -> None:
+        """Initialize HostCircuit.
+
+        Args:
+            host (str): the host.
+            failure_threshold (int): the consecutive failures that open the
+                circuit.  0 never opens it.
+            reset_seconds (int): how long the circuit stays open before a
+                recovery probe is let through.
+            retries_per_minute (int): the retry budget refill rate.  0 means
+                unlimited retries.
+
+        """
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.budget = RetryBudget(retries_per_minute)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_done = asyncio.Event()
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        registry.set("circuit_state", _STATE_VALUES[state], host=self.host)
+
+    def _reject(self) -> None:
+        registry.inc("circuit_rejections_total", host=self.host)
+        raise CircuitOpenError("Circuit for {} is open after {} failures".format(self.host, self.consecutive_failures))
+
+    async def acquire(self, fail_fast: bool = True) -> bool:
+        """Wait until a call to the host may go ahead.
+
+        Args:
+            fail_fast (bool, optional): if True, raise instead of waiting
+                for the circuit to close.  Defaults to True.
+
+        Returns:
+            bool: True if the caller is the recovery probe, and must report
+                its outcome with ``record_success``, ``record_failure`` or
+                ``release``.
+
+        Raises:
+            CircuitOpenError: if ``fail_fast`` and the circuit is open, or the
+                recovery probe failed.
+
+        """
+        while True:
+            if self.state == CLOSED:
+                return False
+            if self.state == OPEN:
+                remaining = self._opened_at + self.reset_seconds - time.monotonic()
+                if remaining > 0:
+                    if fail_fast:
+                        self._reject()
+                    await asyncio.sleep(remaining)
+                    continue
+                log.info("Circuit for {} is half-open; probing".format(self.host))
+                self._probe_done = asyncio.Event()
+                self._set_state(HALF_OPEN)
+                return True
+            probe_done = self._probe_done
+            try:
+                await asyncio.wait_for(probe_done.wait(), self.reset_seconds or None)
+            except asyncio.TimeoutError:
+                if fail_fast:
+                    self._reject()
+                continue
+            if self.state != CLOSED and fail_fast:
+                self._reject()
+
+    def record_success(self) -> None:
+        """Record that the host answered."""
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            log.info("Circuit for {} closed".format(self.host))
+            self._set_state(CLOSED)
+            self._probe_done.set()
+
+    def record_failure(self) -> None:
+        """Record a host failure, opening the circuit if needed."""
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failure_threshold and self.consecutive_failures >= self.failure_threshold):
+            log.warning("Circuit for {} opened after {} consecutive failures".format(self.host, self.consecutive_failures))
+            registry.inc("circuit_opened_total", host=self.host)
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+            self._probe_done.set()
+
+    def release(self, is_probe: bool) -> None:
+        """Give up a call without an outcome, e.g. when it was cancelled.
+
+        If the call was the recovery probe, the next caller probes instead.
+
+        Args:
+            is_probe (bool): the value ``acquire`` returned.
+
+        """
+        if is_probe and self.state == HALF_OPEN:
+            self._opened_at = time.monotonic() - self.reset_seconds
+            self._set_state(OPEN)
+            self._probe_done.set()
+
+    @asynccontextmanager
+    async def guard(self, fail_fast: bool = True) -> AsyncIterator[None]:
+        """Run a call to the host under the circuit breaker.
+
+        Args:
+            fail_fast (bool, optional): if True, raise instead of waiting
+                for the circuit to close.  Defaults to True.
+
+        Raises:
+            CircuitOpenError: if the call isn't let through.
+
+        """
+        is_probe = await self.acquire(fail_fast=fail_fast)
+        try:
+            yield
+        except Exception as exc:
+            if isinstance(exc, CircuitOpenError):
+                self.release(is_probe)
+            elif is_host_failure(exc):
+                self.record_failure()
+                _failed_host.set(self.host)
+            else:
+                self.record_success()
+            raise
+        except BaseException:
+            self.release(is_probe)
+            raise
+        else:
+            self.record_success()
+
+
+# CircuitBreakers {{{1
+class CircuitBreakers(object):
+    """The ``HostCircuit`` of every host the worker talks to.
+
+    Attributes:
+        failure_threshold (int): the consecutive failures that open a circuit.
+        reset_seconds (int): how long a circuit stays open before probing.
+        retries_per_minute (int): the retry budget of each host.
+
+    """
+
+    def __init__(self) -> None:
+        """Initialize CircuitBreakers with the default config."""
+        self._circuits: Dict[str, HostCircuit] = {}
+        self.configure(DEFAULT_CONFIG["circuit_breaker_failures"], DEFAULT_CONFIG["circuit_breaker_reset_seconds"], DEFAULT_CONFIG["retry_budget_per_minute"])
+
+    def configure(self, failure_threshold: int, reset_seconds: int, retries_per_minute: int) -> None:
+        """Set the circuit breaker settings, and forget all circuits.
+
+        Args:
+            failure_threshold (int): the consecutive failures that open a
+                circuit.  0 disables the circuit breakers.
+            reset_seconds (int): how long a circuit stays open before probing.
+            retries_per_minute (int): the retry budget of each host.  0
+                disables the retry budgets.
+
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.retries_per_minute = retries_per_minute
+        self._circuits = {}
+
+    def get(self, url: str) -> HostCircuit:
+        """Return the circuit for the host of ``url``, creating it if needed.
+
+        Args:
+            url (str): a url or a host.
+
+        Returns:
+            HostCircuit: the circuit.
+
+        """
+        host = get_host(url) or url
+        if host not in self._circuits:
+            self._circuits[host] = HostCircuit(host, self.failure_threshold, self.reset_seconds, self.retries_per_minute)
+        return self._circuits[host]
+
+    @asynccontextmanager
+    async def guard(self, url: Optional[str], fail_fast: bool = True) -> AsyncIterator[None]:
+        """Run a call to the host of ``url`` under its circuit breaker.
+
+        Args:
+            url (str): the url or host being called.  If None, don't guard.
+            fail_fast (bool, optional): if True, raise instead of waiting
+                for the circuit to close.  Defaults to True.
+
+        Raises:
+            CircuitOpenError: if the call isn't let through.
+
+        """
+        host = get_host(url)
+        if host is None:
+            yield
+            return
+        async with self.get(host).guard(fail_fast=fail_fast):
+            yield
+
+    def allow_retry(self, host: Optional[str]) -> bool:
+        """Take a token from the retry budget of ``host``.
+
+        Args:
+            host (str): the host that failed.  If None, always allow the retry.
+
+        Returns:
+            bool: True if the retry may go ahead.
+
+        """
+        if host is None:
+            return True
+        if self.get(host).budget.withdraw():
+            return True
+        registry.inc("retry_budget_exhausted_total", host=host)
+        return False
+
+
+breakers = CircuitBreakers()
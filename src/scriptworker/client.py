@@ -15,14 +15,13 @@ import logging
 import os
 import sys
 from asyncio import AbstractEventLoop
-from typing import Any, Awaitable, Callable, Dict, List, Match, NoReturn, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Match, NoReturn, Optional, Tuple, Union
 from urllib.parse import unquote
 
-import jsonschema
-
 from scriptworker.constants import STATUSES
 from scriptworker.context import Context
 from scriptworker.exceptions import ScriptWorkerException, ScriptWorkerTaskException, TaskVerificationError
+from scriptworker.schema import CompiledSchema, schemas
 from scriptworker.utils import load_json_or_yaml, match_url_regex, scriptworker_session
 
 log = logging.getLogger(__name__)
@@ -47,31 +46,36 @@ def get_task(config: Dict[str, Any]) -> Dict[str, Any]:
     return contents
 
 
-def validate_json_schema(data: Dict[str, Any], schema: Dict[str, Any], name: str = "task") -> None:
+def validate_json_schema(data: Dict[str, Any], schema: Union[Dict[str, Any], CompiledSchema], name: str = "task", format_checks: bool = True) -> None:
     """Given data and a jsonschema, let's validate it.
 
     This happens for tasks and chain of trust artifacts.
 
     Args:
         data (dict): the json to validate.
-        schema (dict): the jsonschema to validate against.
+        schema (dict): the jsonschema to validate against.  To avoid compiling
+            it on every call, pass a ``CompiledSchema``, e.g. from
+            ``scriptworker.schema.schemas``.
         name (str, optional): the name of the json, for exception messages.
             Defaults to "task".
+        format_checks (bool, optional): whether to check ``format`` keywords,
+            if ``schema`` isn't compiled yet.  Defaults to True.
 
     Raises:
         ScriptWorkerTaskException: on failure
 
     """
-    try:
-        validator = jsonschema.validators.validator_for(schema)
-        jsonschema.validate(data, schema, validator, format_checker=validator.FORMAT_CHECKER)
-    except jsonschema.exceptions.ValidationError as exc:
-        raise ScriptWorkerTaskException("Can't validate {} schema!\n{}".format(name, str(exc)), exit_code=STATUSES["malformed-payload"])
+    if not isinstance(schema, CompiledSchema):
+        schema = CompiledSchema(schema, format_checks=format_checks)
+    schema.validate(data, name=name)
 
 
 def validate_task_schema(context: Any, schema_key: str = "schema_file") -> None:
     """Validate the task definition.
 
+    The schema is compiled once per process, and skips format checks if
+    ``context.config["schema_format_checks"]`` is False.
+
     Args:
         context (scriptworker.context.Context): the scriptworker context. It must contain a task and
             the config pointing to the schema file
@@ -87,8 +91,8 @@ def validate_task_schema(context: Any, schema_key: str = "schema_file") -> None:
     for key in schema_keys:
         schema_path = schema_path[key]
 
-    task_schema = load_json_or_yaml(schema_path, is_path=True)
-    log.debug("Task is validated against this schema: {}".format(task_schema))
+    task_schema = schemas.get(schema_path, format_checks=context.config.get("schema_format_checks", True))
+    log.debug("Task is validated against this schema: {}".format(task_schema.schema))
 
     try:
         validate_json_schema(context.task, task_schema)
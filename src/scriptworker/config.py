@@ -21,6 +21,7 @@ from yaml import safe_load
 
 from scriptworker.constants import DEFAULT_CONFIG
 from scriptworker.context import Context
+from scriptworker.ed25519 import ed25519_keys
 from scriptworker.exceptions import ConfigError
 from scriptworker.log import update_logging_config
 from scriptworker.utils import load_json_or_yaml
@@ -204,6 +205,7 @@ def create_config(config_path="scriptworker.yaml"):
     credentials = get_frozen_copy(secrets["credentials"])
     del config["credentials"]
     config = get_frozen_copy(config)
+    ed25519_keys.load_public_keys(config["ed25519_public_keys"])
     return config, credentials
 
 
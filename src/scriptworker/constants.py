@@ -68,6 +68,35 @@ DEFAULT_CONFIG: immutabledict[str, Any] = immutabledict(
         "task_log_dir": "...",  # set this to ARTIFACT_DIR/public/logs
         "artifact_upload_timeout": 60 * 20,
         "max_concurrent_downloads": 5,
+        # The most download slots each download class ("cot", "mandatory" or
+        # "optional") may use; unlisted classes can use all of them.
+        "download_class_limits": immutabledict({}),
+        # Download files at least this big in parts, over several connections.
+        # 0 disables this.
+        "download_parallel_threshold_mb": 256,
+        "download_part_size_mb": 64,
+        # Move old work dirs into a trash dir and delete them in a background
+        # thread; cleanup blocks once this many are waiting.  0 deletes in place.
+        "max_pending_trash": 4,
+        # Before claiming, require enough free disk for the biggest of the
+        # recent tasks plus this much; stop claiming if it can't be freed up.
+        "min_free_disk_mb": 1024,
+        # Stop calling a host for a while after this many consecutive failures
+        # (0 disables), and retry each host at most this often (0: unlimited).
+        "circuit_breaker_failures": 10,
+        "circuit_breaker_reset_seconds": 30,
+        "retry_budget_per_minute": 120,
+        # Metrics settings.  ``metrics_port`` 0 disables the metrics endpoint.
+        "metrics_host": "127.0.0.1",
+        "metrics_port": 0,
+        # Log the event loop stack when it is blocked for longer than this.
+        # 0 disables the watchdog.
+        "event_loop_stall_threshold_ms": 1000,
+        # Append tracing spans to this file as OTLP/JSON lines.  "" disables tracing.
+        "trace_path": "",
+        "trace_sample_percent": 100,
+        # Check "format" keywords when validating the task and chain of trust schemas.
+        "schema_format_checks": True,
         # chain of trust settings
         "sign_chain_of_trust": True,
         "verify_chain_of_trust": False,  # TODO True
@@ -109,6 +138,8 @@ DEFAULT_CONFIG: immutabledict[str, Any] = immutabledict(
             }
         ),
         "project_configuration_url": "https://raw.githubusercontent.com/mozilla-releng/fxci-config/main/projects.yml",
+        # Refresh projects.yml in the background once it's this old.
+        "projects_refresh_seconds": 3600,
         "pushlog_url": "{repo}/json-pushes?changeset={revision}&version=2&full=1",
         "chain_of_trust_hash_algorithm": "sha256",
         "cot_schema_path": os.path.join(os.path.dirname(__file__), "data", "cot_v1_schema.json"),
@@ -12,27 +12,41 @@ Attributes:
 """
 
 import asyncio
-import json
 import logging
 import os
-import tempfile
 import time
+from contextlib import nullcontext
 from copy import deepcopy
-from typing import Any, Dict, Optional, cast
+from typing import Any, Dict, Mapping, Optional, cast
 
 import aiohttp
 import arrow
 from taskcluster.aio import Queue
 
 from scriptworker import task_process
-from scriptworker.exceptions import CoTError
-from scriptworker.utils import load_json_or_yaml_from_url, makedirs, scriptworker_session
+from scriptworker.disk import DiskSpaceMonitor
+from scriptworker.exceptions import CoTError, ScriptWorkerException, ScriptWorkerRetryException
+from scriptworker.metrics import TaskTimings, registry
+from scriptworker.projects import Projects
+from scriptworker.scheduler import PrioritySemaphore
+from scriptworker.serialization import serializer
+from scriptworker.upstream import UpstreamArtifacts, get_upstream_artifacts
+from scriptworker.utils import ArtifactManifest, DownloadCache, get_if_modified, load_json_or_yaml, makedirs, retry_async, scriptworker_session
 
 log = logging.getLogger(__name__)
 
 
 DEFAULT_MAX_CONCURRENT_DOWNLOADS = 5
-PROJECTS_YML_MAX_AGE_SECONDS = 60 * 60 * 24  # 1 day
+
+
+def _parse_projects(body: str) -> Projects:
+    return Projects(load_json_or_yaml(body, file_type="yaml"))
+
+
+def _log_refresh_exception(future: "asyncio.Future[bool]") -> None:
+    # Nothing awaits a background refresh, so log what refresh_projects doesn't handle.
+    if not future.cancelled() and future.exception() is not None:
+        log.error("Unexpected error refreshing projects.yml in the background", exc_info=future.exception())
 
 
 class Context(object):
@@ -42,27 +56,40 @@ class Context(object):
     passing around config and easier overriding in tests.
 
     Attributes:
+        artifact_manifest (scriptworker.utils.ArtifactManifest): the scanned
+            ``artifact_dir`` of the current task, shared between cot generation
+            and upload.  See ``scan_artifact_dir``.
         config (dict): the running config.  In production this will be an
             immutabledict.
         credentials_timestamp (int): the unix timestamp when we last updated
             our credentials.
+        disk_monitor (scriptworker.disk.DiskSpaceMonitor): checks for free
+            disk space before each claim.
+        download_cache (scriptworker.utils.DownloadCache): if set, downloads
+            are shared with the other contexts that use it.
         proc (task_process.TaskProcess): when launching the script, this is
             the process object.
         queue (taskcluster.aio.Queue): the taskcluster Queue object
             containing the scriptworker credentials.
         session (aiohttp.ClientSession): the default aiohttp session
         task (dict): the task definition for the current task.
+        task_timings (scriptworker.metrics.TaskTimings): the stage timings for
+            the current task, if it was claimed by this worker.
         temp_queue (taskcluster.aio.Queue): the taskcluster Queue object
             containing the task-specific temporary credentials.
 
     """
 
+    artifact_manifest: Optional[ArtifactManifest] = None
     config: Optional[Dict[str, Any]] = None
     credentials_timestamp: Optional[int] = None
+    disk_monitor: Optional[DiskSpaceMonitor] = None
+    download_cache: Optional[DownloadCache] = None
     proc: Optional[task_process.TaskProcess] = None
     queue: Optional[Queue] = None
     session: Optional[aiohttp.ClientSession] = None
     task: Optional[Dict[str, Any]] = None
+    task_timings: Optional[TaskTimings] = None
     temp_queue: Optional[Queue] = None
     running_tasks = None
     _download_semaphore = None
@@ -71,9 +98,12 @@ class Context(object):
     _event_loop = None
     _temp_credentials = None  # This assumes a single task per worker.
     _reclaim_task = None
-    _projects = None
-    # timestamp of when projects.yml was fetched by `populate_projects`
+    _upstream_artifacts: Optional[UpstreamArtifacts] = None
+    _projects: Optional[Projects] = None
+    # timestamp of when projects.yml was last fetched or found unchanged by `refresh_projects`
     _projects_timestamp: float = 0.0
+    _projects_validators: Optional[Dict[str, str]] = None
+    _projects_refresh: Optional["asyncio.Future[bool]"] = None
 
     @property
     def claim_task(self) -> Optional[Dict[str, Any]]:
@@ -84,7 +114,7 @@ class Context(object):
 
         When setting ``claim_task``, we also set ``self.task`` and
         ``self.temp_credentials``, zero out ``self.reclaim_task`` and ``self.proc``,
-        then write a task.json to disk.
+        index the task's ``upstreamArtifacts``, then write a task.json to disk.
 
         """
         return self._claim_task
@@ -95,9 +125,12 @@ class Context(object):
         self._claim_task = claim_task
         self.reclaim_task = None
         self.proc = None
+        self.artifact_manifest = None
+        self._upstream_artifacts = None
         if claim_task:
             self.task = claim_task["task"]
             self.verify_task()
+            self._upstream_artifacts = UpstreamArtifacts.from_task(self.task)
             self.temp_credentials = claim_task["credentials"]
             path = os.path.join(self.config["work_dir"], "task.json")
             assert self.task
@@ -106,6 +139,29 @@ class Context(object):
             self.temp_credentials = None
             self.task = None
 
+    @property
+    def upstream_artifacts(self) -> UpstreamArtifacts:
+        """UpstreamArtifacts: the index of ``self.task``'s ``upstreamArtifacts``.
+
+        It's built when ``claim_task`` is set, and only rebuilt if
+        ``self.task`` gets different ``upstreamArtifacts`` afterwards.
+
+        """
+        self._upstream_artifacts = get_upstream_artifacts((self.task or {}).get("payload", {}).get("upstreamArtifacts", ()), self._upstream_artifacts)
+        return self._upstream_artifacts
+
+    def scan_artifact_dir(self) -> ArtifactManifest:
+        """Scan ``artifact_dir``, reusing the entries of unchanged files from the last scan.
+
+        Returns:
+            ArtifactManifest: ``self.artifact_manifest``, up to date.
+
+        """
+        assert self.config
+        if self.artifact_manifest is None or self.artifact_manifest.path != self.config["artifact_dir"]:
+            self.artifact_manifest = ArtifactManifest(self.config["artifact_dir"])
+        return self.artifact_manifest.scan()
+
     def verify_task(self) -> None:
         """Run some task sanity checks on ``self.task``."""
         assert self.task
@@ -205,23 +261,27 @@ class Context(object):
         """
         log.debug(message.format(path=path))
         makedirs(os.path.dirname(path))
-        with open(path, "w") as fh:
-            json.dump(contents, fh, indent=2, sort_keys=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(serializer.dumps_json(contents, canonical=False))
 
     @property
-    def projects(self) -> Optional[Dict[str, Any]]:
-        """dict: The current contents of ``projects.yml``, which defines CI configuration.
+    def projects(self) -> Optional[Projects]:
+        """Projects: The current contents of ``projects.yml``, which defines CI configuration.
 
         I'd love to auto-populate this; currently we need to set this from
         the config's ``project_configuration_url``.
 
+        Setting a dict freezes and indexes it once; reading it doesn't copy.
+
         """
         if self._projects:
-            return dict(deepcopy(self._projects))
+            return self._projects
         return None
 
     @projects.setter
-    def projects(self, projects: Optional[Dict[str, Any]]) -> None:
+    def projects(self, projects: Optional[Mapping[str, Any]]) -> None:
+        if projects is not None and not isinstance(projects, Projects):
+            projects = Projects(projects)
         self._projects = projects
 
     @property
@@ -242,9 +302,11 @@ class Context(object):
     async def populate_projects(self, force: bool = False) -> None:
         """Download the ``projects.yml`` file and populate ``self.projects``.
 
-        Unless ``force`` is set or it was last fetched over a day ago this
-        method is a noop. (The latter is needed to avoid using a stale version
-        of this file on long lived workers forever.)
+        If ``self.projects`` is already defined, this doesn't wait for the
+        network: unless ``force`` is set, it only starts a background refresh
+        if the copy is over ``projects_refresh_seconds`` old.  (The latter is
+        needed to avoid using a stale version of this file on long lived
+        workers forever.)
 
         Args:
             force (bool, optional): Re-run the download, even if ``self.projects``
@@ -252,20 +314,98 @@ class Context(object):
 
         """
         assert self.config
-        now = time.time()
-        last_fetched = now - self._projects_timestamp
-        if force or not self.projects or last_fetched > PROJECTS_YML_MAX_AGE_SECONDS:
-            with tempfile.TemporaryDirectory() as tmpdirname:
-                self.projects = await load_json_or_yaml_from_url(self, self.config["project_configuration_url"], os.path.join(tmpdirname, "projects.yml"))
-                self._projects_timestamp = now
+        if force or not self.projects:
+            await self.refresh_projects()
+        else:
+            self.refresh_projects_if_stale()
+
+    async def refresh_projects(self, session: Optional[aiohttp.ClientSession] = None) -> bool:
+        """Fetch ``projects.yml`` if it changed since the last fetch.
+
+        This is a conditional GET, using the ``ETag`` and ``Last-Modified``
+        of the last response.  If the fetch fails and there's a copy already,
+        keep using the stale copy.
+
+        Args:
+            session (aiohttp.ClientSession, optional): the session to use.
+                Defaults to ``self.session`` if it's open, else a temporary
+                session.
+
+        Returns:
+            bool: True if ``self.projects`` is up to date.
+
+        Raises:
+            Exception: if the fetch fails and there's no copy yet.
+
+        """
+        assert self.config
+        url = self.config["project_configuration_url"]
+        session = session or (self.session if self.session and not self.session.closed else None)
+        try:
+            async with nullcontext(session) if session else scriptworker_session() as session:
+                body, validators = await retry_async(
+                    get_if_modified,
+                    args=(session, url, self._projects_validators),
+                    retry_exceptions=(ScriptWorkerRetryException, aiohttp.ClientError, asyncio.TimeoutError),
+                )
+            if body is not None:
+                # Parsing and indexing a large yaml file takes a while; don't block the event loop.
+                self.projects = await asyncio.get_running_loop().run_in_executor(None, _parse_projects, body)
+            self._projects_validators = validators
+        except (ScriptWorkerException, aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            if not self.projects:
+                raise
+            registry.inc("projects_refresh_failures_total")
+            log.warning("Can't refresh {}; using the copy from {:.0f}s ago: {}".format(url, time.time() - self._projects_timestamp, exc))
+            return False
+        self._projects_timestamp = time.time()
+        return True
+
+    def share_projects(self, other: "Context") -> None:
+        """Use the ``projects.yml`` of ``other``, rather than fetching it again.
+
+        Args:
+            other (Context): the context that populated its ``projects``.
+
+        """
+        self.projects = other.projects
+        self._projects_timestamp = other._projects_timestamp
+        self._projects_validators = other._projects_validators
+
+    def refresh_projects_if_stale(self) -> Optional["asyncio.Future[bool]"]:
+        """Start refreshing ``projects.yml`` in the background, if it's stale.
+
+        Only one refresh runs at a time.  Nothing happens until
+        ``self.projects`` is populated once.  The refresh uses its own session,
+        since it may outlive ``self.session``, e.g. when it starts at the end
+        of a task.
+
+        Returns:
+            asyncio.Future: the refresh, or None if there's none running.
+
+        """
+        assert self.config
+        if self._projects_refresh is not None and not self._projects_refresh.done():
+            return self._projects_refresh
+        if self.projects and time.time() - self._projects_timestamp > self.config["projects_refresh_seconds"]:
+            self._projects_refresh = asyncio.ensure_future(self._refresh_projects_in_background())
+            self._projects_refresh.add_done_callback(_log_refresh_exception)
+            return self._projects_refresh
+        return None
+
+    async def _refresh_projects_in_background(self) -> bool:
+        async with scriptworker_session() as session:
+            return await self.refresh_projects(session=session)
 
     @property
-    def download_semaphore(self) -> asyncio.BoundedSemaphore:
+    def download_semaphore(self) -> PrioritySemaphore:
         assert self.config
         if self._download_semaphore is None:
             try:
                 max_concurrent_downloads = self.config.get("max_concurrent_downloads", DEFAULT_MAX_CONCURRENT_DOWNLOADS)
+                class_limits = self.config.get("download_class_limits")
             except (TypeError, KeyError, AttributeError):
                 max_concurrent_downloads = DEFAULT_MAX_CONCURRENT_DOWNLOADS
-            self._download_semaphore = asyncio.BoundedSemaphore(max_concurrent_downloads)
+                class_limits = None
+            self._download_semaphore = PrioritySemaphore(max_concurrent_downloads, class_limits=class_limits)
         return self._download_semaphore
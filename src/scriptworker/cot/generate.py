@@ -10,9 +10,10 @@ import logging
 import os
 
 from scriptworker.client import validate_json_schema
-from scriptworker.ed25519 import ed25519_private_key_from_file
+from scriptworker.ed25519 import ed25519_keys
 from scriptworker.exceptions import ScriptWorkerException
-from scriptworker.utils import filepaths_in_dir, format_json, get_hash, load_json_or_yaml, write_to_file
+from scriptworker.schema import schemas
+from scriptworker.utils import format_json, write_to_file
 
 log = logging.getLogger(__name__)
 
@@ -28,14 +29,9 @@ def get_cot_artifacts(context):
         dict: a dictionary of {"path/to/artifact": {"hash_alg": "..."}, ...}
 
     """
-    artifacts = {}
-    filepaths = filepaths_in_dir(context.config["artifact_dir"])
+    manifest = context.scan_artifact_dir()
     hash_alg = context.config["chain_of_trust_hash_algorithm"]
-    for filepath in sorted(filepaths):
-        path = os.path.join(context.config["artifact_dir"], filepath)
-        sha = get_hash(path, hash_alg=hash_alg)
-        artifacts[filepath] = {hash_alg: sha}
-    return artifacts
+    return manifest.get_hashes(manifest.filepaths(), hash_algs=(hash_alg,))
 
 
 # get_cot_environment {{{1
@@ -88,10 +84,22 @@ def generate_cot_body(context):
     return cot
 
 
+def _add_to_artifact_manifest(context, path):
+    manifest = context.artifact_manifest
+    if manifest is not None:
+        filepath = os.path.relpath(path, manifest.path)
+        if not filepath.startswith(os.pardir):
+            manifest.refresh(filepath)
+
+
 # generate_cot {{{1
 def generate_cot(context, parent_path=None):
     """Format and sign the cot body, and write to disk.
 
+    This is synchronous, so it can run in an executor.  Besides writing the
+    artifacts, it updates ``context.artifact_manifest``, so nothing else should
+    use the manifest until it's done.
+
     Args:
         context (scriptworker.context.Context): the scriptworker context.
         parent_path (str, optional): The directory to write the chain of trust
@@ -106,9 +114,9 @@ def generate_cot(context, parent_path=None):
 
     """
     body = generate_cot_body(context)
-    schema = load_json_or_yaml(
+    schema = schemas.get(
         context.config["cot_schema_path"],
-        is_path=True,
+        format_checks=context.config["schema_format_checks"],
         exception=ScriptWorkerException,
         message="Can't read schema file {}: %(exc)s".format(context.config["cot_schema_path"]),
     )
@@ -117,9 +125,11 @@ def generate_cot(context, parent_path=None):
     parent_path = parent_path or os.path.join(context.config["artifact_dir"], "public")
     unsigned_path = os.path.join(parent_path, "chain-of-trust.json")
     write_to_file(unsigned_path, body)
+    # The upload reuses the manifest, so add the files written after the scan.
+    _add_to_artifact_manifest(context, unsigned_path)
     if context.config["sign_chain_of_trust"]:
         ed25519_signature_path = "{}.sig".format(unsigned_path)
-        ed25519_private_key = ed25519_private_key_from_file(context.config["ed25519_private_key_path"])
-        ed25519_signature = ed25519_private_key.sign(body.encode("utf-8"))
+        ed25519_signature = ed25519_keys.sign(context.config["ed25519_private_key_path"], body.encode("utf-8"))
         write_to_file(ed25519_signature_path, ed25519_signature, file_type="binary")
+        _add_to_artifact_manifest(context, ed25519_signature_path)
     return body
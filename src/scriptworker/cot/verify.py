@@ -3,6 +3,8 @@
 Attributes:
     DECISION_TASK_TYPES (tuple): the decision task types.
     PARENT_TASK_TYPES (tuple): the parent task types.
+    COT_METADATA_ARTIFACTS (tuple): the decision and action task artifacts
+        that chain of trust verification reads.
     log (logging.Logger): the log object for this module.
 
 """
@@ -10,14 +12,16 @@ Attributes:
 import argparse
 import asyncio
 import datetime
-import fnmatch
+import functools
 import hashlib
 import logging
 import os
 import pprint
 import sys
 import tempfile
+import time
 from copy import deepcopy
+from typing import Any, Callable, Dict, List
 from urllib.parse import urlparse
 
 import aiohttp
@@ -28,20 +32,17 @@ from taskcluster.aio import Queue
 from taskgraph.util.parameterization import resolve_timestamps
 
 from scriptworker import __version__
-from scriptworker.artifacts import (
-    download_artifacts,
-    get_artifact_url,
-    get_optional_artifacts_per_task_id,
-    get_single_upstream_artifact_full_path,
-    retry_list_latest_artifacts,
-)
+from scriptworker.artifacts import download_artifacts, get_artifact_url, get_single_upstream_artifact_full_path, retry_list_latest_artifacts
 from scriptworker.config import apply_product_config, read_worker_creds
 from scriptworker.constants import DEFAULT_CONFIG
 from scriptworker.context import Context
-from scriptworker.ed25519 import ed25519_public_key_from_string, verify_ed25519_signature
+from scriptworker.ed25519 import ed25519_keys
 from scriptworker.exceptions import BaseDownloadError, CoTError, ScriptWorkerEd25519Error
 from scriptworker.github import GitHubRepository, extract_github_repo_full_name, extract_github_repo_owner_and_name, extract_github_repo_ssh_url
 from scriptworker.log import contextual_log_handler
+from scriptworker.metrics import timed
+from scriptworker.scheduler import COT_DOWNLOAD, MANDATORY_DOWNLOAD, OPTIONAL_DOWNLOAD, download_priority
+from scriptworker.serialization import serializer
 from scriptworker.task import (
     get_action_callback_name,
     get_and_check_tasks_for,
@@ -65,14 +66,18 @@ from scriptworker.task import (
     is_try_or_pull_request,
     retry_get_task_definition,
 )
+from scriptworker.trace import span
+from scriptworker.upstream import get_upstream_artifacts
 from scriptworker.utils import (
+    DownloadCache,
     add_enumerable_item_to_dict,
     add_projectid,
     add_taskqueueid,
     format_json,
-    get_hash,
+    get_hashes_async,
     get_loggable_url,
     get_results_and_future_exceptions,
+    hash_files_async,
     load_json_or_yaml,
     load_json_or_yaml_from_url,
     makedirs,
@@ -91,9 +96,56 @@ log = logging.getLogger(__name__)
 
 DECISION_TASK_TYPES = ("decision",)
 PARENT_TASK_TYPES = ("decision", "action")
+COT_METADATA_ARTIFACTS = ("public/actions.json", "public/parameters.yml", "public/task-graph.json")
 
 
 # ChainOfTrust {{{1
+def _reindexed(method: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(method)
+    def wrapper(self: "_Links", *args: Any, **kwargs: Any) -> Any:
+        result = method(self, *args, **kwargs)
+        self._reindex()
+        return result
+
+    return wrapper
+
+
+class _Links(List[Any]):
+    """A list of ``LinkOfTrust``s that keeps them indexed by ``task_id``.
+
+    Appending updates the index; the rarer changes rebuild it.
+
+    """
+
+    def __init__(self, links=()):
+        super().__init__(links)
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self.by_task_id: Dict[str, List[Any]] = {}
+        for link in self:
+            self.by_task_id.setdefault(link.task_id, []).append(link)
+
+    def append(self, link):
+        super().append(link)
+        self.by_task_id.setdefault(link.task_id, []).append(link)
+
+    def extend(self, links):
+        for link in links:
+            self.append(link)
+
+    insert = _reindexed(list.insert)
+    pop = _reindexed(list.pop)
+    remove = _reindexed(list.remove)
+    clear = _reindexed(list.clear)
+    sort = _reindexed(list.sort)
+    reverse = _reindexed(list.reverse)
+    __setitem__ = _reindexed(list.__setitem__)
+    __delitem__ = _reindexed(list.__delitem__)
+    __iadd__ = _reindexed(list.__iadd__)
+    __imul__ = _reindexed(list.__imul__)
+
+
 class ChainOfTrust(object):
     """The master Chain of Trust, tracking all the various ``LinkOfTrust``s.
 
@@ -101,6 +153,10 @@ class ChainOfTrust(object):
         context (scriptworker.context.Context): the scriptworker context
         decision_task_id (str): the task_id of self.task's decision task
         parent_task_id (str): the task_id of self.task's parent task
+        dependencies (dict): the ``task_id``s each ``task_id`` in the chain
+            depends on, as found by ``build_task_dependencies``.
+        latest_artifacts (dict): the ``listLatestArtifacts`` results per
+            ``task_id``, cached for the whole verification.
         links (list): the list of ``LinkOfTrust``s
         name (str): the name of the task (e.g., signing)
         task_id (str): the taskId of the task
@@ -127,7 +183,35 @@ class ChainOfTrust(object):
         self.worker_impl = guess_worker_impl(self)  # this should be scriptworker
         self.decision_task_id = get_decision_task_id(self.task)
         self.parent_task_id = get_parent_task_id(self.task)
+        self.latest_artifacts = {}
         self.links = []
+        self.dependencies = {}
+        self._upstream_artifacts = None
+
+    @property
+    def upstream_artifacts(self):
+        """UpstreamArtifacts: the index of ``self.task``'s ``upstreamArtifacts``.
+
+        This is ``context.upstream_artifacts`` unless ``self.task`` changed.
+
+        """
+        upstream_artifacts = self.task.get("payload", {}).get("upstreamArtifacts", ())
+        self._upstream_artifacts = get_upstream_artifacts(upstream_artifacts, self._upstream_artifacts or self.context.upstream_artifacts)
+        return self._upstream_artifacts
+
+    @property
+    def links(self):
+        """list: the ``LinkOfTrust``s of the tasks this task depends on.
+
+        The links are indexed by ``task_id``, and the index is kept up to
+        date when the list changes.  Setting a list copies it.
+
+        """
+        return self._links
+
+    @links.setter
+    def links(self, links):
+        self._links = _Links(links)
 
     def dependent_task_ids(self):
         """Get all ``task_id``s for all ``LinkOfTrust`` tasks.
@@ -136,7 +220,55 @@ class ChainOfTrust(object):
             list: the list of ``task_id``s
 
         """
-        return [x.task_id for x in self.links]
+        return list(self._links.by_task_id)
+
+    def has_link(self, task_id):
+        """Determine if a task is in ``self.links``.
+
+        Args:
+            task_id (str): the task id to look for.
+
+        Returns:
+            bool: True if a ``LinkOfTrust`` matches the task id.
+
+        """
+        return task_id in self._links.by_task_id
+
+    def add_dependency(self, task_id, dependency_task_id):
+        """Record that ``task_id`` depends on ``dependency_task_id``.
+
+        Args:
+            task_id (str): the dependent task id.
+            dependency_task_id (str): the task id it depends on.
+
+        Returns:
+            bool: True if ``dependency_task_id`` wasn't in the chain yet.
+
+        """
+        is_new = dependency_task_id not in self.dependencies and not self.has_link(dependency_task_id)
+        self.dependencies.setdefault(dependency_task_id, set())
+        if dependency_task_id != task_id:
+            self.dependencies.setdefault(task_id, set()).add(dependency_task_id)
+        return is_new
+
+    async def get_latest_artifacts(self, task_ids):
+        """List the latest artifacts of several tasks, concurrently.
+
+        Results are cached in ``self.latest_artifacts``, so each task is only
+        listed once per verification.
+
+        Args:
+            task_ids (list): the ``task_id``s to list the artifacts of.
+
+        Returns:
+            dict: the list of artifact definitions per ``task_id``.
+
+        """
+        missing = sorted(set(task_ids) - set(self.latest_artifacts))
+        if missing:
+            results = await raise_future_exceptions([asyncio.ensure_future(retry_list_latest_artifacts(self.context.queue, task_id)) for task_id in missing])
+            self.latest_artifacts.update(zip(missing, results))
+        return {task_id: self.latest_artifacts[task_id] for task_id in task_ids}
 
     async def is_try_or_pull_request(self):
         """Determine if any task in the chain is a try task.
@@ -164,7 +296,7 @@ class ChainOfTrust(object):
             CoTError: if no ``LinkOfTrust`` matches.
 
         """
-        links = [x for x in self.links if x.task_id == task_id]
+        links = self._links.by_task_id.get(task_id, [])
         if len(links) != 1:
             raise CoTError("No single Link matches task_id {}!\n{}".format(task_id, self.dependent_task_ids()))
         return links[0]
@@ -222,7 +354,7 @@ class ChainOfTrust(object):
             list: of all ``LinkOfTrust``s to verify.
 
         """
-        if self.task_id in self.dependent_task_ids():
+        if self.has_link(self.task_id):
             return self.links
         return [self] + self.links
 
@@ -636,19 +768,21 @@ async def add_link(chain, task_name, task_id):
     link.task = await retry_get_task_definition(chain.context.queue, task_id, exception=CoTError)
     chain.links.append(link)
     makedirs(os.path.dirname(json_path))
-    with open(json_path, "w") as fh:
-        fh.write(format_json(link.task))
+    with open(json_path, "w", encoding="utf-8") as fh:
+        fh.write(serializer.dumps_json(link.task, canonical=False))
 
 
-async def build_task_dependencies(chain, task, name, my_task_id, seen=None):
+async def build_task_dependencies(chain, task, name, my_task_id):
     """Recursively build the task dependencies of a task.
 
+    Each task is only added once; ``chain.dependencies`` records every edge,
+    including the ones to tasks that were already in the chain.
+
     Args:
         chain (ChainOfTrust): the chain of trust to add to.
         task (dict): the task definition to operate on.
         name (str): the name of the task to operate on.
         my_task_id (str): the taskId of the task to operate on.
-        seen (set): shared set of already-seen task IDs to avoid duplicates
 
     Raises:
         CoTError: on failure.
@@ -659,12 +793,9 @@ async def build_task_dependencies(chain, task, name, my_task_id, seen=None):
         raise CoTError("Too deep recursion!\n{}".format(name))
     sorted_dependencies = find_sorted_task_dependencies(task, name, my_task_id)
 
-    if seen is None:
-        seen = set(chain.dependent_task_ids())
     new_deps = []
     for task_name, task_id in sorted_dependencies:
-        if task_id not in seen:
-            seen.add(task_id)
+        if chain.add_dependency(my_task_id, task_id):
             new_deps.append((task_name, task_id))
 
     if not new_deps:
@@ -672,7 +803,7 @@ async def build_task_dependencies(chain, task, name, my_task_id, seen=None):
 
     await asyncio.gather(*[add_link(chain, task_name, task_id) for task_name, task_id in new_deps])
 
-    await asyncio.gather(*[build_task_dependencies(chain, chain.get_link(task_id).task, task_name, task_id, seen) for task_name, task_id in new_deps])
+    await asyncio.gather(*[build_task_dependencies(chain, chain.get_link(task_id).task, task_name, task_id) for task_name, task_id in new_deps])
 
 
 # download_cot {{{1
@@ -700,13 +831,14 @@ async def download_cot(chain):
         if chain.context.config["verify_cot_signature"]:
             urls.append(get_artifact_url(chain.context, task_id, "public/chain-of-trust.json.sig"))
 
-        artifact_tasks.append(asyncio.ensure_future(download_artifacts(chain.context, urls, parent_dir=parent_dir, valid_artifact_task_ids=[task_id])))
+        with download_priority(COT_DOWNLOAD):
+            artifact_tasks.append(asyncio.ensure_future(download_artifacts(chain.context, urls, parent_dir=parent_dir, valid_artifact_task_ids=[task_id])))
 
     artifacts_paths = await raise_future_exceptions(artifact_tasks)
 
-    for path in artifacts_paths:
-        sha = get_hash(path[0])
-        log.debug("{} downloaded; hash is {}".format(path[0], sha))
+    shas = await hash_files_async([path[0] for path in artifacts_paths])
+    for path, hashes in shas.items():
+        log.debug("{} downloaded; hash is {}".format(path, hashes["sha256"]))
 
 
 # download_cot_artifact {{{1
@@ -743,15 +875,19 @@ Skipping download of this artifact'.format(path, task_id))
     url = get_artifact_url(chain.context, task_id, path)
     loggable_url = get_loggable_url(url)
     log.info("Downloading Chain of Trust artifact:\n{}".format(loggable_url))
-    await download_artifacts(chain.context, [url], parent_dir=link.cot_dir, valid_artifact_task_ids=[task_id])
-    full_path = link.get_artifact_full_path(path)
-    for alg, expected_sha in link.cot["artifacts"][path].items():
-        if alg not in chain.context.config["valid_hash_algorithms"]:
-            raise CoTError("BAD HASH ALGORITHM: {}: {} {}!".format(link.name, alg, full_path))
-        real_sha = get_hash(full_path, hash_alg=alg)
-        if expected_sha != real_sha:
-            raise CoTError("BAD HASH on file {}: {}: Expected {} {}; got {}!".format(full_path, link.name, alg, expected_sha, real_sha))
-        log.debug("{} matches the expected {} {}".format(full_path, alg, expected_sha))
+    with span("cot.download_cot_artifact", taskId=task_id, link=link.name, path=path):
+        await download_artifacts(chain.context, [url], parent_dir=link.cot_dir, valid_artifact_task_ids=[task_id])
+        full_path = link.get_artifact_full_path(path)
+        expected_shas = link.cot["artifacts"][path]
+        for alg in expected_shas:
+            if alg not in chain.context.config["valid_hash_algorithms"]:
+                raise CoTError("BAD HASH ALGORITHM: {}: {} {}!".format(link.name, alg, full_path))
+        real_shas = await get_hashes_async(full_path, hash_algs=tuple(expected_shas))
+        for alg, expected_sha in expected_shas.items():
+            real_sha = real_shas[alg]
+            if expected_sha != real_sha:
+                raise CoTError("BAD HASH on file {}: {}: Expected {} {}; got {}!".format(full_path, link.name, alg, expected_sha, real_sha))
+            log.debug("{} matches the expected {} {}".format(full_path, alg, expected_sha))
     return full_path
 
 
@@ -759,7 +895,10 @@ Skipping download of this artifact'.format(path, task_id))
 async def download_cot_artifacts(chain):
     """Call ``download_cot_artifact`` in parallel for each "upstreamArtifacts".
 
-    Optional artifacts are allowed to not be downloaded.
+    Optional artifacts are allowed to not be downloaded.  Download slots go
+    to the chain of trust metadata first, then to mandatory artifacts, then
+    to optional ones.  If a mandatory artifact fails, the other downloads are
+    cancelled.
 
     Args:
         chain (ChainOfTrust): the chain of trust object
@@ -773,35 +912,47 @@ async def download_cot_artifacts(chain):
         BaseDownloadError: on download error on a mandatory artifact
 
     """
-    upstream_artifacts = chain.task["payload"].get("upstreamArtifacts", [])
-    all_artifacts_per_task_id = get_all_artifacts_per_task_id(chain, upstream_artifacts)
+    upstream_artifacts = chain.upstream_artifacts
+    all_artifacts_per_task_id = get_all_artifacts_per_task_id(chain, upstream_artifacts.source)
 
     mandatory_artifact_tasks = []
     optional_artifact_tasks = []
-    latest_artifacts = {}
+    # Paths with wildcards in them indicate that the concrete artifact names
+    # aren't known when the task definition is created. For these cases, we
+    # need to fetch the list of artifacts from the completed tasks and then
+    # determine which are needed based on the pattern given.
+    wildcard_task_ids = [task_id for task_id in upstream_artifacts.task_ids if upstream_artifacts.patterns(task_id)]
+    latest_artifacts = await chain.get_latest_artifacts(wildcard_task_ids)
     for task_id, paths in all_artifacts_per_task_id.items():
+        if upstream_artifacts.patterns(task_id):
+            matches = upstream_artifacts.match(task_id, [artifact["name"] for artifact in latest_artifacts[task_id]])
         for path in paths:
+            is_optional = upstream_artifacts.is_optional(task_id, path)
+            if is_optional:
+                download_class = OPTIONAL_DOWNLOAD
+            elif path in COT_METADATA_ARTIFACTS:
+                download_class = COT_DOWNLOAD
+            else:
+                download_class = MANDATORY_DOWNLOAD
             if "*" in path:
-                # Paths with wildcards in them indicate that the concrete
-                # artifact names aren't known when the task definition is
-                # created. For these cases, we need to fetch the list of
-                # artifacts from the completed tasks and then determine
-                # which are needed based on the pattern given.
-                if not latest_artifacts.get(task_id):
-                    latest_artifacts[task_id] = await retry_list_latest_artifacts(chain.context.queue, task_id)
-                coroutines = []
-                for artifact in latest_artifacts[task_id]:
-                    if fnmatch.fnmatch(artifact["name"], path):
-                        coroutines.append(asyncio.ensure_future(download_cot_artifact(chain, task_id, artifact["name"])))
+                with download_priority(download_class):
+                    coroutines = [asyncio.ensure_future(download_cot_artifact(chain, task_id, name)) for name in matches[path]]
             else:
-                coroutines = [asyncio.ensure_future(download_cot_artifact(chain, task_id, path))]
+                with download_priority(download_class):
+                    coroutines = [asyncio.ensure_future(download_cot_artifact(chain, task_id, path))]
 
-            if is_artifact_optional(chain, task_id, path):
+            if is_optional:
                 optional_artifact_tasks.extend(coroutines)
             else:
                 mandatory_artifact_tasks.extend(coroutines)
 
-    mandatory_artifacts_paths = await raise_future_exceptions(mandatory_artifact_tasks)
+    if mandatory_artifact_tasks:
+        await asyncio.wait(mandatory_artifact_tasks, return_when=asyncio.FIRST_EXCEPTION)
+        if any(task.done() and not task.cancelled() and task.exception() for task in mandatory_artifact_tasks):
+            for task in mandatory_artifact_tasks + optional_artifact_tasks:
+                task.cancel()
+            await asyncio.wait(mandatory_artifact_tasks + optional_artifact_tasks)
+    mandatory_artifacts_paths = await raise_future_exceptions([task for task in mandatory_artifact_tasks if not task.cancelled()])
     succeeded_optional_artifacts_paths, failed_optional_artifacts = await get_results_and_future_exceptions(optional_artifact_tasks)
 
     if failed_optional_artifacts:
@@ -821,9 +972,7 @@ def is_artifact_optional(chain, task_id, path):
         bool: True if artifact is optional
 
     """
-    upstream_artifacts = chain.task["payload"].get("upstreamArtifacts", [])
-    optional_artifacts_per_task_id = get_optional_artifacts_per_task_id(upstream_artifacts)
-    return path in optional_artifacts_per_task_id.get(task_id, [])
+    return chain.upstream_artifacts.is_optional(task_id, path)
 
 
 def get_all_artifacts_per_task_id(chain, upstream_artifacts):
@@ -848,8 +997,9 @@ def get_all_artifacts_per_task_id(chain, upstream_artifacts):
             add_enumerable_item_to_dict(dict_=all_artifacts_per_task_id, key=link.task_id, item="public/parameters.yml")
 
     if upstream_artifacts:
-        for upstream_dict in upstream_artifacts:
-            add_enumerable_item_to_dict(dict_=all_artifacts_per_task_id, key=upstream_dict["taskId"], item=upstream_dict["paths"])
+        upstream_artifacts = get_upstream_artifacts(upstream_artifacts, chain.upstream_artifacts)
+        for task_id, paths in upstream_artifacts.paths_per_task_id.items():
+            add_enumerable_item_to_dict(dict_=all_artifacts_per_task_id, key=task_id, item=paths)
 
     # Avoid duplicate paths per task_id
     for task_id, paths in all_artifacts_per_task_id.items():
@@ -864,6 +1014,10 @@ def verify_link_ed25519_cot_signature(chain, link, unsigned_path, signature_path
 
     Populate each link.cot with the chain of trust json body.
 
+    The seed that last verified a ``link.worker_impl`` signature is tried
+    first.  This is synchronous, and thread safe, so
+    ``verify_cot_signatures`` runs it in an executor.
+
     Args:
         chain (ChainOfTrust): the chain of trust to add to.
 
@@ -877,14 +1031,14 @@ def verify_link_ed25519_cot_signature(chain, link, unsigned_path, signature_path
         binary_contents = read_from_file(unsigned_path, file_type="binary", exception=CoTError)
         errors = []
         verify_key_seeds = chain.context.config["ed25519_public_keys"].get(link.worker_impl, [])
-        for seed in verify_key_seeds:
+        for seed in ed25519_keys.ordered_seeds(link.worker_impl, verify_key_seeds):
             try:
-                verify_key = ed25519_public_key_from_string(seed)
-                verify_ed25519_signature(
-                    verify_key,
+                ed25519_keys.verify(
+                    seed,
                     binary_contents,
                     signature,
                     "{} {}: {} ed25519 cot signature doesn't verify against {}: %(exc)s".format(link.name, link.task_id, link.worker_impl, seed),
+                    worker_impl=link.worker_impl,
                 )
                 log.debug("{} {}: ed25519 cot signature verified.".format(link.name, link.task_id))
                 break
@@ -903,11 +1057,13 @@ def verify_link_ed25519_cot_signature(chain, link, unsigned_path, signature_path
     )
 
 
-def verify_cot_signatures(chain):
+async def verify_cot_signatures(chain):
     """Verify the signatures of the chain of trust artifacts populated in ``download_cot``.
 
     Populate each link.cot with the chain of trust json body.
 
+    The links are verified concurrently, in the default executor.
+
     Args:
         chain (ChainOfTrust): the chain of trust to add to.
 
@@ -915,10 +1071,13 @@ def verify_cot_signatures(chain):
         CoTError: on failure.
 
     """
+    loop = asyncio.get_running_loop()
+    futures = []
     for link in chain.links:
         unsigned_path = link.get_artifact_full_path("public/chain-of-trust.json")
         ed25519_signature_path = link.get_artifact_full_path("public/chain-of-trust.json.sig")
-        verify_link_ed25519_cot_signature(chain, link, unsigned_path, ed25519_signature_path)
+        futures.append(loop.run_in_executor(None, verify_link_ed25519_cot_signature, chain, link, unsigned_path, ed25519_signature_path))
+    await raise_future_exceptions(futures)
 
 
 # verify_task_in_task_graph {{{1
@@ -1040,17 +1199,9 @@ async def get_scm_level(context, project):
 
     """
     await context.populate_projects()
-    config = context.projects[project]
-    if config["repo_type"] == "hg":
-        return config["access"].replace("scm_level_", "")
-    elif config["repo_type"] == "git":
-        # TODO: we should be using the branch that the task is actually
-        # being run on
-        default_branch = config.get("default_branch", "main")
-        for branch in config["branches"]:
-            if branch["name"] == default_branch:
-                return str(branch["level"])
-
+    level = context.projects.get_scm_level(project)
+    if level is not None:
+        return level
     raise ValueError("Can't find level for project {}".format(project))
 
 
@@ -2051,21 +2202,29 @@ async def verify_chain_of_trust(chain, *, check_task=False):
     ):
         log.info("Running scriptworker version {}".format(__version__))
         try:
+            context = chain.context
             # build LinkOfTrust objects
-            if check_task:
-                await add_link(chain, chain.name, chain.task_id)
-            await build_task_dependencies(chain, chain.task, chain.name, chain.task_id)
+            with timed(context, "cot.build_task_dependencies"):
+                if check_task:
+                    await add_link(chain, chain.name, chain.task_id)
+                await build_task_dependencies(chain, chain.task, chain.name, chain.task_id)
             # download the signed chain of trust artifacts
-            await download_cot(chain)
+            with timed(context, "cot.download_cot"):
+                await download_cot(chain)
             # verify the signatures and populate the ``link.cot``s
-            verify_cot_signatures(chain)
+            with timed(context, "cot.verify_cot_signatures"):
+                await verify_cot_signatures(chain)
             # download all other artifacts needed to verify chain of trust
-            await download_cot_artifacts(chain)
+            with timed(context, "cot.download_cot_artifacts"):
+                await download_cot_artifacts(chain)
             # verify the task types, e.g. decision
-            await verify_task_types(chain)
+            with timed(context, "cot.verify_task_types"):
+                await verify_task_types(chain)
             # verify the worker_impls, e.g. docker-worker
-            await verify_worker_impls(chain)
-            await trace_back_to_tree(chain)
+            with timed(context, "cot.verify_worker_impls"):
+                await verify_worker_impls(chain)
+            with timed(context, "cot.trace_back_to_tree"):
+                await trace_back_to_tree(chain)
         except (BaseDownloadError, KeyError, TypeError, AttributeError) as exc:
             log.critical("Chain of Trust verification error!", exc_info=True)
             if isinstance(exc, CoTError):
@@ -2101,6 +2260,127 @@ async def _async_verify_cot_cmdln(opts, tmp):
         await verify_chain_of_trust(cot, check_task=check_task)
 
 
+class _TaskDefinitionCache(object):
+    # Wraps a taskcluster Queue, so each task definition is fetched once per
+    # batch, however many chains of trust include it.  Other calls go to the
+    # queue.
+    def __init__(self, queue):
+        self._queue = queue
+        self._tasks = {}
+
+    def __getattr__(self, name):
+        return getattr(self._queue, name)
+
+    def prime(self, task_id, task_defn):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(task_defn)
+        self._tasks[task_id] = future
+
+    async def _fetch(self, task_id):
+        try:
+            return await self._queue.task(task_id)
+        except BaseException:
+            self._tasks.pop(task_id, None)
+            raise
+
+    async def task(self, task_id):
+        future = self._tasks.get(task_id)
+        if future is None:
+            future = self._tasks[task_id] = asyncio.ensure_future(self._fetch(task_id))
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        # Callers may edit the definition they get, so each gets a copy.
+        return deepcopy(await asyncio.shield(future))
+
+
+async def _list_task_group(queue, task_group_id, worker_type=None):
+    tasks = {}
+    query = {}
+    while True:
+        response = await queue.listTaskGroup(task_group_id, query=query)
+        for item in response["tasks"]:
+            task_defn = item["task"]
+            if "upstreamArtifacts" not in task_defn.get("payload", {}):
+                continue
+            if worker_type and task_defn.get("workerType") != worker_type:
+                continue
+            tasks[item["status"]["taskId"]] = task_defn
+        if not response.get("continuationToken"):
+            return tasks
+        query = {"continuationToken": response["continuationToken"]}
+
+
+async def _verify_cot_in_batch(template, opts, tmp, task_id, semaphore):
+    result = {"taskId": task_id, "status": "passed", "error": None}
+    async with semaphore:
+        start = time.monotonic()
+        task_dir = os.path.join(tmp, task_id)
+        context = Context()
+        context.session = template.session
+        context.config = dict(template.config)
+        context.config.update(
+            {
+                "work_dir": os.path.join(task_dir, "work"),
+                "artifact_dir": os.path.join(task_dir, "artifacts"),
+                "task_log_dir": os.path.join(task_dir, "artifacts", "public", "logs"),
+            }
+        )
+        context.credentials = template.credentials
+        context.queue = template.queue
+        context.download_cache = template.download_cache
+        context.share_projects(template)
+        try:
+            context.task = await retry_get_task_definition(context.queue, task_id, exception=CoTError)
+            cot = ChainOfTrust(context, opts.task_type, task_id=task_id)
+            await verify_chain_of_trust(cot, check_task=opts.no_check_task is False)
+        except Exception as exc:
+            log.error("{}: chain of trust verification failed: {}".format(task_id, exc))
+            result.update({"status": "failed", "error": str(exc)})
+        result["seconds"] = round(time.monotonic() - start, 3)
+    return result
+
+
+async def _async_verify_cot_batch(opts, tmp):
+    start = time.monotonic()
+    async with scriptworker_session() as session:
+        template = Context()
+        template.session = session
+        template.config = dict(deepcopy(DEFAULT_CONFIG))
+        template.credentials = read_worker_creds()
+        queue = template.queue or Queue(session=session, options={"rootUrl": template.config["taskcluster_root_url"]})
+        template.queue = _TaskDefinitionCache(queue)
+        template.download_cache = DownloadCache(os.path.join(tmp, "cache"))
+        template.config.update({"cot_product": opts.cot_product, "verify_cot_signature": opts.verify_sigs})
+        template.config = apply_product_config(template.config)
+        if os.environ.get("SCRIPTWORKER_GITHUB_OAUTH_TOKEN"):
+            template.config["github_oauth_token"] = os.environ.get("SCRIPTWORKER_GITHUB_OAUTH_TOKEN")
+        await template.populate_projects()
+        task_ids = list(opts.task_id)
+        if opts.task_group_id:
+            group_tasks = await _list_task_group(template.queue, opts.task_group_id, worker_type=opts.worker_type)
+            for task_id, task_defn in group_tasks.items():
+                template.queue.prime(task_id, task_defn)
+            task_ids.extend(task_id for task_id in group_tasks if task_id not in task_ids)
+        log.info("Verifying the chain of trust of {} tasks, {} at a time".format(len(task_ids), opts.concurrency))
+        semaphore = asyncio.Semaphore(opts.concurrency)
+        results = await asyncio.gather(*[_verify_cot_in_batch(template, opts, tmp, task_id, semaphore) for task_id in task_ids])
+    failed = [result for result in results if result["status"] == "failed"]
+    report = {
+        "summary": {
+            "total": len(results),
+            "passed": len(results) - len(failed),
+            "failed": len(failed),
+            "seconds": round(time.monotonic() - start, 3),
+        },
+        "tasks": results,
+    }
+    log.info("Chain of trust report:\n{}".format(format_json(report)))
+    if opts.report:
+        write_to_file(opts.report, report, file_type="json")
+    if failed:
+        raise CoTError("{} of {} tasks failed chain of trust verification: {}".format(len(failed), len(results), ", ".join(r["taskId"] for r in failed)))
+    return report
+
+
 def verify_cot_cmdln(args=None, event_loop=None):
     """Test the chain of trust from the commandline, for debugging purposes.
 
@@ -2121,19 +2401,34 @@ but does run the other tests in `scriptworker.cot.verify.verify_chain_of_trust`.
 
 This is helpful in debugging chain of trust changes or issues.
 
+To audit several tasks, pass several `task_id`s, or a `--task-group-id` to
+test all of its scriptworker tasks (optionally only those of `--worker-type`).
+They're tested `--concurrency` at a time, sharing task definitions, downloads
+and projects.yml, and a summary with per-task timings is logged, and written to
+`--report` if set.
+
 To use, first either set your taskcluster creds in your env http://bit.ly/2eDMa6N
 or in the CREDS_FILES http://bit.ly/2fVMu0A
 
 If you are verifying against a private github repo, please also set in environment
 SCRIPTWORKER_GITHUB_OAUTH_TOKEN to an OAUTH token with read permissions to the repo""")
-    parser.add_argument("task_id", help="the task id to test")
+    parser.add_argument("task_id", help="the task id(s) to test", nargs="*")
     parser.add_argument("--task-type", help="the task type to test", choices=sorted(get_valid_task_types().keys()), required=True)
+    parser.add_argument("--task-group-id", help="also test the scriptworker tasks of this task group")
+    parser.add_argument("--worker-type", help="only test the tasks of the task group with this workerType")
+    parser.add_argument("--concurrency", help="the number of tasks to test at once", type=int, default=10)
+    parser.add_argument("--report", help="write a json report of the results to this path")
     parser.add_argument("--cleanup", help="clean up the temp dir afterwards", dest="cleanup", action="store_true", default=False)
     parser.add_argument("--cot-product", help="the product type to test", default="firefox")
     parser.add_argument("--verify-sigs", help="enable signature verification", action="store_true", default=False)
     parser.add_argument("--verbose", "-v", help="enable debug logging", action="store_true", default=False)
     parser.add_argument("--no-check-task", help="skip verifying the taskId's cot status", action="store_true", default=False)
     opts = parser.parse_args(args)
+    if not opts.task_id and not opts.task_group_id:
+        parser.error("specify a task_id or --task-group-id")
+    if opts.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    batch = len(opts.task_id) != 1 or opts.task_group_id or opts.report
     tmp = tempfile.mkdtemp()
     log = logging.getLogger("scriptworker")
     level = logging.DEBUG if opts.verbose else logging.INFO
@@ -2143,7 +2438,11 @@ SCRIPTWORKER_GITHUB_OAUTH_TOKEN to an OAUTH token with read permissions to the r
     if not opts.cleanup:
         log.info("Artifacts will be in {}".format(tmp))
     try:
-        event_loop.run_until_complete(_async_verify_cot_cmdln(opts, tmp))
+        if batch:
+            event_loop.run_until_complete(_async_verify_cot_batch(opts, tmp))
+        else:
+            opts.task_id = opts.task_id[0]
+            event_loop.run_until_complete(_async_verify_cot_cmdln(opts, tmp))
     finally:
         if opts.cleanup:
             rm(tmp)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""Disk space admission checks.
+
+A task that runs out of disk fails late, after its downloads or its task
+script already ran.  ``DiskSpaceMonitor`` records how much space recent tasks
+used, and before each claim checks that the free space covers the largest of
+them plus ``min_free_disk_mb``.  If it doesn't, it runs the evictors (e.g.
+waiting for the trash to be deleted) and checks again.  A ``min_free_disk_mb``
+of 0 turns the check off.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+from collections import deque
+from typing import Callable, Deque, List, Optional, Sequence
+
+from scriptworker.metrics import registry
+
+log = logging.getLogger(__name__)
+
+
+def disk_usage_of(path: str) -> int:
+    """Return the bytes allocated to the files under ``path``.
+
+    Args:
+        path (str): the directory to measure.
+
+    Returns:
+        int: the allocated bytes, or 0 if ``path`` doesn't exist.
+
+    """
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += disk_usage_of(entry.path)
+            else:
+                stat_result = entry.stat(follow_symlinks=False)
+                # st_blocks counts 512 byte blocks, so sparse files count for what they use.
+                total += getattr(stat_result, "st_blocks", 0) * 512 or stat_result.st_size
+        except OSError:
+            continue
+    return total
+
+
+# DiskSpaceMonitor {{{1
+class DiskSpaceMonitor(object):
+    """Estimate the disk space a task needs, and check for it before claiming.
+
+    Attributes:
+        paths (list): the directories tasks use, e.g. ``work_dir`` and ``artifact_dir``.
+        min_free_bytes (int): the free space to keep on top of the estimate.
+        evictors (list): callables that free up space; they run in a thread.
+        out_of_space (bool): True once a check failed even after eviction.
+
+    """
+
+    def __init__(self, paths: Sequence[str], min_free_bytes: int = 0, history: int = 10, evictors: Optional[List[Callable[[], None]]] = None) -> None:
+        """Initialize DiskSpaceMonitor.
+
+        Args:
+            paths (list): the directories tasks use.
+            min_free_bytes (int, optional): the free space to keep on top of
+                the estimate.  Defaults to 0.
+            history (int, optional): how many recent tasks the estimate is
+                based on.  Defaults to 10.
+            evictors (list, optional): callables that free up space.  They run
+                in a thread, in order, until there's enough space.
+
+        """
+        self.paths = list(paths)
+        self.min_free_bytes = min_free_bytes
+        self.evictors = list(evictors or [])
+        self.out_of_space = False
+        self._usage: Deque[int] = deque(maxlen=history)
+
+    def record_task_usage(self) -> int:
+        """Measure and remember the space the current task used.
+
+        Call this at the end of a task, before its directories are cleaned up.
+        This walks the directories, so run it in a thread.
+
+        Returns:
+            int: the bytes used.
+
+        """
+        used = sum(disk_usage_of(path) for path in self.paths)
+        self._usage.append(used)
+        registry.observe("task_disk_usage_bytes", used, buckets=tuple(2**power for power in range(20, 41, 2)))
+        return used
+
+    def required_bytes(self) -> int:
+        """int: the free space the next task needs."""
+        return max(self._usage, default=0) + self.min_free_bytes
+
+    def free_bytes(self) -> Optional[int]:
+        """int: the free space on the fullest filesystem holding ``paths``, or None if none of them exist yet."""
+        free = []
+        for path in self.paths:
+            try:
+                free.append(shutil.disk_usage(path).free)
+            except FileNotFoundError:
+                continue
+        return min(free, default=None)
+
+    def check(self) -> bool:
+        """Check the free space and publish the headroom metrics.
+
+        Returns:
+            bool: True if there's enough free space for another task.
+
+        """
+        free = self.free_bytes()
+        if free is None:
+            # Nothing to measure; the directories get created when a task runs.
+            return True
+        required = self.required_bytes()
+        registry.set("disk_free_bytes", free)
+        registry.set("disk_headroom_bytes", free - required)
+        return free >= required
+
+    async def ensure_space(self) -> bool:
+        """Make sure there's space for another task, evicting if needed.
+
+        Sets ``out_of_space`` if there isn't enough even after eviction.
+
+        Returns:
+            bool: True if there's enough free space for another task.
+
+        """
+        if self.check():
+            return True
+        loop = asyncio.get_running_loop()
+        for evictor in self.evictors:
+            log.warning("Only {} bytes free; {} needed.  Evicting with {}".format(self.free_bytes(), self.required_bytes(), evictor))
+            registry.inc("disk_evictions_total")
+            await loop.run_in_executor(None, evictor)
+            if self.check():
+                return True
+        log.error("Only {} bytes free, and {} are needed for the next task!".format(self.free_bytes(), self.required_bytes()))
+        registry.inc("disk_space_exhausted_total")
+        self.out_of_space = True
+        return False
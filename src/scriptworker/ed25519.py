@@ -3,6 +3,8 @@
 
 Attributes:
     log (logging.Logger): the log object for the module
+    ed25519_keys (Ed25519Keys): the parsed keys scriptworker signs and
+        verifies with.
 
 """
 
@@ -10,8 +12,10 @@ import argparse
 import base64
 import functools
 import logging
+import os
 import sys
 from binascii import Error as Base64Error
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union, cast
 
 from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
 from cryptography.hazmat.primitives import serialization
@@ -40,7 +44,7 @@ def ed25519_private_key_from_string(string):
         raise ScriptWorkerEd25519Error("Can't create Ed25519PrivateKey: {}!".format(str(exc)))
 
 
-def ed25519_public_key_from_string(string):
+def ed25519_public_key_from_string(string: str) -> Ed25519PublicKey:
     """Create an ed25519 public key from ``string``, which is a seed.
 
     Args:
@@ -110,7 +114,7 @@ def ed25519_public_key_to_string(key):
     return base64.b64encode(key.public_bytes(encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw), None).decode("utf-8")
 
 
-def verify_ed25519_signature(public_key, contents, signature, message):
+def verify_ed25519_signature(public_key: Ed25519PublicKey, contents: bytes, signature: bytes, message: str) -> None:
     """Verify that ``signature`` comes from ``public_key`` and ``contents``.
 
     Args:
@@ -129,6 +133,159 @@ def verify_ed25519_signature(public_key, contents, signature, message):
         raise ScriptWorkerEd25519Error(message % {"exc": str(exc)})
 
 
+# Ed25519Keys {{{1
+class Ed25519Keys(object):
+    """Parse ed25519 keys once, rather than once per signature.
+
+    The private key is read from disk on first use, and again only when the
+    file changes; public keys are parsed once per seed.  Both are safe to use
+    from executor threads: at worst, two threads parse the same key.
+
+    It also remembers which seed last verified a signature of each worker
+    implementation, so ``ordered_seeds`` can try that one first.
+
+    """
+
+    def __init__(self) -> None:
+        """Initialize Ed25519Keys."""
+        self._private_keys: Dict[str, Tuple[Tuple[int, int, int], Ed25519PrivateKey]] = {}
+        self._public_keys: Dict[str, Union[Ed25519PublicKey, str]] = {}
+        self._last_verified: Dict[str, str] = {}
+
+    def private_key(self, path: str) -> Ed25519PrivateKey:
+        """Get the private key in ``path``.
+
+        The file is stat'ed on every call, and reloaded if its mtime, size or
+        inode changed.
+
+        Args:
+            path (str): the file path to the base64-encoded key seed.
+
+        Returns:
+            Ed25519PrivateKey: the private key.
+
+        Raises:
+            ScriptWorkerEd25519Error: if the key can't be read.
+
+        """
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            self._private_keys.pop(path, None)
+            return cast(Ed25519PrivateKey, ed25519_private_key_from_file(path))
+        stat_key = (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+        cached = self._private_keys.get(path)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+        key = cast(Ed25519PrivateKey, ed25519_private_key_from_file(path))
+        log.debug("Loaded ed25519 private key {}".format(path))
+        self._private_keys[path] = (stat_key, key)
+        return key
+
+    def public_key(self, seed: str) -> Ed25519PublicKey:
+        """Get the public key of ``seed``; see ``ed25519_public_key_from_string``.
+
+        Raises:
+            ScriptWorkerEd25519Error: if ``seed`` isn't a valid key.
+
+        """
+        key = self._public_keys.get(seed)
+        if key is None:
+            try:
+                key = ed25519_public_key_from_string(seed)
+            except ScriptWorkerEd25519Error as exc:
+                key = str(exc)
+            self._public_keys[seed] = key
+        if isinstance(key, str):
+            raise ScriptWorkerEd25519Error(key)
+        return key
+
+    def load_public_keys(self, public_keys: Mapping[str, Sequence[str]]) -> None:
+        """Parse the public keys of every worker implementation.
+
+        Invalid keys are logged rather than raised, so they fail the
+        verifications that use them, as they would without preloading.
+
+        Args:
+            public_keys (dict): the seeds per worker implementation, like
+                ``config["ed25519_public_keys"]``.
+
+        """
+        for worker_impl, seeds in public_keys.items():
+            for seed in seeds:
+                try:
+                    self.public_key(seed)
+                except ScriptWorkerEd25519Error as exc:
+                    log.warning("Invalid {} ed25519 public key {}: {}".format(worker_impl, seed, str(exc)))
+
+    def sign(self, path: str, contents: bytes) -> bytes:
+        """Sign ``contents`` with the private key in ``path``.
+
+        Args:
+            path (str): the file path to the base64-encoded key seed.
+            contents (bytes): the contents to sign.
+
+        Returns:
+            bytes: the signature.
+
+        Raises:
+            ScriptWorkerEd25519Error: if the key can't be read.
+
+        """
+        return self.private_key(path).sign(contents)
+
+    def verify(self, seed: str, contents: bytes, signature: bytes, message: str, worker_impl: Optional[str] = None) -> None:
+        """Verify that ``signature`` comes from the key of ``seed`` and ``contents``.
+
+        Args:
+            seed (str): the base64-encoded public key seed.
+            contents (bytes): the contents that was signed
+            signature (bytes): the signature to verify
+            message (str): the error message to raise.
+            worker_impl (str, optional): the worker implementation that
+                signed ``contents``.  If set, a good signature makes ``seed``
+                the first of ``ordered_seeds(worker_impl, ...)``.  Defaults to
+                None.
+
+        Raises:
+            ScriptWorkerEd25519Error: on an invalid key or signature.
+
+        """
+        verify_ed25519_signature(self.public_key(seed), contents, signature, message)
+        if worker_impl is not None:
+            self._last_verified[worker_impl] = seed
+
+    def ordered_seeds(self, worker_impl: str, seeds: Sequence[str]) -> List[str]:
+        """Order ``seeds`` to try the one that last verified ``worker_impl`` first.
+
+        Workers usually sign with the newest of several valid keys, so this
+        saves a failed verification per signature while older keys are still
+        listed.
+
+        Args:
+            worker_impl (str): the worker implementation.
+            seeds (list): its public key seeds, e.g. from
+                ``config["ed25519_public_keys"]``.
+
+        Returns:
+            list: ``seeds``, with the last good one first.
+
+        """
+        last = self._last_verified.get(worker_impl)
+        if last is None or last not in seeds:
+            return list(seeds)
+        return [last] + [seed for seed in seeds if seed != last]
+
+    def clear(self) -> None:
+        """Forget the parsed keys, and which ones last verified."""
+        self._private_keys.clear()
+        self._public_keys.clear()
+        self._last_verified.clear()
+
+
+ed25519_keys = Ed25519Keys()
+
+
 # verify_ed25519_signature_cmdln {{{1
 def verify_ed25519_signature_cmdln(args=None, exception=SystemExit):
     """Verify an ed25519 signature from the command line.
@@ -162,7 +319,7 @@ default to ``config['ed25519_public_keys']``.""")
     for key_type, seeds in pubkeys.items():
         for seed in seeds:
             try:
-                verify_ed25519_signature(ed25519_public_key_from_string(seed), contents, signature, "didn't work with {}".format(seed))
+                ed25519_keys.verify(seed, contents, signature, "didn't work with {}".format(seed))
                 log.info("Verified good with {} seed {} !".format(key_type, seed))
                 sys.exit(0)
             except ScriptWorkerEd25519Error:
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 """scriptworker exceptions."""
 
-from typing import Any
+from typing import Any, Optional
 
 from scriptworker.constants import STATUSES
 
@@ -25,11 +25,33 @@ class ScriptWorkerRetryException(ScriptWorkerException):
 
     Attributes:
         exit_code (int): this is set to 4 (resource-unavailable)
+        status (int): the HTTP status of the response that failed, if any.
 
     """
 
     exit_code = STATUSES["resource-unavailable"]
 
+    def __init__(self, *args: Any, status: Optional[int] = None):
+        """Initialize ScriptWorkerRetryException.
+
+        Args:
+            *args: These are passed on via super().
+            status (int, optional): the HTTP status of the response that
+                failed.  Defaults to None.
+
+        """
+        self.status = status
+        super(ScriptWorkerRetryException, self).__init__(*args)
+
+
+class CircuitOpenError(ScriptWorkerRetryException):
+    """A call was rejected because its host's circuit breaker is open.
+
+    Attributes:
+        exit_code (int): this is set to 4 (resource-unavailable)
+
+    """
+
 
 class ScriptWorkerTaskException(ScriptWorkerException):
     """Scriptworker task error.
@@ -83,16 +105,20 @@ class BaseDownloadError(ScriptWorkerTaskException):
 
     Attributes:
         exit_code (int): this is set to 4 (resource-unavailable).
+        status (int): the HTTP status of the response that failed, if any.
 
     """
 
-    def __init__(self, msg: str):
+    def __init__(self, msg: str, status: Optional[int] = None):
         """Initialize Download404.
 
         Args:
             msg (string): the error message
+            status (int, optional): the HTTP status of the response that
+                failed.  Defaults to None.
 
         """
+        self.status = status
         super(BaseDownloadError, self).__init__(msg, exit_code=STATUSES["resource-unavailable"])
 
 
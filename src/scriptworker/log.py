@@ -12,7 +12,8 @@ import logging.handlers
 import os
 from asyncio.streams import StreamReader
 from contextlib import contextmanager
-from typing import IO, Any, Generator, Iterator, Optional, Sequence, Union  # noqa
+from contextvars import ContextVar
+from typing import IO, Any, Generator, Iterator, Optional, Sequence, Tuple, Union  # noqa
 
 from scriptworker.utils import makedirs, to_unicode
 
@@ -132,12 +133,26 @@ def get_log_filehandle(context: Any) -> Iterator[IO[str]]:
         yield filehandle
 
 
+class _ContextFilter(logging.Filter):
+    """Only pass records logged inside the ``contextual_log_handler`` block of this filter."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self in _active_context_filters.get()
+
+
+_active_context_filters: ContextVar[Tuple[_ContextFilter, ...]] = ContextVar("scriptworker_active_context_filters", default=())
+
+
 @contextmanager
 def contextual_log_handler(
     context: Any, path: str, log_obj: Optional[logging.Logger] = None, level: int = logging.DEBUG, formatter: Optional[logging.Formatter] = None
 ) -> Generator[None, None, None]:
     """Add a short-lived log with a contextmanager for cleanup.
 
+    Only records logged inside the block go to ``path``, including the ones
+    from asyncio tasks started in it, but not the ones from other tasks
+    running concurrently, e.g. another chain of trust verification.
+
     Args:
         context (scriptworker.context.Context): the scriptworker context
         path (str): the path to the log file to create
@@ -158,7 +173,13 @@ def contextual_log_handler(
     contextual_handler = logging.FileHandler(path, encoding="utf-8")
     contextual_handler.setLevel(level)
     contextual_handler.setFormatter(formatter)
+    contextual_filter = _ContextFilter()
+    contextual_handler.addFilter(contextual_filter)
+    token = _active_context_filters.set(_active_context_filters.get() + (contextual_filter,))
     log_obj.addHandler(contextual_handler)
-    yield
-    contextual_handler.close()
-    log_obj.removeHandler(contextual_handler)
+    try:
+        yield
+    finally:
+        log_obj.removeHandler(contextual_handler)
+        contextual_handler.close()
+        _active_context_filters.reset(token)
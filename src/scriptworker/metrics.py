@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+"""Scriptworker runtime metrics.
+
+The worker keeps a single in-process ``MetricsRegistry`` with counters,
+gauges, and running histograms. Each claimed task also gets a ``TaskTimings``
+object, which records per-stage durations and the change in the byte, retry,
+and cache counters over the life of the task. The latter is written to
+``task_log_dir/timings.json`` so it is uploaded as ``public/logs/timings.json``.
+
+If ``metrics_port`` is set, the registry is also served in the Prometheus text
+exposition format from ``http://metrics_host:metrics_port/metrics``.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+    DEFAULT_BUCKETS (tuple): the default histogram bucket upper bounds, in seconds.
+    TASK_COUNTERS (tuple): the registry counters that are reported per task.
+    METRICS_PREFIX (str): the prefix added to every exported metric name.
+    registry (MetricsRegistry): the process-wide metrics registry.
+
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from scriptworker.trace import span
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 3600.0)
+TASK_COUNTERS = ("download_bytes_total", "upload_bytes_total", "retries_total", "cache_hits_total")
+METRICS_PREFIX = "scriptworker_"
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels_key(labels: Dict[str, Any]) -> LabelsKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+# Histogram {{{1
+class Histogram(object):
+    """A running histogram with fixed bucket upper bounds.
+
+    Attributes:
+        buckets (tuple): the sorted bucket upper bounds.
+        counts (list): the number of observations per bucket; the last entry
+            counts observations above the largest bound.
+        count (int): the total number of observations.
+        sum (float): the sum of all observations.
+
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """Initialize Histogram.
+
+        Args:
+            buckets (list, optional): the bucket upper bounds. Defaults to
+                ``DEFAULT_BUCKETS``.
+
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add ``value`` to the histogram."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> List[Tuple[float, int]]:
+        """Return ``(upper_bound, cumulative_count)`` pairs, ending with ``+Inf``."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Estimate the ``percent`` percentile from the bucket counts.
+
+        The estimate interpolates linearly inside the matching bucket, so it is
+        only as precise as the bucket bounds.
+
+        Args:
+            percent (float): the percentile to estimate, 0-100.
+
+        Returns:
+            float: the estimate, or None if nothing has been observed.
+
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        lower = 0.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1] if self.buckets else None
+
+
+# MetricsRegistry {{{1
+class MetricsRegistry(object):
+    """Process-wide counters, gauges, and histograms, keyed by name and labels."""
+
+    def __init__(self) -> None:
+        """Initialize MetricsRegistry."""
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelsKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelsKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelsKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Increment counter ``name`` by ``value``."""
+        key = _labels_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        """Set gauge ``name`` to ``value``."""
+        with self._lock:
+            self.gauges.setdefault(name, {})[_labels_key(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels: Any) -> None:
+        """Add ``value`` to histogram ``name``, creating it with ``buckets`` if needed."""
+        key = _labels_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def get_counter(self, name: str, **labels: Any) -> float:
+        """Return the value of counter ``name`` with exactly ``labels``."""
+        return self.counters.get(name, {}).get(_labels_key(labels), 0)
+
+    def counter_total(self, name: str) -> float:
+        """Return the sum of counter ``name`` across all labels."""
+        with self._lock:
+            return sum(self.counters.get(name, {}).values())
+
+    def get_histogram(self, name: str, **labels: Any) -> Optional[Histogram]:
+        """Return histogram ``name`` with exactly ``labels``, if it exists."""
+        return self.histograms.get(name, {}).get(_labels_key(labels))
+
+    def reset(self) -> None:
+        """Drop all metrics.  Mainly for tests."""
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+# TaskTimings {{{1
+class TaskTimings(object):
+    """Per-task stage durations and counter deltas.
+
+    Attributes:
+        start (float): the ``time.monotonic()`` value at creation.
+        stages (dict): maps stage name to the total seconds spent in it.
+
+    """
+
+    def __init__(self, metrics: Optional[MetricsRegistry] = None) -> None:
+        """Initialize TaskTimings.
+
+        Args:
+            metrics (MetricsRegistry, optional): the registry to read counters
+                from.  Defaults to ``registry``.
+
+        """
+        self.metrics = metrics or registry
+        self.start = time.monotonic()
+        self.stages: Dict[str, float] = {}
+        self._baseline = {name: self.metrics.counter_total(name) for name in TASK_COUNTERS}
+
+    def record(self, stage: str, seconds: float) -> None:
+        """Add ``seconds`` to ``stage``."""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def counters(self) -> Dict[str, float]:
+        """Return how much each of ``TASK_COUNTERS`` has grown since creation."""
+        return {name: self.metrics.counter_total(name) - baseline for name, baseline in self._baseline.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the timings as a json-serializable dict."""
+        return {
+            "elapsed": round(time.monotonic() - self.start, 6),
+            "stages": {stage: round(seconds, 6) for stage, seconds in sorted(self.stages.items())},
+            "counters": self.counters(),
+        }
+
+
+# timed {{{1
+@contextmanager
+def timed(context: Any, stage: str) -> Iterator[None]:
+    """Time the enclosed block as ``stage``.
+
+    The duration goes into the ``stage_duration_seconds`` histogram, and into
+    ``context.task_timings`` if the context has one.  The block is also traced
+    as a span named ``stage``.
+
+    Args:
+        context (scriptworker.context.Context): the scriptworker context, or None.
+        stage (str): the name of the stage.
+
+    """
+    attributes = {}
+    task_id = getattr(context, "task_id", None)
+    if task_id:
+        attributes["taskId"] = task_id
+    start = time.monotonic()
+    try:
+        with span(stage, **attributes):
+            yield
+    finally:
+        elapsed = time.monotonic() - start
+        registry.observe("stage_duration_seconds", elapsed, stage=stage)
+        task_timings = getattr(context, "task_timings", None)
+        if task_timings is not None:
+            task_timings.record(stage, elapsed)
+
+
+# write_task_timings {{{1
+def write_task_timings(context: Any) -> Optional[str]:
+    """Write ``context.task_timings`` to ``task_log_dir/timings.json``.
+
+    Args:
+        context (scriptworker.context.Context): the scriptworker context.
+
+    Returns:
+        str: the path written, or None if there are no timings.
+
+    """
+    if context.task_timings is None:
+        return None
+    contents = {"taskId": context.task_id, "runId": (context.claim_task or {}).get("runId")}
+    contents.update(context.task_timings.to_dict())
+    # This module can't use ``scriptworker.utils``, which imports it.
+    os.makedirs(context.config["task_log_dir"], exist_ok=True)
+    path = os.path.join(context.config["task_log_dir"], "timings.json")
+    with open(path, "w") as fh:
+        json.dump(contents, fh, indent=2, sort_keys=True)
+    log.info("Task timings: {}".format(contents["stages"]))
+    return path
+
+
+# render_prometheus {{{1
+def _format_labels(labels: LabelsKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels)
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ""
+    escaped = [(key, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for key, value in items]
+    return "{" + ",".join('{}="{}"'.format(key, value) for key, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(metrics: Optional[MetricsRegistry] = None) -> str:
+    """Render the registry in the Prometheus text exposition format.
+
+    Args:
+        metrics (MetricsRegistry, optional): the registry to render.  Defaults
+            to ``registry``.
+
+    Returns:
+        str: the exposition text.
+
+    """
+    metrics = metrics or registry
+    lines = []
+    with metrics._lock:
+        for metric_type, collection in (("counter", metrics.counters), ("gauge", metrics.gauges)):
+            for name in sorted(collection):
+                full_name = METRICS_PREFIX + name
+                lines.append("# TYPE {} {}".format(full_name, metric_type))
+                for labels, value in sorted(collection[name].items()):
+                    lines.append("{}{} {}".format(full_name, _format_labels(labels), _format_value(value)))
+        for name in sorted(metrics.histograms):
+            full_name = METRICS_PREFIX + name
+            lines.append("# TYPE {} histogram".format(full_name))
+            for labels, hist in sorted(metrics.histograms[name].items(), key=lambda item: item[0]):
+                for bound, count in hist.cumulative_counts():
+                    lines.append("{}_bucket{} {}".format(full_name, _format_labels(labels, ("le", _format_value(float(bound)))), count))
+                lines.append("{}_sum{} {}".format(full_name, _format_labels(labels), _format_value(hist.sum)))
+                lines.append("{}_count{} {}".format(full_name, _format_labels(labels), hist.count))
+    return "\n".join(lines) + "\n"
+
+
+# start_metrics_server {{{1
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render_prometheus(), content_type="text/plain", headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_metrics_server(context: Any) -> Optional[web.AppRunner]:
+    """Serve the metrics registry on ``metrics_host``:``metrics_port``.
+
+    Args:
+        context (scriptworker.context.Context): the scriptworker context.
+
+    Returns:
+        aiohttp.web.AppRunner: the running server, to be cleaned up on
+            shutdown, or None if ``metrics_port`` is 0.
+
+    """
+    port = context.config["metrics_port"]
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, context.config["metrics_host"], port)
+    await site.start()
+    log.info("Serving metrics on http://{}:{}/metrics".format(context.config["metrics_host"], port))
+    return runner
+
+
+# monitor_event_loop_lag {{{1
+async def monitor_event_loop_lag(interval: float = 1.0) -> None:
+    """Measure how late the event loop wakes us up, forever.
+
+    Each lateness sample is stored in the ``event_loop_lag_seconds`` histogram
+    and the ``event_loop_lag_last_seconds`` gauge.  A lagging loop delays
+    reclaims and downloads, so this is worth alerting on.
+
+    Args:
+        interval (float, optional): the seconds between samples. Defaults to 1.
+
+    """
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        lag = max(time.monotonic() - start - interval, 0.0)
+        registry.set("event_loop_lag_last_seconds", lag)
+        registry.observe("event_loop_lag_seconds", lag)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""The ``projects.yml`` model.
+
+``projects.yml`` maps each project name to its CI configuration::
+
+    mozilla-central:
+        repo: https://hg.mozilla.org/mozilla-central
+        repo_type: hg
+        access: scm_level_3
+    fenix:
+        repo: https://github.com/mozilla-mobile/fenix
+        repo_type: git
+        branches:
+            - name: main
+              level: 3
+
+``Projects`` freezes it once per fetch, and indexes the repo urls and scm
+levels, so looking a project up doesn't scan or copy the whole file.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+
+"""
+
+import logging
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from immutabledict import immutabledict
+
+log = logging.getLogger(__name__)
+
+# Marks the trie node of a full repo url.
+_PROJECT = ""
+
+
+def _freeze(values: Any) -> Any:
+    if isinstance(values, Mapping):
+        return immutabledict({key: _freeze(value) for key, value in values.items()})
+    if isinstance(values, (list, tuple)):
+        return tuple(_freeze(value) for value in values)
+    return values
+
+
+def _split_url(url: str) -> List[str]:
+    # Every segment gets a "/" suffix, so no segment is the _PROJECT key.
+    return [part + "/" for part in url.split("/")]
+
+
+def _find_scm_level(config: Mapping[str, Any]) -> Optional[str]:
+    if config["repo_type"] == "hg":
+        return str(config["access"].replace("scm_level_", ""))
+    elif config["repo_type"] == "git":
+        # TODO: we should be using the branch that the task is actually
+        # being run on
+        default_branch = config.get("default_branch", "main")
+        for branch in config["branches"]:
+            if branch["name"] == default_branch:
+                return str(branch["level"])
+    return None
+
+
+# Projects {{{1
+class Projects(Mapping[str, Any]):
+    """The frozen contents of ``projects.yml``, indexed by repo url.
+
+    It's a read-only mapping of project names to their (frozen) config.
+
+    """
+
+    def __init__(self, projects: Mapping[str, Any]) -> None:
+        """Initialize Projects.
+
+        Args:
+            projects (dict): the contents of ``projects.yml``.
+
+        """
+        self._projects: "immutabledict[str, Any]" = _freeze(projects)
+        self._repo_trie: Dict[str, Any] = {}
+        self._levels: Dict[str, Optional[str]] = {}
+        for order, (project, config) in enumerate(self._projects.items()):
+            if not isinstance(config, Mapping):
+                continue
+            if isinstance(config.get("repo"), str):
+                node = self._repo_trie
+                for part in _split_url(config["repo"]):
+                    node = node.setdefault(part, {})
+                node.setdefault(_PROJECT, (order, project))
+            try:
+                self._levels[project] = _find_scm_level(config)
+            except (AttributeError, KeyError, TypeError):
+                # get_scm_level raises this on lookup
+                pass
+
+    def __getitem__(self, project: str) -> Any:
+        """Return the frozen config of ``project``."""
+        return self._projects[project]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the project names, in ``projects.yml`` order."""
+        return iter(self._projects)
+
+    def __len__(self) -> int:
+        """Return the number of projects."""
+        return len(self._projects)
+
+    def __repr__(self) -> str:
+        """Summarize the projects."""
+        return "<Projects {}>".format(len(self._projects))
+
+    def find_project(self, source_url: str) -> Optional[str]:
+        """Find the project whose repo contains ``source_url``.
+
+        A repo contains ``source_url`` if it's equal to it, or a path prefix of
+        it.  If several repos do, the first project in ``projects.yml`` wins.
+
+        Args:
+            source_url (str): the url to find the project of.
+
+        Returns:
+            str: the project name, or None if no repo contains ``source_url``.
+
+        """
+        best: Optional[Tuple[int, str]] = None
+        node = self._repo_trie
+        for part in _split_url(source_url):
+            if part not in node:
+                break
+            node = node[part]
+            if _PROJECT in node and (best is None or node[_PROJECT] < best):
+                best = node[_PROJECT]
+        return best[1] if best else None
+
+    def get_scm_level(self, project: str) -> Optional[str]:
+        """Get the scm level of a project.
+
+        This is the ``access`` level of hg projects, and the level of the
+        ``default_branch`` of git projects.
+
+        Args:
+            project (str): the project name.
+
+        Returns:
+            str: the level, e.g. "3", or None if it isn't defined.
+
+        Raises:
+            KeyError: if ``project`` isn't in ``projects.yml``, or its config
+                is missing ``repo_type``, ``access`` or ``branches``.
+
+        """
+        if project in self._levels:
+            return self._levels[project]
+        return _find_scm_level(self._projects[project])
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""Prioritized download slots.
+
+``context.download_semaphore`` limits the number of concurrent downloads.
+When more downloads are waiting than there are slots, ``PrioritySemaphore``
+hands free slots out by download class: chain of trust metadata first, then
+mandatory artifacts, then optional ones.  Within a class, downloads go in
+the order they asked.
+
+The class of a download comes from ``download_priority``, which, like a
+tracing span, is inherited by the asyncio tasks started inside it::
+
+    with download_priority(OPTIONAL_DOWNLOAD):
+        future = asyncio.ensure_future(download_cot_artifact(chain, task_id, path))
+
+Each class can also be capped at a share of the slots, e.g. so optional
+artifacts can't take all of them.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+    COT_DOWNLOAD (str): the class of chain of trust metadata downloads.
+    MANDATORY_DOWNLOAD (str): the class of mandatory artifact downloads, and
+        the default.
+    OPTIONAL_DOWNLOAD (str): the class of optional artifact downloads.
+    DOWNLOAD_CLASSES (tuple): the download classes, most urgent first.
+
+"""
+
+import asyncio
+import logging
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from scriptworker.metrics import registry
+
+log = logging.getLogger(__name__)
+
+COT_DOWNLOAD = "cot"
+MANDATORY_DOWNLOAD = "mandatory"
+OPTIONAL_DOWNLOAD = "optional"
+DOWNLOAD_CLASSES = (COT_DOWNLOAD, MANDATORY_DOWNLOAD, OPTIONAL_DOWNLOAD)
+
+_download_priority: ContextVar[str] = ContextVar("scriptworker_download_priority", default=MANDATORY_DOWNLOAD)
+
+
+@contextmanager
+def download_priority(download_class: str) -> Iterator[None]:
+    """Set the download class for downloads started in this block.
+
+    Args:
+        download_class (str): one of ``DOWNLOAD_CLASSES``.
+
+    Raises:
+        ValueError: on an unknown ``download_class``.
+
+    """
+    if download_class not in DOWNLOAD_CLASSES:
+        raise ValueError("Unknown download class {}!".format(download_class))
+    token = _download_priority.set(download_class)
+    try:
+        yield
+    finally:
+        _download_priority.reset(token)
+
+
+# PrioritySemaphore {{{1
+class PrioritySemaphore(object):
+    """A semaphore that wakes its waiters by download class.
+
+    Use it like an ``asyncio.Semaphore``; the priority of each ``acquire``
+    comes from the surrounding ``download_priority``.
+
+    Attributes:
+        value (int): the number of slots.
+        class_limits (dict): the maximum slots per download class.  Classes
+            that aren't listed, or are 0, can use every slot.
+
+    """
+
+    def __init__(self, value: int, class_limits: Optional[Dict[str, int]] = None) -> None:
+        """Initialize PrioritySemaphore.
+
+        Args:
+            value (int): the number of slots.
+            class_limits (dict, optional): the maximum slots per download
+                class.  Defaults to None.
+
+        Raises:
+            ValueError: on an unknown download class in ``class_limits``.
+
+        """
+        for download_class in class_limits or {}:
+            if download_class not in DOWNLOAD_CLASSES:
+                raise ValueError("Unknown download class {}!".format(download_class))
+        self.value = value
+        self.class_limits = dict(class_limits or {})
+        self._free = value
+        self._in_use: "Counter[str]" = Counter()
+        # The waiters of each class, first come first served.  Cancelled
+        # waiters are skipped when they reach the front.
+        self._waiters: Dict[str, Deque["asyncio.Future[None]"]] = {download_class: deque() for download_class in DOWNLOAD_CLASSES}
+
+    def locked(self) -> bool:
+        """bool: True if there are no free slots."""
+        return self._free == 0
+
+    def _can_run(self, download_class: str) -> bool:
+        limit = self.class_limits.get(download_class)
+        return self._free > 0 and not (limit and self._in_use[download_class] >= limit)
+
+    def _take(self, download_class: str) -> None:
+        self._free -= 1
+        self._in_use[download_class] += 1
+        registry.set("download_slots_in_use", self._in_use[download_class], download_class=download_class)
+
+    def _wake(self) -> None:
+        for download_class in DOWNLOAD_CLASSES:
+            waiters = self._waiters[download_class]
+            while waiters and self._can_run(download_class):
+                future = waiters.popleft()
+                if not future.done():
+                    self._take(download_class)
+                    future.set_result(None)
+
+    async def acquire(self, download_class: Optional[str] = None) -> str:
+        """Wait for a slot.
+
+        Args:
+            download_class (str, optional): the download class.  Defaults to
+                the one from ``download_priority``.
+
+        Returns:
+            str: the download class the slot was taken for; pass it to
+                ``release``.
+
+        """
+        if download_class is None:
+            download_class = _download_priority.get()
+        if self._can_run(download_class):
+            self._take(download_class)
+            return download_class
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._waiters[download_class].append(future)
+        registry.inc("download_slot_waits_total", download_class=download_class)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.done():
+                # Left in the queue, and skipped by _wake.
+                future.cancel()
+            elif not future.cancelled():
+                # We got the slot, but were cancelled before we could use it.
+                self.release(download_class)
+            raise
+        return download_class
+
+    def release(self, download_class: str = MANDATORY_DOWNLOAD) -> None:
+        """Give a slot back, and hand it to the most urgent waiter.
+
+        Args:
+            download_class (str, optional): the value ``acquire`` returned.
+                Defaults to ``MANDATORY_DOWNLOAD``.
+
+        """
+        self._free += 1
+        self._in_use[download_class] -= 1
+        registry.set("download_slots_in_use", self._in_use[download_class], download_class=download_class)
+        self._wake()
+
+    async def __aenter__(self) -> None:
+        """Acquire a slot for the current ``download_priority``."""
+        await self.acquire()
+
+    async def __aexit__(self, *args: Any) -> None:
+        """Release the slot taken by ``__aenter__``."""
+        # download_priority blocks nest, so this is the class __aenter__ saw.
+        self.release(_download_priority.get())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""Compiled JSON schemas.
+
+Checking a schema and building its validator costs more than validating a
+task against it.  ``SchemaRegistry`` loads and compiles each schema file once
+per process, and recompiles it only when the file changes.
+
+Format checks (e.g. ``"format": "uri"``) are the slowest part of validation;
+compile with ``format_checks=False`` to skip them.
+
+This module should be largely standalone, like ``scriptworker.client``.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+    TASK_SCHEMA_PATH (str): the schema scriptworker validates claimed tasks
+        against.
+    schemas (SchemaRegistry): the registry shared by scriptworker and scripts.
+
+"""
+
+import logging
+import os
+from typing import Any, Dict, Iterator, Optional, Tuple, Type
+
+import jsonschema
+
+from scriptworker.constants import STATUSES
+from scriptworker.exceptions import ScriptWorkerTaskException
+from scriptworker.utils import load_json_or_yaml
+
+log = logging.getLogger(__name__)
+
+TASK_SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "data", "scriptworker_task_schema.json")
+
+
+# CompiledSchema {{{1
+class CompiledSchema(object):
+    """A JSON schema, checked once, with its validator.
+
+    Attributes:
+        schema (dict): the JSON schema.
+        format_checks (bool): whether ``format`` keywords are checked.
+        validator (jsonschema.protocols.Validator): the validator.
+
+    """
+
+    def __init__(self, schema: Dict[str, Any], format_checks: bool = True) -> None:
+        """Initialize CompiledSchema.
+
+        Args:
+            schema (dict): the JSON schema.
+            format_checks (bool, optional): whether to check ``format``
+                keywords.  Defaults to True.
+
+        Raises:
+            jsonschema.exceptions.SchemaError: if ``schema`` isn't a valid schema.
+
+        """
+        cls = jsonschema.validators.validator_for(schema)
+        cls.check_schema(schema)
+        self.schema = schema
+        self.format_checks = format_checks
+        self.validator = cls(schema, format_checker=cls.FORMAT_CHECKER if format_checks else None)
+
+    def iter_errors(self, data: Any) -> Iterator[jsonschema.exceptions.ValidationError]:
+        """Iterate over the validation errors of ``data``."""
+        yield from self.validator.iter_errors(data)
+
+    def validate(self, data: Any, name: str = "task") -> None:
+        """Validate ``data`` against the schema.
+
+        Args:
+            data (dict): the json to validate.
+            name (str, optional): the name of the json, for exception messages.
+                Defaults to "task".
+
+        Raises:
+            ScriptWorkerTaskException: on failure
+
+        """
+        error = jsonschema.exceptions.best_match(self.validator.iter_errors(data))
+        if error is not None:
+            raise ScriptWorkerTaskException("Can't validate {} schema!\n{}".format(name, str(error)), exit_code=STATUSES["malformed-payload"])
+
+
+# SchemaRegistry {{{1
+class SchemaRegistry(object):
+    """Load and compile schema files once, and again when they change."""
+
+    def __init__(self) -> None:
+        """Initialize SchemaRegistry."""
+        self._compiled: Dict[Tuple[str, bool], Tuple[Tuple[int, int, int], CompiledSchema]] = {}
+
+    def get(
+        self,
+        path: str,
+        format_checks: bool = True,
+        exception: Type[BaseException] = ScriptWorkerTaskException,
+        message: Optional[str] = None,
+    ) -> CompiledSchema:
+        """Get the compiled schema of a file.
+
+        The file is stat'ed on every call, and reloaded if its mtime, size or
+        inode changed.
+
+        Args:
+            path (str): the path to the json or yaml schema.
+            format_checks (bool, optional): whether to check ``format``
+                keywords.  Defaults to True.
+            exception (exception, optional): the exception to raise if the
+                file can't be read.  Defaults to ScriptWorkerTaskException.
+            message (str, optional): the message for ``exception``; see
+                ``load_json_or_yaml``.
+
+        Returns:
+            CompiledSchema: the compiled schema.
+
+        Raises:
+            Exception: as specified, if the file can't be read.
+
+        """
+        key = (os.path.abspath(path), format_checks)
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            self._compiled.pop(key, None)
+            stat_key = None
+        else:
+            stat_key = (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+            cached = self._compiled.get(key)
+            if cached is not None and cached[0] == stat_key:
+                return cached[1]
+        kwargs: Dict[str, Any] = {"is_path": True, "file_type": "yaml" if path.endswith((".yml", ".yaml")) else "json", "exception": exception}
+        if message is not None:
+            kwargs["message"] = message
+        compiled = CompiledSchema(load_json_or_yaml(path, **kwargs), format_checks=format_checks)
+        if stat_key is not None:
+            log.debug("Compiled schema {}".format(path))
+            self._compiled[key] = (stat_key, compiled)
+        return compiled
+
+    def clear(self) -> None:
+        """Forget the compiled schemas."""
+        self._compiled.clear()
+
+
+schemas = SchemaRegistry()
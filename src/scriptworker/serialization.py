@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""Pluggable JSON and YAML (de)serialization.
+
+Scriptworker parses task definitions, ``task-graph.json``, ``projects.yml``
+and ``.taskcluster.yml`` several times per task.  ``Serializer`` uses the
+accelerated backends when they're installed:
+
+* ``orjson`` for JSON (``pip install scriptworker[fast]``), and
+* PyYAML's libyaml bindings (``yaml.CSafeLoader``) for YAML,
+
+and falls back to the stdlib ``json`` module and the pure python
+``yaml.SafeLoader`` otherwise.
+
+Parsing a big document, like a decision task's ``task-graph.json``, creates
+millions of objects, and the cyclic garbage collector runs over and over while
+it does, though none of them can be garbage yet.  That costs more than the
+parsing itself, so ``loads_json`` pauses the collector for documents over
+``GC_PAUSE_THRESHOLD`` bytes.
+
+The accelerated backends are only used where they can't change the result:
+
+* a document ``orjson`` rejects (e.g. ``NaN``) is parsed again by ``json``,
+  so it either loads the same as before, or fails with ``json``'s error.
+  So is a document that may hold an integer wider than 64 bits, which some
+  ``orjson`` versions silently read as a float.
+* canonical JSON, i.e. anything that gets hashed or signed like the chain of
+  trust artifact, is always dumped by ``json.dumps(data, indent=2,
+  sort_keys=True)``, byte for byte as before.  Only non-canonical dumps, like
+  the ``task.json`` written for the task script, use ``orjson``.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+    JSON_BACKENDS (tuple): the JSON backends, fastest first.
+    YAML_BACKENDS (tuple): the YAML backends, fastest first.
+    GC_PAUSE_THRESHOLD (int): the document size, in characters or bytes, over
+        which the garbage collector is paused while parsing json.
+    serializer (Serializer): the serializer scriptworker uses.
+
+"""
+
+import gc
+import json
+import logging
+from contextlib import contextmanager
+from types import ModuleType
+from typing import IO, Any, Iterator, Optional, Tuple, Union
+
+import yaml
+
+orjson: Optional[ModuleType]
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+log = logging.getLogger(__name__)
+
+JSON_BACKENDS = ("orjson", "json")
+YAML_BACKENDS = ("libyaml", "pure")
+GC_PAUSE_THRESHOLD = 1024 * 1024
+
+
+def _available_json_backends() -> Tuple[str, ...]:
+    return tuple(backend for backend in JSON_BACKENDS if backend != "orjson" or orjson is not None)
+
+
+def _available_yaml_backends() -> Tuple[str, ...]:
+    return tuple(backend for backend in YAML_BACKENDS if backend != "libyaml" or getattr(yaml, "__with_libyaml__", False))
+
+
+# Maps every digit to "0", so a run of 20 digits, the shortest integer that
+# can overflow 64 bits, becomes _WIDE_INT.
+_DIGITS = bytes.maketrans(b"123456789", b"000000000")
+_WIDE_INT = b"0" * 20
+
+
+def _reads_wide_ints_as_floats() -> bool:
+    if orjson is None:
+        return False
+    try:
+        return isinstance(orjson.loads(b"18446744073709551616"), float)
+    except ValueError:
+        return False
+
+
+_ORJSON_WIDE_INTS_AS_FLOATS = _reads_wide_ints_as_floats()
+
+
+def _may_have_wide_ints(data: bytes) -> bool:
+    return _WIDE_INT in data.translate(_DIGITS)
+
+
+@contextmanager
+def _gc_paused(size: int) -> Iterator[None]:
+    pause = size > GC_PAUSE_THRESHOLD and gc.isenabled()
+    if pause:
+        gc.disable()
+    try:
+        yield
+    finally:
+        if pause:
+            gc.enable()
+
+
+def _pick_backend(kind: str, requested: Optional[str], available: Tuple[str, ...]) -> str:
+    if requested in (None, "auto"):
+        return available[0]
+    if requested not in available:
+        raise ValueError("{} backend {} isn't available; choose from {}!".format(kind, requested, ("auto",) + available))
+    return requested
+
+
+# Serializer {{{1
+class Serializer(object):
+    """Load and dump JSON and YAML with the fastest available backends.
+
+    Attributes:
+        json_backend (str): one of ``JSON_BACKENDS``.
+        yaml_backend (str): one of ``YAML_BACKENDS``.
+
+    """
+
+    def __init__(self, json_backend: Optional[str] = "auto", yaml_backend: Optional[str] = "auto") -> None:
+        """Initialize Serializer.
+
+        Args:
+            json_backend (str, optional): the JSON backend, or "auto" for the
+                fastest installed one.  Defaults to "auto".
+            yaml_backend (str, optional): the YAML backend, or "auto" for the
+                fastest installed one.  Defaults to "auto".
+
+        Raises:
+            ValueError: if a requested backend isn't installed.
+
+        """
+        self.json_backend = _pick_backend("JSON", json_backend, _available_json_backends())
+        self.yaml_backend = _pick_backend("YAML", yaml_backend, _available_yaml_backends())
+        self._yaml_loader = yaml.CSafeLoader if self.yaml_backend == "libyaml" else yaml.SafeLoader
+
+    def __repr__(self) -> str:
+        """Show the backends."""
+        return "<Serializer json={} yaml={}>".format(self.json_backend, self.yaml_backend)
+
+    def loads_json(self, data: Union[str, bytes]) -> Any:
+        """Parse a JSON document.
+
+        Args:
+            data (str or bytes): the document.
+
+        Returns:
+            object: the parsed document.
+
+        Raises:
+            ValueError: if ``data`` isn't valid JSON.
+
+        """
+        with _gc_paused(len(data)):
+            if self.json_backend == "orjson" and orjson is not None:
+                try:
+                    if not _ORJSON_WIDE_INTS_AS_FLOATS:
+                        return orjson.loads(data)
+                    encoded = data.encode("utf-8", "surrogatepass") if isinstance(data, str) else data
+                    if not _may_have_wide_ints(encoded):
+                        return orjson.loads(encoded)
+                except orjson.JSONDecodeError:
+                    # Let json decide: it accepts a few things orjson doesn't,
+                    # and its error messages are the ones we've always shown.
+                    pass
+            return json.loads(data)
+
+    def load_json(self, fh: IO[str]) -> Any:
+        """Parse a JSON document from an open file; see ``loads_json``."""
+        return self.loads_json(fh.read())
+
+    def loads_yaml(self, data: Union[str, bytes, IO[str]]) -> Any:
+        """Parse a YAML document with the safe loader.
+
+        Args:
+            data (str, bytes or file): the document, or an open file.
+
+        Returns:
+            object: the parsed document.
+
+        Raises:
+            yaml.YAMLError: if ``data`` isn't valid YAML.
+
+        """
+        return yaml.load(data, Loader=self._yaml_loader)
+
+    load_yaml = loads_yaml
+
+    def dumps_json(self, data: Any, canonical: bool = True) -> str:
+        """Dump ``data`` as sorted JSON, with indents of 2.
+
+        Args:
+            data (object): the data to dump.
+            canonical (bool, optional): whether the output must be byte for
+                byte what ``json.dumps(data, indent=2, sort_keys=True)``
+                returns, e.g. because it's signed.  Otherwise the output is
+                equivalent, but may e.g. contain unescaped unicode or format
+                floats differently.  Defaults to True.
+
+        Returns:
+            str: the JSON.
+
+        Raises:
+            TypeError: if ``data`` isn't JSON serializable.
+
+        """
+        if not canonical and self.json_backend == "orjson" and orjson is not None:
+            try:
+                return str(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS), "utf-8")
+            except orjson.JSONEncodeError:
+                # e.g. non-str keys or huge ints, which json handles.
+                pass
+        return json.dumps(data, indent=2, sort_keys=True)
+
+
+serializer = Serializer()
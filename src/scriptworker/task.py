@@ -12,6 +12,7 @@ import logging
 import os
 import pprint
 import re
+import time
 from asyncio.subprocess import PIPE
 from copy import deepcopy
 
@@ -20,9 +21,10 @@ import taskcluster.exceptions
 from taskcluster.exceptions import TaskclusterFailure
 
 import taskcluster
+from scriptworker.circuit import breakers, get_queue_url
 from scriptworker.client import validate_json_schema
 from scriptworker.constants import get_reversed_statuses
-from scriptworker.exceptions import ScriptWorkerTaskException, WorkerShutdownDuringTask
+from scriptworker.exceptions import CircuitOpenError, ScriptWorkerTaskException, WorkerShutdownDuringTask
 from scriptworker.github import (
     GitHubRepository,
     extract_github_repo_and_revision_from_source_url,
@@ -31,8 +33,10 @@ from scriptworker.github import (
     is_github_url,
 )
 from scriptworker.log import get_log_filehandle, pipe_to_log
+from scriptworker.metrics import registry
+from scriptworker.schema import TASK_SCHEMA_PATH, schemas
 from scriptworker.task_process import TaskProcess
-from scriptworker.utils import get_parts_of_url_path, load_json_or_yaml, retry_async
+from scriptworker.utils import get_parts_of_url_path, retry_async
 
 log = logging.getLogger(__name__)
 
@@ -67,7 +71,8 @@ async def get_task_definition(queue, task_id, exception=TaskclusterFailure):
             Defaults to ``TaskclusterFailure``.
 
     """
-    task_defn = await queue.task(task_id)
+    async with breakers.guard(get_queue_url(queue)):
+        task_defn = await queue.task(task_id)
     if "payload" not in task_defn:
         raise exception("Task definition for {} is empty!\n {}".format(task_id, task_defn))
     return task_defn
@@ -410,9 +415,9 @@ async def get_project(context, source_url):
 
     """
     await context.populate_projects()
-    for project, config in context.projects.items():
-        if source_url == config["repo"] or source_url.startswith(config["repo"] + "/"):
-            return project
+    project = context.projects.find_project(source_url)
+    if project is not None:
+        return project
     raise ValueError("Unknown repo for source url {}!".format(source_url))
 
 
@@ -642,8 +647,7 @@ def prepare_to_run_task(context, claim_task):
         dict: the contents of `current_task_info.json`
 
     """
-    schema_path = os.path.join(os.path.dirname(__file__), "data", "scriptworker_task_schema.json")
-    schema = load_json_or_yaml(schema_path, is_path=True)
+    schema = schemas.get(TASK_SCHEMA_PATH, format_checks=context.config["schema_format_checks"])
     current_task_info = {}
     context.claim_task = claim_task
     validate_json_schema(context.task, schema)
@@ -735,12 +739,16 @@ async def reclaim_task(context, task):
         if task != context.task:
             return
         log.debug("Reclaiming task...")
+        start = time.monotonic()
         try:
-            context.reclaim_task = await context.temp_queue.reclaimTask(get_task_id(context.claim_task), get_run_id(context.claim_task))
+            async with breakers.guard(context.config["taskcluster_root_url"], fail_fast=False):
+                context.reclaim_task = await context.temp_queue.reclaimTask(get_task_id(context.claim_task), get_run_id(context.claim_task))
+            registry.observe("reclaim_duration_seconds", time.monotonic() - start)
             clean_response = deepcopy(context.reclaim_task)
             clean_response["credentials"] = "{********}"
             log.debug("Reclaim task response:\n{}".format(pprint.pformat(clean_response)))
         except taskcluster.exceptions.TaskclusterRestFailure as exc:
+            registry.inc("reclaim_failures_total", status_code=exc.status_code)
             if exc.status_code == 409:
                 log.debug("409: not reclaiming task.")
                 if context.proc and task == context.task:
@@ -754,13 +762,31 @@ async def reclaim_task(context, task):
 
 
 # complete_task {{{1
+async def _report_task_status(context, args, result, reversed_statuses):
+    if result == 0:
+        log.info("Reporting task complete...")
+        registry.inc("tasks_completed_total", status="success")
+        return await context.temp_queue.reportCompleted(*args)
+    elif result != 1 and result in reversed_statuses:
+        reason = reversed_statuses[result]
+        log.info("Reporting task exception {}...".format(reason))
+        registry.inc("tasks_completed_total", status=reason)
+        payload = {"reason": reason}
+        return await context.temp_queue.reportException(*args, payload)
+    else:
+        log.info("Reporting task failed...")
+        registry.inc("tasks_completed_total", status="failure")
+        return await context.temp_queue.reportFailed(*args)
+
+
 async def complete_task(context, result):
     """Mark the task as completed in the queue.
 
     Decide whether to call reportCompleted, reportFailed, or reportException
     based on the exit status of the script.
 
-    If the task has expired or been cancelled, we'll get a 409 status.
+    If the task has expired or been cancelled, we'll get a 409 status.  If the
+    queue's circuit breaker is open, wait for it to close.
 
     Args:
         context (scriptworker.context.Context): the scriptworker context.
@@ -772,17 +798,8 @@ async def complete_task(context, result):
     args = [get_task_id(context.claim_task), get_run_id(context.claim_task)]
     reversed_statuses = get_reversed_statuses(context)
     try:
-        if result == 0:
-            log.info("Reporting task complete...")
-            response = await context.temp_queue.reportCompleted(*args)
-        elif result != 1 and result in reversed_statuses:
-            reason = reversed_statuses[result]
-            log.info("Reporting task exception {}...".format(reason))
-            payload = {"reason": reason}
-            response = await context.temp_queue.reportException(*args, payload)
-        else:
-            log.info("Reporting task failed...")
-            response = await context.temp_queue.reportFailed(*args)
+        async with breakers.guard(context.config["taskcluster_root_url"], fail_fast=False):
+            response = await _report_task_status(context, args, result, reversed_statuses)
         log.debug("Task status response:\n{}".format(pprint.pformat(response)))
     except taskcluster.exceptions.TaskclusterRestFailure as exc:
         if exc.status_code == 409:
@@ -811,6 +828,7 @@ async def claim_work(context):
         "tasks": 1,
     }
     try:
-        return await context.queue.claimWork(f"{context.config['provisioner_id']}/{context.config['worker_type']}", payload)
-    except (taskcluster.exceptions.TaskclusterFailure, aiohttp.ClientError, asyncio.TimeoutError) as exc:
+        async with breakers.guard(context.config["taskcluster_root_url"]):
+            return await context.queue.claimWork(f"{context.config['provisioner_id']}/{context.config['worker_type']}", payload)
+    except (taskcluster.exceptions.TaskclusterFailure, aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as exc:
         log.warning("{} {}".format(exc.__class__, exc))
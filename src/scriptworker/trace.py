@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""Lightweight tracing spans.
+
+Spans nest through a ``contextvars.ContextVar``, so spans started in
+concurrently running coroutines get the right parent.  Finished spans are
+appended to ``trace_path`` as JSON lines.  Each line is an OTLP/JSON
+``TracesData`` document holding one span, which the OpenTelemetry
+collector's ``otlpjsonfile`` receiver can ingest.
+
+Sampling is decided once per trace, at the root span.  When tracing is off,
+``span()`` yields a shared no-op span after a single check.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import IO, Any, Dict, Iterator, Optional, Union
+
+log = logging.getLogger(__name__)
+
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+
+# Span {{{1
+class Span(object):
+    """A timed, named operation.
+
+    Attributes:
+        name (str): the span name.
+        trace_id (str): the 32 hex digit trace id shared by all spans in the trace.
+        span_id (str): the 16 hex digit id of this span.
+        parent_span_id (str): the ``span_id`` of the parent span, or "".
+        sampled (bool): whether this trace gets exported.
+        attributes (dict): the span attributes.
+
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"], sampled: bool, attributes: Dict[str, Any]) -> None:
+        """Initialize Span.
+
+        Args:
+            name (str): the span name.
+            parent (Span): the parent span, or None for a root span.
+            sampled (bool): whether this trace gets exported.
+            attributes (dict): the initial span attributes.
+
+        """
+        self.name = name
+        self.trace_id: str = parent.trace_id if parent else "{:032x}".format(random.getrandbits(128))
+        self.span_id: str = "{:016x}".format(random.getrandbits(64))
+        self.parent_span_id = parent.span_id if parent else ""
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Set attribute ``key`` to ``value``."""
+        self.attributes[key] = value
+
+    def add(self, key: str, value: Union[int, float] = 1) -> None:
+        """Add ``value`` to the numeric attribute ``key``."""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Return the span as an OTLP/JSON span dict."""
+        status: Dict[str, Any] = {"code": _STATUS_OK}
+        if self.error is not None:
+            status = {"code": _STATUS_ERROR, "message": self.error}
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in sorted(self.attributes.items())],
+            "status": status,
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class _NoopSpan(object):
+    sampled = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def add(self, key: str, value: Union[int, float] = 1) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed_value: Dict[str, Any] = {"boolValue": value}
+    elif isinstance(value, int):
+        typed_value = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed_value = {"doubleValue": value}
+    else:
+        typed_value = {"stringValue": str(value)}
+    return {"key": key, "value": typed_value}
+
+
+# Tracer {{{1
+class Tracer(object):
+    """Sampling decisions and the JSON lines exporter.
+
+    Attributes:
+        path (str): the file to append spans to.  Tracing is off if empty.
+        sample_rate (float): the fraction of traces to export, 0-1.
+
+    """
+
+    def __init__(self, path: str = "", sample_rate: float = 1.0, service_name: str = "scriptworker") -> None:
+        """Initialize Tracer.
+
+        Args:
+            path (str, optional): the file to append spans to.  Tracing is off
+                if empty.  Defaults to "".
+            sample_rate (float, optional): the fraction of traces to export.
+                Defaults to 1.
+            service_name (str, optional): the ``service.name`` resource
+                attribute.  Defaults to "scriptworker".
+
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.enabled = bool(path) and sample_rate > 0
+        self._resource = {"attributes": [_otlp_attribute("service.name", service_name)]}
+        self._lock = threading.Lock()
+        self._fh: Optional[IO[str]] = None
+
+    def should_sample(self) -> bool:
+        """Decide whether a new trace is exported."""
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def export(self, span: Span) -> None:
+        """Append ``span`` to ``path`` as one JSON line."""
+        document = {"resourceSpans": [{"resource": self._resource, "scopeSpans": [{"scope": {"name": "scriptworker"}, "spans": [span.to_otlp()]}]}]}
+        line = json.dumps(document, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._fh is None:
+                parent_dir = os.path.dirname(self.path)
+                if parent_dir:
+                    os.makedirs(parent_dir, exist_ok=True)
+                self._fh = open(self.path, "a")
+            self._fh.write(line)
+            self._fh.flush()
+
+    def close(self) -> None:
+        """Close the export file."""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+_tracer = Tracer()
+_current_span: ContextVar[Optional[Span]] = ContextVar("scriptworker_current_span", default=None)
+
+
+def configure_tracing(path: str, sample_rate: float = 1.0) -> Tracer:
+    """Replace the process tracer.
+
+    Args:
+        path (str): the file to append spans to.  An empty string turns
+            tracing off.
+        sample_rate (float, optional): the fraction of traces to export.
+            Defaults to 1.
+
+    Returns:
+        Tracer: the new tracer.
+
+    """
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(path, sample_rate)
+    if _tracer.enabled:
+        log.info("Writing trace spans to {} (sample rate {})".format(path, sample_rate))
+    return _tracer
+
+
+def current_span() -> Union[Span, _NoopSpan]:
+    """Return the innermost active span, or ``NOOP_SPAN``."""
+    return _current_span.get() or NOOP_SPAN
+
+
+# span {{{1
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Union[Span, _NoopSpan]]:
+    """Trace the enclosed block as a span named ``name``.
+
+    Args:
+        name (str): the span name.
+        **attributes: the initial span attributes.  Pass urls through
+            ``get_loggable_url`` first.
+
+    Yields:
+        Span: the new span, or ``NOOP_SPAN`` if tracing is off.
+
+    """
+    tracer = _tracer
+    if not tracer.enabled:
+        yield NOOP_SPAN
+        return
+    parent = _current_span.get()
+    new_span = Span(name, parent, parent.sampled if parent else tracer.should_sample(), attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as exc:
+        new_span.error = "{}: {}".format(exc.__class__.__name__, exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end_ns = time.time_ns()
+        if new_span.sampled:
+            tracer.export(new_span)
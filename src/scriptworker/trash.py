@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""Background deletion of old work directories.
+
+Deleting a work dir full of upstream artifacts can take many seconds, and
+``cleanup`` runs on the event loop between tasks.  ``TrashCollector.trash``
+instead renames the directory into a ``.scriptworker-trash`` directory next
+to it, which is instant on the same filesystem, and a low priority thread
+deletes it from there.
+
+At most ``max_pending`` directories wait in the trash; past that, ``trash``
+blocks until the thread catches up, so a slow disk can't fill up with
+trash.  So async code must call ``trash`` from a thread, e.g. with
+``loop.run_in_executor``, as the worker does with ``cleanup``.  Leftover
+trash from a previous run is picked up the first time a trash directory is
+used.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+    TRASH_DIR_NAME (str): the name of the trash directory, created next to
+        each trashed directory.
+
+"""
+
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from typing import List, Optional, Set
+
+from scriptworker.metrics import registry
+
+log = logging.getLogger(__name__)
+
+TRASH_DIR_NAME = ".scriptworker-trash"
+
+
+# TrashCollector {{{1
+class TrashCollector(object):
+    """Rename directories into the trash, and delete them in a background thread.
+
+    Attributes:
+        max_pending (int): the number of trashed directories that may wait for
+            deletion before ``trash`` blocks.
+        niceness (int): the nice value of the deletion thread.  On Linux this
+            also lowers its I/O priority.
+
+    """
+
+    def __init__(self, max_pending: int, niceness: int = 19) -> None:
+        """Initialize TrashCollector.
+
+        Args:
+            max_pending (int): the number of trashed directories that may wait
+                for deletion before ``trash`` blocks.
+            niceness (int, optional): the nice value of the deletion thread.
+                Defaults to 19.
+
+        """
+        self.max_pending = max_pending
+        self.niceness = niceness
+        self._pending: List[str] = []
+        self._seen_trash_dirs: Set[str] = set()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        """int: the number of trashed paths not yet deleted."""
+        with self._condition:
+            return len(self._pending)
+
+    def trash(self, path: str) -> bool:
+        """Move ``path`` into the trash, to be deleted in the background.
+
+        Args:
+            path (str): the file or directory to delete.
+
+        Returns:
+            bool: True if ``path`` was moved into the trash.  False if it
+                couldn't be, e.g. because it's a mount point; the caller
+                should delete it in place.
+
+        """
+        parent_dir = os.path.dirname(os.path.abspath(path))
+        trash_dir = os.path.join(parent_dir, TRASH_DIR_NAME)
+        target = os.path.join(trash_dir, "{}.{}".format(os.path.basename(path), uuid.uuid4().hex))
+        try:
+            os.makedirs(trash_dir, exist_ok=True)
+        except OSError as exc:
+            log.warning("Can't create {}: {}".format(trash_dir, exc))
+            return False
+        if trash_dir not in self._seen_trash_dirs:
+            self._seen_trash_dirs.add(trash_dir)
+            self._collect_leftovers(trash_dir)
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                registry.inc("trash_full_waits_total")
+                log.warning("{} directories are waiting for deletion; waiting before trashing {}".format(len(self._pending), path))
+                self._condition.wait_for(lambda: len(self._pending) < self.max_pending)
+        try:
+            os.rename(path, target)
+        except OSError as exc:
+            log.warning("Can't move {} into {}: {}".format(path, trash_dir, exc))
+            return False
+        log.debug("Moved {} to {}".format(path, target))
+        self._queue(target)
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for all trash to be deleted.
+
+        Args:
+            timeout (float, optional): the maximum seconds to wait.  Defaults
+                to None, which waits forever.
+
+        Returns:
+            bool: True if the trash is empty.
+
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending, timeout)
+
+    def _collect_leftovers(self, trash_dir: str) -> None:
+        for name in sorted(os.listdir(trash_dir)):
+            path = os.path.join(trash_dir, name)
+            log.info("Deleting leftover trash {}".format(path))
+            self._queue(path)
+
+    def _queue(self, path: str) -> None:
+        with self._condition:
+            self._pending.append(path)
+            registry.set("trash_pending", len(self._pending))
+            self._condition.notify_all()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="scriptworker-trash", daemon=True)
+                self._thread.start()
+
+    def _lower_priority(self) -> None:
+        # On Linux, nice values are per thread, and without an explicit I/O
+        # priority the I/O scheduler derives one from the nice value.  Elsewhere
+        # a thread id isn't a valid setpriority() target.
+        if sys.platform.startswith("linux"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.niceness)
+            except OSError as exc:
+                log.debug("Can't renice the trash thread: {}".format(exc))
+
+    def _run(self) -> None:
+        self._lower_priority()
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                path = self._pending[0]
+            start = time.monotonic()
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            if os.path.lexists(path):
+                log.warning("Failed to delete trash {}".format(path))
+            registry.observe("trash_delete_seconds", time.monotonic() - start)
+            with self._condition:
+                self._pending.remove(path)
+                registry.set("trash_pending", len(self._pending))
+                self._condition.notify_all()
+
+
+_collector: Optional[TrashCollector] = None
+
+
+def get_trash_collector(max_pending: int) -> TrashCollector:
+    """Return the process' ``TrashCollector``, creating it if needed.
+
+    Args:
+        max_pending (int): the number of trashed directories that may wait
+            for deletion before ``trash`` blocks.
+
+    Returns:
+        TrashCollector: the collector.
+
+    """
+    global _collector
+    if _collector is None:
+        _collector = TrashCollector(max_pending)
+    _collector.max_pending = max_pending
+    return _collector
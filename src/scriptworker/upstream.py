@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""An index of a task's ``upstreamArtifacts``.
+
+``upstreamArtifacts`` lists the artifacts of other tasks that a task needs::
+
+    [{"taskId": "...", "taskType": "build", "paths": ["public/build/target.dmg"], "optional": True}, ...]
+
+A task id can show up in several entries, so answering "is this path
+optional?" or "which paths does this task need?" from the raw list means
+scanning all of it.  ``UpstreamArtifacts`` scans it once, when the task is
+claimed, and answers these from precomputed, immutable mappings.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+
+"""
+
+import fnmatch
+import functools
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Pattern, Sequence, Set, Tuple
+
+from immutabledict import immutabledict
+
+log = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_artifact_pattern(pattern: str) -> Pattern[str]:
+    """Compile an ``upstreamArtifacts`` glob, once per pattern.
+
+    Args:
+        pattern (str): the glob, e.g. ``public/build/*.dmg``.
+
+    Returns:
+        re.Pattern: the compiled pattern; its ``match`` behaves like
+            ``fnmatch.fnmatchcase``.
+
+    """
+    return re.compile(fnmatch.translate(pattern))
+
+
+def match_artifact_names(names: Sequence[str], patterns: Sequence[str]) -> Dict[str, List[str]]:
+    """Match artifact names against several globs, in one pass over the names.
+
+    Args:
+        names (list): the artifact names, e.g. from ``list_latest_artifacts``.
+        patterns (list): the globs to match them against.
+
+    Returns:
+        dict: the matching names per pattern, in the order of ``names``.
+
+    """
+    compiled = [(pattern, compile_artifact_pattern(pattern).match) for pattern in patterns]
+    matches: Dict[str, List[str]] = {pattern: [] for pattern in patterns}
+    for name in names:
+        for pattern, match in compiled:
+            if match(name):
+                matches[pattern].append(name)
+    return matches
+
+
+# UpstreamArtifacts {{{1
+# (task_id, task_type, paths, optional)
+Definition = Tuple[str, Optional[str], Tuple[str, ...], bool]
+
+
+def _get_definition(entry: Dict[str, Any]) -> Definition:
+    return (entry["taskId"], entry.get("taskType"), tuple(entry["paths"]), entry.get("optional", False) is True)
+
+
+@dataclass(frozen=True, eq=False)
+class UpstreamArtifacts(object):
+    """An immutable index of a task's ``upstreamArtifacts``.
+
+    Attributes:
+        source (list): the ``upstreamArtifacts`` this index was built from.
+        definitions (tuple): a ``(task_id, task_type, paths, optional)`` tuple
+            per ``upstreamArtifacts`` entry, in order.
+        task_ids (tuple): the upstream task ids, in the order they first
+            appear.
+        paths_per_task_id (immutabledict): the sorted, deduplicated paths per
+            task id.
+        optional_paths_per_task_id (immutabledict): the optional paths per
+            task id.  A path is optional if any entry flags it so.
+        patterns_per_task_id (immutabledict): the globbed paths per task id.
+
+    """
+
+    source: Sequence[Dict[str, Any]]
+    definitions: Tuple[Definition, ...] = field(init=False)
+    task_ids: Tuple[str, ...] = field(init=False)
+    paths_per_task_id: "immutabledict[str, Tuple[str, ...]]" = field(init=False)
+    optional_paths_per_task_id: "immutabledict[str, FrozenSet[str]]" = field(init=False)
+    patterns_per_task_id: "immutabledict[str, Tuple[str, ...]]" = field(init=False)
+
+    def __post_init__(self) -> None:
+        """Index ``source``."""
+        definitions = tuple(_get_definition(entry) for entry in self.source)
+        paths: Dict[str, Set[str]] = {}
+        optional_paths: Dict[str, Set[str]] = {}
+        for task_id, _, definition_paths, optional in definitions:
+            paths.setdefault(task_id, set()).update(definition_paths)
+            optional_paths.setdefault(task_id, set())
+            if optional:
+                optional_paths[task_id].update(definition_paths)
+        sorted_paths = {task_id: tuple(sorted(task_paths)) for task_id, task_paths in paths.items()}
+        _set = object.__setattr__
+        _set(self, "definitions", definitions)
+        _set(self, "task_ids", tuple(paths))
+        _set(self, "paths_per_task_id", immutabledict(sorted_paths))
+        _set(self, "optional_paths_per_task_id", immutabledict({task_id: frozenset(task_paths) for task_id, task_paths in optional_paths.items()}))
+        _set(
+            self,
+            "patterns_per_task_id",
+            immutabledict({task_id: tuple(path for path in task_paths if "*" in path) for task_id, task_paths in sorted_paths.items()}),
+        )
+
+    def __repr__(self) -> str:
+        """Summarize the index."""
+        return "<UpstreamArtifacts {} tasks, {} paths>".format(len(self.task_ids), sum(len(paths) for paths in self.paths_per_task_id.values()))
+
+    @classmethod
+    def from_task(cls, task: Optional[Dict[str, Any]]) -> "UpstreamArtifacts":
+        """Index the ``upstreamArtifacts`` of a task definition.
+
+        Args:
+            task (dict): the task definition.  None or a task without
+                ``upstreamArtifacts`` gives an empty index.
+
+        Returns:
+            UpstreamArtifacts: the index.
+
+        """
+        return cls((task or {}).get("payload", {}).get("upstreamArtifacts", ()))
+
+    def is_for(self, upstream_artifacts: Sequence[Dict[str, Any]]) -> bool:
+        """Tell whether this index is up to date for ``upstream_artifacts``.
+
+        This compares the task ids, task types, paths and optional flags of
+        the entries, so it notices entries being edited in place, too.  That's
+        a single pass, without the allocations of rebuilding the index.
+
+        Args:
+            upstream_artifacts (list): the ``upstreamArtifacts`` of a task.
+
+        Returns:
+            bool: True if the index is up to date for ``upstream_artifacts``.
+
+        """
+        if len(upstream_artifacts) != len(self.definitions):
+            return False
+        return all(_get_definition(entry) == definition for entry, definition in zip(upstream_artifacts, self.definitions))
+
+    def is_optional(self, task_id: str, path: str) -> bool:
+        """bool: True if ``path`` of ``task_id`` is flagged as optional."""
+        return path in self.optional_paths_per_task_id.get(task_id, ())
+
+    def patterns(self, task_id: str) -> Tuple[str, ...]:
+        """tuple: the globbed paths of ``task_id``."""
+        return self.patterns_per_task_id.get(task_id, ())
+
+    def match(self, task_id: str, names: Sequence[str]) -> Dict[str, List[str]]:
+        """Match artifact names against the globbed paths of ``task_id``.
+
+        Args:
+            task_id (str): the upstream task id.
+            names (list): the artifact names, e.g. from ``list_latest_artifacts``.
+
+        Returns:
+            dict: the matching names per globbed path, in the order of ``names``.
+
+        """
+        return match_artifact_names(names, self.patterns(task_id))
+
+
+def get_upstream_artifacts(upstream_artifacts: Sequence[Dict[str, Any]], index: Optional[UpstreamArtifacts] = None) -> UpstreamArtifacts:
+    """Return the index of ``upstream_artifacts``, reusing ``index`` if it's up to date.
+
+    Args:
+        upstream_artifacts (list): the ``upstreamArtifacts`` of a task.
+        index (UpstreamArtifacts, optional): a previously built index.
+
+    Returns:
+        UpstreamArtifacts: ``index`` if it's up to date for
+            ``upstream_artifacts``, else a new index.
+
+    """
+    if isinstance(index, UpstreamArtifacts) and index.is_for(upstream_artifacts):
+        return index
+    return UpstreamArtifacts(upstream_artifacts)
@@ -9,16 +9,35 @@ Attributes:
 import asyncio
 import functools
 import hashlib
-import json
 import logging
 import os
 import random
 import re
 import shutil
 import time
-import uuid
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-from typing import IO, TYPE_CHECKING, Any, Awaitable, Callable, Dict, Match, Optional, Sequence, Tuple, Type, Union, cast, overload  # noqa
+from typing import (  # noqa
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Match,
+    Optional,
+    Pattern,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    cast,
+    overload,
+)
 from urllib.parse import unquote, urlparse
 
 import aiohttp
@@ -28,7 +47,12 @@ import yaml
 from taskcluster.client import createTemporaryCredentials
 
 import scriptworker
-from scriptworker.exceptions import Download404, DownloadError, ScriptWorkerException, ScriptWorkerRetryException, ScriptWorkerTaskException
+from scriptworker.circuit import breakers, take_failed_host
+from scriptworker.exceptions import CircuitOpenError, Download404, DownloadError, ScriptWorkerException, ScriptWorkerRetryException, ScriptWorkerTaskException
+from scriptworker.metrics import registry
+from scriptworker.serialization import serializer
+from scriptworker.trace import current_span, span
+from scriptworker.trash import get_trash_collector
 
 if TYPE_CHECKING:
     # Avoid circular import
@@ -41,7 +65,7 @@ log = logging.getLogger(__name__)
 
 
 # scriptworker_session {{{1
-def scriptworker_session(*args, **kwargs):
+def scriptworker_session(*args: Any, **kwargs: Any) -> aiohttp.ClientSession:
     kwargs.setdefault("headers", {}).setdefault("User-Agent", f"scriptworker {scriptworker.__version__}")
     return aiohttp.ClientSession(*args, **kwargs)
 
@@ -76,21 +100,23 @@ async def request(context, url, timeout=60, method="get", good=(200,), retry=tup
     """
     session = context.session
     loggable_url = get_loggable_url(url)
-    async with async_timeout.timeout(timeout):
-        log.debug("{} {}".format(method.upper(), loggable_url))
-        async with session.request(method, url, **kwargs) as resp:
-            log.debug("Status {}".format(resp.status))
-            message = "Bad status {}".format(resp.status)
-            if resp.status in retry:
-                raise ScriptWorkerRetryException(message)
-            if resp.status not in good:
-                raise ScriptWorkerException(message)
-            if return_type == "text":
-                return await resp.text()
-            elif return_type == "json":
-                return await resp.json()
-            else:
-                return resp
+    with span("request", url=loggable_url, method=method.upper()) as request_span:
+        async with breakers.guard(url), async_timeout.timeout(timeout):
+            log.debug("{} {}".format(method.upper(), loggable_url))
+            async with session.request(method, url, **kwargs) as resp:
+                log.debug("Status {}".format(resp.status))
+                request_span.set_attribute("http.status_code", resp.status)
+                message = "Bad status {}".format(resp.status)
+                if resp.status in retry:
+                    raise ScriptWorkerRetryException(message, status=resp.status)
+                if resp.status not in good:
+                    raise ScriptWorkerException(message)
+                if return_type == "text":
+                    return await resp.text()
+                elif return_type == "json":
+                    return await resp.json(loads=serializer.loads_json)
+                else:
+                    return resp
 
 
 # retry_request {{{1
@@ -113,6 +139,49 @@ async def retry_request(*args, retry_exceptions=(asyncio.TimeoutError, ScriptWor
     return await retry_async(request, retry_exceptions=retry_exceptions, args=args, kwargs=kwargs, **retry_async_kwargs)
 
 
+# get_if_modified {{{1
+async def get_if_modified(session, url, validators=None, timeout=60):
+    """GET a url, unless it's unchanged since it was last fetched.
+
+    Args:
+        session (aiohttp.ClientSession): the session to use.
+        url (str): the url to get.
+        validators (dict, optional): the ``ETag`` and ``Last-Modified`` headers
+            of the last response, as returned by this function.  Defaults to None.
+        timeout (int, optional): timeout after this many seconds. Default is 60.
+
+    Returns:
+        str, dict: the response text, or None if it's unchanged; and the
+            validators to pass next time.
+
+    Raises:
+        ScriptWorkerRetryException: on a 5xx response.
+        ScriptWorkerException: on any other unexpected status.
+
+    """
+    validators = dict(validators or {})
+    headers = {}
+    if validators.get("ETag"):
+        headers["If-None-Match"] = validators["ETag"]
+    if validators.get("Last-Modified"):
+        headers["If-Modified-Since"] = validators["Last-Modified"]
+    loggable_url = get_loggable_url(url)
+    with span("request", url=loggable_url, method="GET") as request_span:
+        async with breakers.guard(url), async_timeout.timeout(timeout):
+            log.debug("GET {} {}".format(loggable_url, headers))
+            async with session.get(url, headers=headers) as resp:
+                log.debug("Status {}".format(resp.status))
+                request_span.set_attribute("http.status_code", resp.status)
+                if resp.status == 304:
+                    registry.inc("cache_hits_total", cache="url")
+                    return None, validators
+                if 500 <= resp.status < 512:
+                    raise ScriptWorkerRetryException("Bad status {}".format(resp.status), status=resp.status)
+                if resp.status != 200:
+                    raise ScriptWorkerException("Bad status {}".format(resp.status))
+                return await resp.text(), {key: resp.headers[key] for key in ("ETag", "Last-Modified") if key in resp.headers}
+
+
 # datestring_to_timestamp {{{1
 def datestring_to_timestamp(datestring):
     """Create a timetamp from a taskcluster datestring.
@@ -192,15 +261,22 @@ def rm(path):
 def cleanup(context):
     """Clean up the work_dir and artifact_dir between task runs, then recreate.
 
+    If ``max_pending_trash`` is set, the old directories are moved into the
+    trash and deleted in the background, so this returns right away, unless
+    the trash is full.  It then waits for the trash to drain, so run it in an
+    executor from async code.
+
     Args:
         context (scriptworker.context.Context): the scriptworker context.
 
     """
+    collector = get_trash_collector(context.config["max_pending_trash"]) if context.config["max_pending_trash"] else None
     for name in "work_dir", "artifact_dir", "task_log_dir":
         path = context.config[name]
         if os.path.exists(path):
-            log.debug("rm({})".format(path))
-            rm(path)
+            if collector is None or not collector.trash(path):
+                log.debug("rm({})".format(path))
+                rm(path)
         makedirs(path)
 
 
@@ -248,6 +324,10 @@ async def retry_async(
 ) -> Any:
     """Retry ``func``, where ``func`` is an awaitable.
 
+    Failures of calls guarded by ``scriptworker.circuit.breakers`` are only
+    retried while the failing host has retry budget left, and
+    ``CircuitOpenError`` is never retried.
+
     Args:
         func (function): an awaitable function.
         attempts (int, optional): the number of attempts to make.  Default is 5.
@@ -267,19 +347,28 @@ async def retry_async(
     Raises:
         Exception: the exception from a failed ``function`` call, either outside
             of the retry_exceptions, or one of those if we pass the max
-            ``attempts``.
+            ``attempts`` or run out of retry budget.
 
     """
     kwargs = kwargs or {}
     attempt = 1
     while True:
+        take_failed_host()
         try:
             return await func(*args, **kwargs)
+        except CircuitOpenError:
+            raise
         except retry_exceptions as exc:
             if log_exceptions:
                 log.warning(f"retry_async exception:\n{type(exc)} {exc}")
             attempt += 1
+            registry.inc("retries_total", func=func.__name__)
+            current_span().add("retries")
             _check_number_of_attempts(attempt, attempts, func, "retry_async")
+            failed_host = take_failed_host()
+            if not breakers.allow_retry(failed_host):
+                log.warning("retry_async: {}: out of retry budget for {}!".format(func.__name__, failed_host))
+                raise
             await asyncio.sleep(_define_sleep_time(sleeptime_kwargs, sleeptime_callback, attempt, func, "retry_async"))
 
 
@@ -317,6 +406,7 @@ def retry_sync(func, attempts=5, sleeptime_callback=calculate_sleep_time, retry_
             return func(*args, **kwargs)
         except retry_exceptions:
             attempt += 1
+            registry.inc("retries_total", func=func.__name__)
             _check_number_of_attempts(attempt, attempts, func, "retry_sync")
             time.sleep(_define_sleep_time(sleeptime_kwargs, sleeptime_callback, attempt, func, "retry_sync"))
 
@@ -460,6 +550,17 @@ async def _process_future_exceptions(tasks, raise_at_first_error):
 
 
 # filepaths_in_dir {{{1
+def _scan_files(path: str, prefix: str = "") -> Iterator[Tuple[str, "os.DirEntry[str]"]]:
+    # Like ``os.walk``, symlinks to directories are neither followed nor listed.
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    yield from _scan_files(entry.path, prefix + entry.name + "/")
+            else:
+                yield prefix + entry.name, entry
+
+
 def filepaths_in_dir(path):
     """Find all files in a directory, and return the relative paths to those files.
 
@@ -471,20 +572,176 @@ def filepaths_in_dir(path):
             subdirectories.
 
     """
-    filepaths = []
-    for root, directories, filenames in os.walk(path):
-        for filename in filenames:
-            filepath = os.path.join(root, filename)
-            filepath = filepath.replace(path, "").lstrip("/")
-            filepaths.append(filepath)
-    return filepaths
+    return [filepath for filepath, _ in _scan_files(path)]
+
+
+# ArtifactManifest {{{1
+class ManifestEntry(object):
+    """A file in an ``ArtifactManifest``.
+
+    Attributes:
+        path (str): the path relative to the manifest directory.
+        size (int): the size in bytes.
+        mtime_ns (int): the modification time in nanoseconds.
+        inode (int): the inode number.
+        hashes (dict): the hexdigests computed so far, per algorithm.
+
+    """
+
+    __slots__ = ("path", "size", "mtime_ns", "inode", "hashes")
+
+    def __init__(self, path: str, stat_result: os.stat_result) -> None:
+        """Initialize ManifestEntry from ``os.stat`` output."""
+        self.path = path
+        self.size = stat_result.st_size
+        self.mtime_ns = stat_result.st_mtime_ns
+        self.inode = stat_result.st_ino
+        self.hashes: Dict[str, str] = {}
+
+    def matches(self, stat_result: os.stat_result) -> bool:
+        """bool: whether ``stat_result`` describes the same, unchanged file."""
+        return (self.size, self.mtime_ns, self.inode) == (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino)
+
+
+class ArtifactManifest(object):
+    """The files under a directory, with their stat data and cached hashes.
+
+    Rescanning keeps the entries (and hashes) of files whose size, mtime and
+    inode haven't changed, so later stages only re-examine what changed.
+
+    Attributes:
+        path (str): the directory.
+        entries (dict): maps relative path to ``ManifestEntry``.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        """Initialize ArtifactManifest.
+
+        Args:
+            path (str): the directory to scan.
+
+        """
+        self.path = path
+        self.entries: Dict[str, ManifestEntry] = {}
+
+    def scan(self) -> "ArtifactManifest":
+        """Rescan the whole directory.
+
+        Returns:
+            ArtifactManifest: self.
+
+        """
+        entries = {}
+        for filepath, dir_entry in _scan_files(self.path):
+            try:
+                stat_result = dir_entry.stat()
+            except FileNotFoundError:
+                # broken symlink, or removed during the scan
+                continue
+            entry = self.entries.get(filepath)
+            entries[filepath] = entry if entry is not None and entry.matches(stat_result) else ManifestEntry(filepath, stat_result)
+        self.entries = entries
+        return self
+
+    def refresh(self, filepath: str) -> Optional[ManifestEntry]:
+        """Re-examine a single file, e.g. after it was compressed.
+
+        Args:
+            filepath (str): the path relative to ``path``.
+
+        Returns:
+            ManifestEntry: the up to date entry, or None if the file is gone.
+
+        """
+        try:
+            stat_result = os.stat(self.full_path(filepath))
+        except FileNotFoundError:
+            self.entries.pop(filepath, None)
+            return None
+        entry = self.entries.get(filepath)
+        if entry is None or not entry.matches(stat_result):
+            entry = self.entries[filepath] = ManifestEntry(filepath, stat_result)
+        return entry
+
+    def filepaths(self) -> List[str]:
+        """list: the sorted relative paths of all files."""
+        return sorted(self.entries)
+
+    def full_path(self, filepath: str) -> str:
+        """str: the full path of ``filepath``."""
+        return os.path.join(self.path, filepath)
+
+    def get_hashes(self, filepaths: Sequence[str], hash_algs: Sequence[str] = ("sha256",)) -> Dict[str, Dict[str, str]]:
+        """Get the hashes of files, hashing only the ones not already cached.
+
+        Uncached files are hashed in parallel with ``hash_files``.
+
+        Args:
+            filepaths (list): the relative paths of the files to hash.
+            hash_algs (list, optional): the algorithms to use.  Defaults to ('sha256', ).
+
+        Returns:
+            dict: maps each relative path to a dict of hexdigest per algorithm.
+
+        """
+        hash_algs = tuple(hash_algs)
+        entries = [self.entries[filepath] for filepath in filepaths]
+        todo = [entry for entry in entries if any(hash_alg not in entry.hashes for hash_alg in hash_algs)]
+        if todo:
+            results = hash_files([self.full_path(entry.path) for entry in todo], hash_algs)
+            for entry in todo:
+                entry.hashes.update(results[self.full_path(entry.path)])
+        return {entry.path: {hash_alg: entry.hashes[hash_alg] for hash_alg in hash_algs} for entry in entries}
 
 
 # get_hash {{{1
-def get_hash(path, hash_alg="sha256"):
+HASH_CHUNK_SIZE = 1024 * 1024
+_hash_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_hash_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        # hashlib releases the GIL while hashing large buffers, so hashes
+        # run in parallel up to the number of cores.
+        _hash_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="scriptworker-hash")
+    return _hash_executor
+
+
+def get_hashes(path: str, hash_algs: Sequence[str] = ("sha256",)) -> Dict[str, str]:
+    """Get several hashes of the file at ``path``, reading it only once.
+
+    Args:
+        path (str): the path to the file to hash.
+        hash_algs (list, optional): the algorithms to use.  Defaults to ('sha256', ).
+
+    Returns:
+        dict: the hexdigest per algorithm.
+
+    """
+    hashes = [hashlib.new(hash_alg) for hash_alg in hash_algs]
+    _update_hashes(path, hashes)
+    return {hash_alg: h.hexdigest() for hash_alg, h in zip(hash_algs, hashes)}
+
+
+def _update_hashes(path: str, hashes: Sequence["hashlib._Hash"]) -> None:
+    buf = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            for h in hashes:
+                h.update(view[:size])
+
+
+def get_hash(path: str, hash_alg: str = "sha256") -> str:
     """Get the hash of the file at ``path``.
 
-    I'd love to make this async, but evidently file i/o is always ready
+    Use ``get_hashes_async`` or ``hash_files_async`` from async code, to keep
+    large files from blocking the event loop.
 
     Args:
         path (str): the path to the file to hash.
@@ -494,17 +751,62 @@ def get_hash(path, hash_alg="sha256"):
         str: the hexdigest of the hash.
 
     """
-    h = hashlib.new(hash_alg)
-    with open(path, "rb") as f:
-        for chunk in iter(functools.partial(f.read, 4096), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    return get_hashes(path, (hash_alg,))[hash_alg]
+
+
+async def get_hashes_async(path: str, hash_algs: Sequence[str] = ("sha256",)) -> Dict[str, str]:
+    """Get several hashes of the file at ``path`` in the hashing thread pool.
+
+    Args:
+        path (str): the path to the file to hash.
+        hash_algs (list, optional): the algorithms to use.  Defaults to ('sha256', ).
+
+    Returns:
+        dict: the hexdigest per algorithm.
+
+    """
+    return await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), get_hashes, path, tuple(hash_algs))
+
+
+def hash_files(paths: Sequence[str], hash_algs: Sequence[str] = ("sha256",)) -> Dict[str, Dict[str, str]]:
+    """Hash many files in parallel in the hashing thread pool.
+
+    Args:
+        paths (list): the paths to the files to hash.
+        hash_algs (list, optional): the algorithms to use.  Defaults to ('sha256', ).
+
+    Returns:
+        dict: the ``get_hashes`` result per path.
+
+    """
+    paths = list(paths)
+    hash_algs = tuple(hash_algs)
+    return dict(zip(paths, _get_hash_executor().map(lambda path: get_hashes(path, hash_algs), paths)))
+
+
+async def hash_files_async(paths: Sequence[str], hash_algs: Sequence[str] = ("sha256",)) -> Dict[str, Dict[str, str]]:
+    """Hash many files in parallel in the hashing thread pool, without blocking the event loop.
+
+    Args:
+        paths (list): the paths to the files to hash.
+        hash_algs (list, optional): the algorithms to use.  Defaults to ('sha256', ).
+
+    Returns:
+        dict: the ``get_hashes`` result per path.
+
+    """
+    paths = list(paths)
+    results = await asyncio.gather(*[get_hashes_async(path, hash_algs) for path in paths])
+    return dict(zip(paths, results))
 
 
 # format_json {{{1
 def format_json(data):
     """Format json as a sorted string (indents of 2).
 
+    This is the canonical format that chain of trust artifacts are signed in,
+    so it's always dumped by the stdlib ``json`` module.
+
     Args:
         data (dict): the json to format.
 
@@ -512,7 +814,7 @@ def format_json(data):
         str: the formatted json.
 
     """
-    return json.dumps(data, indent=2, sort_keys=True)
+    return serializer.dumps_json(data, canonical=True)
 
 
 # load_json_or_yaml {{{1
@@ -564,11 +866,11 @@ def load_json_or_yaml(
 
     """
     if file_type == "json":
-        _load_fh = json.load  # type: Callable[[IO[str]], Dict[str, Any]]
-        _load_str = json.loads  # type: Callable[[str], Dict[str, Any]]
+        _load_fh = serializer.load_json  # type: Callable[[IO[str]], Dict[str, Any]]
+        _load_str = serializer.loads_json  # type: Callable[[str], Dict[str, Any]]
     else:
-        _load_fh = yaml.safe_load
-        _load_str = yaml.safe_load
+        _load_fh = serializer.load_yaml
+        _load_str = serializer.loads_yaml
 
     try:
         if is_path:
@@ -653,9 +955,243 @@ async def _log_download_error(resp, msg):
         log.debug("Redirect history %s: %s; body=%s", get_loggable_url(str(h.url)), h.status, (await h.text())[:1000])
 
 
-async def download_file(context, url, abs_filename, session=None, chunk_size=128, auth=None):
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+_download_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _download_lock(abs_filename):
+    # Downloads to the same path share their ``.part`` file, so they take turns.
+    lock = _download_locks.get(abs_filename)
+    if lock is None:
+        lock = _download_locks[abs_filename] = asyncio.Lock()
+    return lock
+
+
+def _remove_files(*paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _get_resume_info(url, part_path, info_path):
+    """Return the ``.part`` download info if ``part_path`` can be resumed, else None."""
+    if not os.path.exists(part_path) or not os.path.exists(info_path):
+        _remove_files(part_path, info_path)
+        return None
+    info = load_json_or_yaml(info_path, is_path=True, file_type="json", exception=None)
+    size = os.path.getsize(part_path)
+    if not info or info.get("url") != url or not info.get("validator") or size > info.get("length", -1):
+        _remove_files(part_path, info_path)
+        return None
+    info["size"] = size
+    return info
+
+
+def _get_resume_validator(resp):
+    """Return the ETag or Last-Modified header to resume with, if the server supports ranges."""
+    if resp.headers.get("Accept-Ranges", "bytes").lower() == "none" or resp.content_length is None:
+        return None
+    etag = resp.headers.get("ETag")
+    # If-Range only works with strong ETags.
+    if etag and not etag.startswith("W/"):
+        return etag
+    return resp.headers.get("Last-Modified")
+
+
+def _is_encoded(resp):
+    """Return True if aiohttp decodes the body of ``resp``, e.g. because it's gzipped."""
+    return resp.headers.get("Content-Encoding", "identity").lower() != "identity"
+
+
+def _get_content_range(resp):
+    """Return the (first byte, total length) of a 206 response."""
+    match = re.match(r"^bytes (\d+)-\d+/(\d+)$", resp.headers.get("Content-Range", ""))
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+
+async def _read_range_into(resp, fd, offset, end, chunk_size):
+    """Write the body of ``resp`` into ``fd`` from ``offset`` up to ``end``."""
+    while offset < end:
+        chunk = await resp.content.read(min(chunk_size, end - offset))
+        if not chunk:
+            raise DownloadError("{} is truncated at byte {} of {}!".format(get_loggable_url(str(resp.url)), offset, end))
+        os.pwrite(fd, chunk, offset)
+        offset += len(chunk)
+
+
+async def _download_in_parts(context, session, url, auth, resp, path, length, validator, chunk_size):
+    """Download ``url`` to ``path`` as ranged parts, fetched concurrently.
+
+    ``resp`` is the response to a plain GET, which mustn't be encoded: the
+    first part is read from it, so small downloads cost no extra request.  The
+    other parts are fetched unencoded, with ``Range`` and ``If-Range``, by this
+    call and by helpers that each take a slot from
+    ``context.download_semaphore``.  This call doesn't wait for a slot itself,
+    since it already runs in one; if none are free it fetches every part.
+
+    Returns:
+        int: the number of bytes downloaded.
+
+    Raises:
+        DownloadError: if a part fails, or the file changes on the server.
+
+    """
+    part_size = context.config["download_part_size_mb"] * 1024 * 1024
+    ranges = deque((offset, min(offset + part_size, length)) for offset in range(part_size, length, part_size))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    started = set()
+
+    async def fetch_ranges():
+        while ranges:
+            offset, end = ranges.popleft()
+            headers = {"Range": "bytes={}-{}".format(offset, end - 1), "If-Range": validator, "Accept-Encoding": "identity"}
+            async with breakers.guard(url), session.get(url, auth=auth, headers=headers) as part_resp:
+                if part_resp.status != 206 or _get_content_range(part_resp) != (offset, length) or _is_encoded(part_resp):
+                    raise DownloadError(
+                        "{} changed during the download: got status {} for bytes {}-{}".format(get_loggable_url(url), part_resp.status, offset, end - 1),
+                        status=part_resp.status,
+                    )
+                await _read_range_into(part_resp, fd, offset, end, chunk_size)
+
+    async def helper(index):
+        async with context.download_semaphore:
+            started.add(index)
+            await fetch_ranges()
+
+    helpers = []
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, length)
+        else:
+            os.ftruncate(fd, length)
+        helpers = [asyncio.ensure_future(helper(index)) for index in range(min(len(ranges), context.config["max_concurrent_downloads"]))]
+        await _read_range_into(resp, fd, 0, min(part_size, length), chunk_size)
+        resp.close()
+        await fetch_ranges()
+        # The helpers still waiting for a slot have nothing left to do.
+        for index, future in enumerate(helpers):
+            if index not in started:
+                future.cancel()
+        await asyncio.wait(helpers)
+        for future in helpers:
+            if not future.cancelled() and future.exception():
+                raise future.exception()
+    finally:
+        for future in helpers:
+            future.cancel()
+        if helpers:
+            await asyncio.wait(helpers)
+        os.close(fd)
+    registry.inc("download_parts_total", -(-length // part_size))
+    return length
+
+
+# DownloadCache {{{1
+def _link_or_copy(source: str, destination: str) -> None:
+    makedirs(os.path.dirname(destination))
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class DownloadCache(object):
+    """Download each url once, and hand out links to the file.
+
+    Set ``context.download_cache`` to share downloads between the contexts of
+    several tasks, e.g. when ``verify_cot`` verifies a whole task group, whose
+    tasks all download the same decision task artifacts.  The first
+    ``download_file`` of a url downloads it into ``path``; the others wait for
+    that download, and get a hard link to (or a copy of) the file.
+
+    Only use this for urls whose contents don't change, like Taskcluster
+    artifacts.  A failed download isn't cached, so it can be retried.
+
+    Attributes:
+        path (str): the directory the downloads are kept in.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        """Initialize DownloadCache.
+
+        Args:
+            path (str): the directory to keep the downloads in.
+
+        """
+        self.path = path
+        self._downloads: Dict[str, "asyncio.Future[str]"] = {}
+
+    async def _download(self, url: str, download: Callable[[str], Awaitable[Any]]) -> str:
+        cache_path = os.path.join(self.path, hashlib.sha256(url.encode("utf-8")).hexdigest())
+        try:
+            await download(cache_path)
+        except BaseException:
+            self._downloads.pop(url, None)
+            raise
+        return cache_path
+
+    async def fetch(
+        self, url: str, abs_filename: str, download: Callable[[str], Awaitable[Any]], hash_algs: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, str]]:
+        """Put the contents of ``url`` in ``abs_filename``, downloading it if needed.
+
+        Args:
+            url (str): the url to download.
+            abs_filename (str): the path to put the file in.
+            download (callable): an async function that downloads ``url`` to
+                the path it's called with.
+            hash_algs (list, optional): if set, hash ``abs_filename``.
+                Defaults to None.
+
+        Returns:
+            dict: the hexdigest per algorithm in ``hash_algs``, or None if
+                ``hash_algs`` is None.
+
+        Raises:
+            Exception: on download failure.
+
+        """
+        future = self._downloads.get(url)
+        if future is None:
+            future = self._downloads[url] = asyncio.ensure_future(self._download(url, download))
+            # The waiter that started the download may be cancelled; don't warn
+            # about a failure nobody else waited for.
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        else:
+            registry.inc("cache_hits_total", cache="download")
+        cache_path = await asyncio.shield(future)
+        _link_or_copy(cache_path, abs_filename)
+        if hash_algs:
+            return await get_hashes_async(abs_filename, tuple(hash_algs))
+        return None
+
+
+async def download_file(context, url, abs_filename, session=None, chunk_size=DOWNLOAD_CHUNK_SIZE, auth=None, hash_algs=None):
     """Download a file, async.
 
+    If ``context.download_cache`` is a ``DownloadCache``, the file comes from
+    it instead; see ``DownloadCache``.
+
+    The download goes to ``abs_filename + ".part"`` first.  If it fails with a
+    connection error or timeout, and the server sent an ETag or Last-Modified
+    header, the partial file is kept, and the next call for the same url and
+    path asks for the rest with a ``Range`` and ``If-Range`` header.  If the
+    file changed on the server in the meantime, the server sends all of it; if
+    it sends a range with a different validator anyway, the partial file is
+    removed and the download fails, so the retry starts over.
+
+    Files of at least ``download_parallel_threshold_mb`` whose server supports
+    ranges are downloaded in ``download_part_size_mb`` parts, over several
+    connections; see ``_download_in_parts``.  Those downloads aren't resumed,
+    and are hashed once complete.
+
     Args:
         context (scriptworker.context.Context): the scriptworker context.
         url (str): the url to download
@@ -663,9 +1199,27 @@ async def download_file(context, url, abs_filename, session=None, chunk_size=128
         session (aiohttp.ClientSession, optional): the session to use.  If
             None, use context.session.  Defaults to None.
         chunk_size (int, optional): the chunk size to read from the response
-            at a time.  Default is 128.
+            at a time.  Default is 64 KiB.
+        hash_algs (list, optional): if set, hash the file while downloading it.
+            On resume, only the partial file is re-read.  Defaults to None.
+
+    Returns:
+        dict: the hexdigest per algorithm in ``hash_algs``, or None if
+            ``hash_algs`` is None.
+
+    Raises:
+        Download404: on a 404.
+        DownloadError: on any other bad status, or a truncated download.
 
     """
+    cache = getattr(context, "download_cache", None)
+    if isinstance(cache, DownloadCache):
+        download = functools.partial(_download_file, context, url, session=session, chunk_size=chunk_size, auth=auth)
+        return await cache.fetch(url, abs_filename, download, hash_algs=hash_algs)
+    return await _download_file(context, url, abs_filename, session=session, chunk_size=chunk_size, auth=auth, hash_algs=hash_algs)
+
+
+async def _download_file(context, url, abs_filename, session=None, chunk_size=DOWNLOAD_CHUNK_SIZE, auth=None, hash_algs=None):
     session = session or context.session
     loggable_url = get_loggable_url(url)
     if auth:
@@ -673,30 +1227,98 @@ async def download_file(context, url, abs_filename, session=None, chunk_size=128
     else:
         log.info("Downloading %s", loggable_url)
     parent_dir = os.path.dirname(abs_filename)
-    async with session.get(url, auth=auth) as resp:
-        if resp.status == 404:
-            await _log_download_error(resp, "404 downloading %(url)s: %(status)s; body=%(body)s")
-            raise Download404("{} status {}!".format(loggable_url, resp.status))
-        elif resp.status != 200:
-            await _log_download_error(resp, "Failed to download %(url)s: %(status)s; body=%(body)s")
-            raise DownloadError("{} status {} is not 200!".format(loggable_url, resp.status))
-        makedirs(parent_dir)
-        tmp_filename = "{}.{}.part".format(abs_filename, uuid.uuid4().hex)
-        try:
-            with open(tmp_filename, "wb") as fd:
-                while True:
-                    chunk = await resp.content.read(chunk_size)
-                    if not chunk:
-                        break
-                    fd.write(chunk)
-            os.replace(tmp_filename, abs_filename)
-        except Exception:
-            try:
-                os.unlink(tmp_filename)
-            except OSError:
-                pass
-            raise
-    log.info("Done")
+    part_path = "{}.part".format(abs_filename)
+    info_path = "{}.json".format(part_path)
+    start = time.monotonic()
+    num_bytes = 0
+    hashes = [hashlib.new(hash_alg) for hash_alg in hash_algs or ()]
+    async with _download_lock(abs_filename):
+        with span("download_file", url=loggable_url) as download_span:
+            resume_info = _get_resume_info(url, part_path, info_path)
+            headers = {}
+            if resume_info:
+                headers = {"Range": "bytes={}-".format(resume_info["size"]), "If-Range": resume_info["validator"]}
+            async with breakers.guard(url), session.get(url, auth=auth, headers=headers) as resp:
+                download_span.set_attribute("http.status_code", resp.status)
+                if resp.status == 404:
+                    await _log_download_error(resp, "404 downloading %(url)s: %(status)s; body=%(body)s")
+                    raise Download404("{} status {}!".format(loggable_url, resp.status))
+                elif resp.status == 206 and resume_info:
+                    first_byte, length = _get_content_range(resp)
+                    if first_byte != resume_info["size"] or length != resume_info["length"]:
+                        _remove_files(part_path, info_path)
+                        raise DownloadError("{} sent an unexpected range {}!".format(loggable_url, resp.headers.get("Content-Range")))
+                    if _is_encoded(resp):
+                        _remove_files(part_path, info_path)
+                        raise DownloadError("{} sent an encoded range!".format(loggable_url))
+                    if _get_resume_validator(resp) != resume_info["validator"]:
+                        # The server ignored If-Range, and the file changed.
+                        _remove_files(part_path, info_path)
+                        raise DownloadError("{} changed since the partial download!".format(loggable_url))
+                    log.info("Resuming %s at byte %s of %s", loggable_url, first_byte, length)
+                    registry.inc("download_resumes_total")
+                    download_span.set_attribute("resumed_from", first_byte)
+                    if hashes:
+                        await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), _update_hashes, part_path, hashes)
+                    mode = "ab"
+                    in_parts = False
+                elif resp.status == 200:
+                    if _is_encoded(resp):
+                        # aiohttp decodes the body, so Content-Length and byte
+                        # offsets don't match what's written: don't check the
+                        # length, resume, or download in parts.
+                        length, validator = None, None
+                    else:
+                        length, validator = resp.content_length, _get_resume_validator(resp)
+                    threshold = context.config["download_parallel_threshold_mb"] * 1024 * 1024
+                    in_parts = bool(validator and threshold and length >= threshold and resp.headers.get("Accept-Ranges", "").lower() == "bytes")
+                    makedirs(parent_dir)
+                    if validator and not in_parts:
+                        write_to_file(info_path, {"url": url, "validator": validator, "length": length}, file_type="json")
+                    else:
+                        _remove_files(info_path)
+                    mode = "wb"
+                else:
+                    await _log_download_error(resp, "Failed to download %(url)s: %(status)s; body=%(body)s")
+                    _remove_files(part_path, info_path)
+                    raise DownloadError("{} status {} is not 200!".format(loggable_url, resp.status), status=resp.status)
+                try:
+                    if in_parts:
+                        log.info("Downloading %s in %s MB parts", loggable_url, context.config["download_part_size_mb"])
+                        size = num_bytes = await _download_in_parts(context, session, url, auth, resp, part_path, length, validator, chunk_size)
+                        if hashes:
+                            await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), _update_hashes, part_path, hashes)
+                    else:
+                        with open(part_path, mode) as fd:
+                            while True:
+                                chunk = await resp.content.read(chunk_size)
+                                if not chunk:
+                                    break
+                                fd.write(chunk)
+                                for h in hashes:
+                                    h.update(chunk)
+                                num_bytes += len(chunk)
+                            size = fd.tell()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if not os.path.exists(info_path):
+                        _remove_files(part_path)
+                    raise
+                except BaseException:
+                    _remove_files(part_path, info_path)
+                    raise
+                finally:
+                    registry.inc("download_bytes_total", num_bytes)
+                if length is not None and size != length:
+                    if size > length or not os.path.exists(info_path):
+                        _remove_files(part_path, info_path)
+                    raise DownloadError("{} is truncated: got {} of {} bytes!".format(loggable_url, size, length))
+                os.replace(part_path, abs_filename)
+                _remove_files(info_path)
+            download_span.set_attribute("bytes", num_bytes)
+            registry.observe("download_duration_seconds", time.monotonic() - start)
+            log.info("Done")
+    if hash_algs is not None:
+        return {hash_alg: h.hexdigest() for hash_alg, h in zip(hash_algs, hashes)}
 
 
 # get_loggable_url {{{1
@@ -763,6 +1385,8 @@ async def load_json_or_yaml_from_url(context: Context, url: str, path: str, over
         kwargs = {"auth": auth}
     if not overwrite or not os.path.exists(path):
         await retry_async(download_file, args=(context, url, path), kwargs=kwargs, retry_exceptions=(DownloadError, aiohttp.ClientError, asyncio.TimeoutError))
+    else:
+        registry.inc("cache_hits_total", cache="url")
     return load_json_or_yaml(path, is_path=True, file_type=file_type)
 
 
@@ -782,7 +1406,7 @@ def match_url_path_callback(match: Match[str]) -> str:
 
 
 # match_url_regex {{{1
-def match_url_regex(rules: Tuple[Any], url: str, callback: Callable[[Match[str]], Any]) -> Any:
+def match_url_regex(rules: Union[Tuple[Any], "UrlRules"], url: str, callback: Callable[[Match[str]], Any]) -> Any:
     """Given rules and a callback, find the rule that matches the url.
 
     Rules look like::
@@ -800,7 +1424,8 @@ def match_url_regex(rules: Tuple[Any], url: str, callback: Callable[[Match[str]]
 
     Args:
         rules (list): a list of dictionaries specifying lists of ``schemes``,
-            ``netlocs``, and ``path_regexes``.
+            ``netlocs``, and ``path_regexes``, or ``UrlRules``.  They're
+            compiled with ``compile_url_rules``.
         url (str): the url to test
         callback (function): a callback that takes an ``re.MatchObject``.
             If it returns None, continue searching.  Otherwise, return the
@@ -810,20 +1435,80 @@ def match_url_regex(rules: Tuple[Any], url: str, callback: Callable[[Match[str]]
         value: the value from the callback, or None if no match.
 
     """
-    parts = urlparse(url)
-    path = unquote(parts.path)
-    for rule in rules:
-        if parts.scheme not in rule["schemes"]:
-            continue
-        if parts.netloc not in rule["netlocs"]:
-            continue
-        for regex in rule["path_regexes"]:
-            m = re.search(regex, path)
-            if m is None:
-                continue
-            result = callback(m)
-            if result is not None:
-                return result
+    for m in compile_url_rules(rules).find_matches(url):
+        result = callback(m)
+        if result is not None:
+            return result
+    return None
+
+
+# UrlRules {{{1
+class UrlRules(object):
+    """``match_url_regex`` rules, compiled.
+
+    The ``path_regexes`` are compiled once, and grouped by ``(scheme, netloc)``
+    so a url is only searched with the regexes of the rules it can match.
+    The matches are memoized per url.
+
+    Attributes:
+        rules_by_location (dict): the compiled path regexes per
+            ``(scheme, netloc)``, in rule order.
+
+    """
+
+    def __init__(self, rules: Sequence[Any], max_cached_urls: int = 4096) -> None:
+        """Initialize UrlRules.
+
+        Args:
+            rules (list): a list of dictionaries specifying lists of ``schemes``,
+                ``netlocs``, and ``path_regexes``.
+            max_cached_urls (int, optional): how many urls to memoize the
+                matches of.  Defaults to 4096.
+
+        """
+        self.rules_by_location: Dict[Tuple[str, str], List[Pattern[str]]] = {}
+        for rule in rules:
+            regexes = [re.compile(regex) for regex in rule.get("path_regexes", ())]
+            for scheme in rule.get("schemes", ()):
+                for netloc in rule.get("netlocs", ()):
+                    self.rules_by_location.setdefault((scheme, netloc), []).extend(regexes)
+        self.find_matches = functools.lru_cache(maxsize=max_cached_urls)(self._find_matches)
+
+    def _find_matches(self, url: str) -> Tuple[Match[str], ...]:
+        parts = urlparse(url)
+        regexes = self.rules_by_location.get((parts.scheme, parts.netloc))
+        if not regexes:
+            return ()
+        path = unquote(parts.path)
+        return tuple(m for m in (regex.search(path) for regex in regexes) if m is not None)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_hashable_url_rules(rules: Tuple[Any, ...]) -> UrlRules:
+    return UrlRules(rules)
+
+
+def compile_url_rules(rules: Union[Sequence[Any], UrlRules]) -> UrlRules:
+    """Compile ``match_url_regex`` rules, once per set of rules.
+
+    Frozen config rules (tuples of ``immutabledict``s) are compiled once and
+    reused; other rules are compiled on every call.
+
+    Args:
+        rules (list): a list of dictionaries specifying lists of ``schemes``,
+            ``netlocs``, and ``path_regexes``, or ``UrlRules``, which are
+            returned as is.
+
+    Returns:
+        UrlRules: the compiled rules.
+
+    """
+    if isinstance(rules, UrlRules):
+        return rules
+    try:
+        return _compile_hashable_url_rules(rules)
+    except TypeError:
+        return UrlRules(rules)
 
 
 # add_enumerable_item_to_dict {{{1
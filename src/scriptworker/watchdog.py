@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Event loop watchdog.
+
+Anything that blocks the event loop delays reclaims, downloads, and signal
+handling.  ``EventLoopWatchdog`` schedules a heartbeat callback on the loop and
+watches it from a separate thread.  When the heartbeat is late by more than
+the threshold, the thread logs a stack snapshot of the loop thread, so the log
+shows what was blocking rather than just that something was.
+
+The cost is one ``call_later`` callback on the loop and one mostly-sleeping
+thread per interval, so it can stay on in production.
+
+Attributes:
+    log (logging.Logger): the log object for the module.
+
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from scriptworker.metrics import registry
+
+log = logging.getLogger(__name__)
+
+
+# EventLoopWatchdog {{{1
+class EventLoopWatchdog(object):
+    """Detect and report event loop stalls.
+
+    Attributes:
+        loop (asyncio.AbstractEventLoop): the loop being watched.
+        threshold (float): the heartbeat lateness, in seconds, that counts as
+            a stall.
+        interval (float): the seconds between heartbeats.
+
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float, interval: Optional[float] = None) -> None:
+        """Initialize EventLoopWatchdog.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): the loop to watch.
+            threshold (float): the heartbeat lateness, in seconds, that counts
+                as a stall.
+            interval (float, optional): the seconds between heartbeats.
+                Defaults to half of ``threshold``.
+
+        """
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval or threshold / 2
+        self._loop_thread_id: Optional[int] = None
+        self._expected_beat = 0.0
+        self._snapshot_taken = False
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the heartbeat and the watchdog thread."""
+        self._stopped.clear()
+        self._expected_beat = time.monotonic() + self.interval
+        self._handle = self.loop.call_later(self.interval, self._beat)
+        self._thread = threading.Thread(target=self._watch, name="scriptworker-loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the heartbeat and the watchdog thread."""
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _beat(self) -> None:
+        # Runs on the loop.
+        now = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        lag = now - self._expected_beat
+        if lag > self.threshold:
+            registry.inc("event_loop_blocked_total")
+            registry.observe("event_loop_blocked_seconds", lag)
+            log.warning("Event loop was blocked for {:.3f} seconds".format(lag))
+        self._snapshot_taken = False
+        if not self._stopped.is_set():
+            self._expected_beat = now + self.interval
+            self._handle = self.loop.call_later(self.interval, self._beat)
+
+    def _watch(self) -> None:
+        # Runs in the watchdog thread.
+        while not self._stopped.wait(self.interval):
+            if self._loop_thread_id is None or self._snapshot_taken:
+                continue
+            lag = time.monotonic() - self._expected_beat
+            if lag > self.threshold and self.loop.is_running():
+                self._snapshot_taken = True
+                self.log_loop_stack(lag)
+
+    def log_loop_stack(self, lag: float) -> None:
+        """Log the current stack of the loop thread.
+
+        Args:
+            lag (float): how late the heartbeat is, in seconds.
+
+        """
+        frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore[arg-type]
+        if frame is None:
+            return
+        registry.inc("event_loop_stack_snapshots_total")
+        log.warning("Event loop blocked for {:.3f} seconds so far; loop thread stack:\n{}".format(lag, "".join(traceback.format_stack(frame)).rstrip()))
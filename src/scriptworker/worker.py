@@ -8,9 +8,11 @@ Attributes:
 
 import asyncio
 import logging
+import os
 import signal
 import socket
 import sys
+import time
 import typing
 from typing import Any
 
@@ -18,14 +20,20 @@ import aiohttp
 import arrow
 
 from scriptworker.artifacts import upload_artifacts
+from scriptworker.circuit import breakers
 from scriptworker.config import get_context_from_cmdln
 from scriptworker.constants import STATUSES
 from scriptworker.cot.generate import generate_cot
 from scriptworker.cot.verify import ChainOfTrust, verify_chain_of_trust
+from scriptworker.disk import DiskSpaceMonitor
 from scriptworker.exceptions import ScriptWorkerException, WorkerShutdownDuringTask
+from scriptworker.metrics import TaskTimings, monitor_event_loop_lag, registry, start_metrics_server, timed, write_task_timings
 from scriptworker.task import claim_work, complete_task, prepare_to_run_task, reclaim_task, run_task, worst_level
 from scriptworker.task_process import TaskProcess
+from scriptworker.trace import configure_tracing, span
+from scriptworker.trash import get_trash_collector
 from scriptworker.utils import cleanup, filepaths_in_dir, scriptworker_session
+from scriptworker.watchdog import EventLoopWatchdog
 
 log = logging.getLogger(__name__)
 
@@ -53,9 +61,14 @@ async def do_run_task(context, run_cancellable, to_cancellable_process):
     try:
         if context.config["verify_chain_of_trust"]:
             chain = ChainOfTrust(context, context.config["cot_job_type"])
-            await run_cancellable(verify_chain_of_trust(chain))
-        status = await run_task(context, to_cancellable_process)
-        generate_cot(context)
+            with timed(context, "verify_chain_of_trust"):
+                await run_cancellable(verify_chain_of_trust(chain))
+        with timed(context, "run_task"):
+            status = await run_task(context, to_cancellable_process)
+        with timed(context, "generate_cot"):
+            # Hashing the artifacts and signing can take a while; keep the
+            # event loop free for the reclaim loop.
+            await asyncio.get_running_loop().run_in_executor(None, generate_cot, context)
     except asyncio.CancelledError:
         log.info("CoT cancelled asynchronously")
         raise WorkerShutdownDuringTask
@@ -100,6 +113,51 @@ async def do_upload(context, files):
     return status
 
 
+# get_artifact_paths {{{1
+def get_artifact_paths(context):
+    """Get the relative paths of the files in ``artifact_dir`` to upload.
+
+    ``generate_cot`` leaves the full list in ``context.artifact_manifest``; only
+    walk ``artifact_dir`` again if there's no manifest, e.g. because the task
+    failed before ``generate_cot`` ran.
+
+    args:
+        context (scriptworker.context.Context): the scriptworker context.
+
+    Returns:
+        list: the relative paths.
+
+    """
+    manifest = context.artifact_manifest
+    if manifest is not None and manifest.path == context.config["artifact_dir"]:
+        return manifest.filepaths()
+    return filepaths_in_dir(context.config["artifact_dir"])
+
+
+# upload_task_timings {{{1
+async def upload_task_timings(context):
+    """Write ``timings.json`` after the artifact upload, and upload it on its own.
+
+    This way the timings include the upload.  ``complete_task`` has to come
+    after the last upload, so it's only recorded in the in-process histograms.
+
+    args:
+        context (scriptworker.context.Context): the scriptworker context.
+
+    Returns:
+        int: exit status
+
+    """
+    path = write_task_timings(context)
+    if path is None:
+        return 0
+    target_path = os.path.relpath(path, context.config["artifact_dir"])
+    if target_path.startswith(os.pardir):
+        # task_log_dir isn't in artifact_dir
+        return 0
+    return await do_upload(context, [target_path])
+
+
 class RunTasks:
     """Manages processing of Taskcluster tasks."""
 
@@ -121,8 +179,14 @@ class RunTasks:
         try:
             # Note: claim_work(...) might not be safely interruptible! See
             # https://bugzilla.mozilla.org/show_bug.cgi?id=1524069
+            if context.disk_monitor is not None and not await self._run_cancellable(context.disk_monitor.ensure_space()):
+                return None
+            claim_start = time.monotonic()
             tasks = await self._run_cancellable(claim_work(context))
+            claim_duration = time.monotonic() - claim_start
+            registry.observe("stage_duration_seconds", claim_duration, stage="claim_work")
             if not tasks or not tasks.get("tasks", []):
+                registry.inc("claimwork_empty_polls_total")
                 await self._run_cancellable(asyncio.sleep(context.config["poll_interval"]))
                 return None
 
@@ -131,17 +195,34 @@ class RunTasks:
             # be the status of the final task run.
             status = None
             for task_defn in tasks.get("tasks", []):
-                prepare_to_run_task(context, task_defn)
-                reclaim_fut = context.event_loop.create_task(reclaim_task(context, context.task))
-                try:
-                    status = await do_run_task(context, self._run_cancellable, self._to_cancellable_process)
-                except WorkerShutdownDuringTask:
-                    status = STATUSES["worker-shutdown"]
-                artifacts_paths = filepaths_in_dir(context.config["artifact_dir"])
-                status = worst_level(status, await do_upload(context, artifacts_paths))
-                await complete_task(context, status)
-                reclaim_fut.cancel()
-                cleanup(context)
+                registry.inc("tasks_claimed_total")
+                context.task_timings = TaskTimings()
+                context.task_timings.record("claim_work", claim_duration)
+                claim_duration = 0.0
+                with span("task", taskId=task_defn.get("status", {}).get("taskId", ""), runId=task_defn.get("runId", -1)) as task_span:
+                    with timed(context, "prepare_to_run_task"):
+                        prepare_to_run_task(context, task_defn)
+                    reclaim_fut = context.event_loop.create_task(reclaim_task(context, context.task))
+                    try:
+                        status = await do_run_task(context, self._run_cancellable, self._to_cancellable_process)
+                    except WorkerShutdownDuringTask:
+                        status = STATUSES["worker-shutdown"]
+                    artifacts_paths = get_artifact_paths(context)
+                    with timed(context, "do_upload"):
+                        status = worst_level(status, await do_upload(context, artifacts_paths))
+                    status = worst_level(status, await upload_task_timings(context))
+                    task_span.set_attribute("status", status)
+                    with timed(context, "complete_task"):
+                        await complete_task(context, status)
+                    reclaim_fut.cancel()
+                    if context.disk_monitor is not None:
+                        await asyncio.get_running_loop().run_in_executor(None, context.disk_monitor.record_task_usage)
+                    with timed(context, "cleanup"):
+                        # cleanup() may wait for the trash to drain; keep the loop running.
+                        await asyncio.get_running_loop().run_in_executor(None, cleanup, context)
+                    context.task_timings = None
+                    # Keep projects.yml warm for the next task's chain of trust verification.
+                    context.refresh_projects_if_stale()
 
             return status
 
@@ -227,6 +308,7 @@ def main(event_loop=None):
     log.info("Scriptworker starting up at {} UTC".format(arrow.utcnow().format()))
     log.info("Worker FQDN: {}".format(socket.getfqdn()))
     cleanup(context)
+    configure_tracing(context.config["trace_path"], context.config["trace_sample_percent"] / 100)
     context.event_loop = event_loop or asyncio.get_event_loop()
 
     done = False
@@ -249,12 +331,37 @@ def main(event_loop=None):
     context.event_loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(_handle_sigterm()))
     context.event_loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.ensure_future(_handle_sigusr1()))
 
+    breakers.configure(context.config["circuit_breaker_failures"], context.config["circuit_breaker_reset_seconds"], context.config["retry_budget_per_minute"])
+    metrics_runner = context.event_loop.run_until_complete(start_metrics_server(context))
+    if metrics_runner is not None:
+        lag_fut = context.event_loop.create_task(monitor_event_loop_lag())
+    evictors = []
+    if context.config["max_pending_trash"]:
+        collector = get_trash_collector(context.config["max_pending_trash"])
+        evictors.append(lambda: collector.wait(timeout=context.config["reclaim_interval"]))
+    if context.config["min_free_disk_mb"]:
+        context.disk_monitor = DiskSpaceMonitor(
+            (context.config["work_dir"], context.config["artifact_dir"]), min_free_bytes=context.config["min_free_disk_mb"] * 1024 * 1024, evictors=evictors
+        )
+    watchdog = None
+    if context.config["event_loop_stall_threshold_ms"]:
+        watchdog = EventLoopWatchdog(context.event_loop, context.config["event_loop_stall_threshold_ms"] / 1000)
+        watchdog.start()
+
     while not done:
         try:
             context.event_loop.run_until_complete(async_main(context, credentials))
+            if context.disk_monitor is not None and context.disk_monitor.out_of_space:
+                log.critical("Not enough disk space for another task; no more tasks will be taken")
+                done = True
         except Exception:
             log.critical("Fatal exception", exc_info=1)
             raise
     else:
+        if watchdog is not None:
+            watchdog.stop()
+        if metrics_runner is not None:
+            lag_fut.cancel()
+            context.event_loop.run_until_complete(metrics_runner.cleanup())
         log.info("Scriptworker stopped at {} UTC".format(arrow.utcnow().format()))
         log.info("Worker FQDN: {}".format(socket.getfqdn()))
@@ -7,6 +7,7 @@ import aiohttp
 import pytest
 import taskcluster.exceptions
 
+from scriptworker.circuit import breakers
 from scriptworker.config import apply_product_config, get_unfrozen_copy
 from scriptworker.constants import DEFAULT_CONFIG
 from scriptworker.context import Context
@@ -60,6 +61,13 @@ class UnsuccessfulQueue(object):
         raise taskcluster.exceptions.TaskclusterRestFailure("foo", None, status_code=self.status)
 
 
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Don't let host failures in one test open circuits in the next."""
+    yield
+    breakers.configure(DEFAULT_CONFIG["circuit_breaker_failures"], DEFAULT_CONFIG["circuit_breaker_reset_seconds"], DEFAULT_CONFIG["retry_budget_per_minute"])
+
+
 @pytest.fixture(scope="function")
 def successful_queue():
     return SuccessfulQueue()
@@ -83,6 +83,28 @@ async def test_upload_artifacts(context):
     assert create_artifact_paths == [os.path.join(context.config["artifact_dir"], "one"), os.path.join(context.config["artifact_dir"], "public/two")]
 
 
+@pytest.mark.asyncio
+async def test_upload_artifacts_manifest(context):
+    sizes = {}
+    for target_path, contents in (("one.bin", "x" * 10), ("public/two.log", "y" * 1000)):
+        path = os.path.join(context.config["artifact_dir"], target_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fh:
+            fh.write(contents)
+
+    async def foo(_, path, target_path, size=None, **kwargs):
+        sizes[target_path] = size
+
+    manifest = context.scan_artifact_dir()
+    with mock.patch("scriptworker.artifacts.create_artifact", new=foo):
+        await upload_artifacts(context, ["one.bin", "public/two.log"])
+
+    # the log was gzipped, and its manifest entry refreshed
+    assert sizes["one.bin"] == 10
+    assert sizes["public/two.log"] == os.path.getsize(os.path.join(context.config["artifact_dir"], "public/two.log")) < 1000
+    assert manifest.entries["public/two.log"].size == sizes["public/two.log"]
+
+
 @pytest.mark.asyncio
 async def test_upload_artifacts_throws(context, mocker):
     exceptions = [None, ArithmeticError]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test the benchmarks against the fake Taskcluster."""
+
+import json
+import os
+
+import pytest
+
+from benchmarks import bench, load
+
+SMALL_ARGS = [
+    "--repeat",
+    "2",
+    "--warmup",
+    "0",
+    "--size-mb",
+    "1",
+    "--num-files",
+    "10",
+    "--upload-files",
+    "2",
+    "--builds",
+    "2",
+    "--depth",
+    "2",
+    "--artifacts-per-build",
+    "2",
+    "--artifact-size-mb",
+    "1",
+    "--graph-tasks",
+    "40",
+]
+
+
+# main {{{1
+@pytest.mark.parametrize("extra_args", ([], ["--wildcard"]))
+def test_bench_main(tmpdir, extra_args):
+    output = os.path.join(tmpdir, "results.json")
+    assert bench.main(SMALL_ARGS + extra_args + ["--output", output]) == 0
+    with open(output) as fh:
+        document = json.load(fh)
+    assert [result["name"] for result in document["results"]] == list(bench.BENCHMARKS)
+    for result in document["results"]:
+        assert result["repeat"] == 2
+        assert result["throughput"] > 0
+
+
+def test_bench_compare(tmpdir):
+    output = os.path.join(tmpdir, "results.json")
+    assert bench.main(SMALL_ARGS + ["--benchmark", "verify_chain_of_trust", "--output", output]) == 0
+    with open(output) as fh:
+        document = json.load(fh)
+    document["results"][0]["median"] /= 100
+    with open(output, "w") as fh:
+        json.dump(document, fh)
+    assert bench.main(SMALL_ARGS + ["--benchmark", "verify_chain_of_trust", "--compare", output]) == 1
+
+
+def test_compare():
+    baseline = {"results": [{"name": "a", "median": 1.0}, {"name": "b", "median": 1.0}]}
+    results = [{"name": "a", "median": 1.05}, {"name": "b", "median": 1.5}, {"name": "c", "median": 9.0}]
+    regressions = bench.compare(results, baseline, threshold=10)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("b regressed 50.0%")
+
+
+# load {{{1
+def test_percentile():
+    values = [5, 1, 4, 2, 3]
+    assert load.percentile(values, 50) == 3
+    assert load.percentile(values, 99) == 5
+    assert load.percentile(values, 0) == 1
+    assert load.percentile([7], 90) == 7
+
+
+def test_load_main(tmpdir):
+    output = os.path.join(tmpdir, "load.json")
+    args = ["--tasks", "2", "--cpu-mb", "1", "--io-mb", "1", "--log-lines", "10", "--timeout", "120", "--output", output]
+    assert load.main(args) == 0
+    with open(output) as fh:
+        results = json.load(fh)["results"]
+    assert results["resolutions"] == {"completed": 2}
+    assert results["tasks_per_hour"] > 0
+    for stage in ("verify_chain_of_trust", "run_task", "generate_cot", "upload_and_complete", "end_to_end"):
+        assert results["stages"][stage]["count"] == 2
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.circuit"""
+
+import asyncio
+
+import aiohttp
+import pytest
+from taskcluster.exceptions import TaskclusterFailure, TaskclusterRestFailure
+
+import scriptworker.circuit as circuit
+from scriptworker.circuit import CLOSED, HALF_OPEN, OPEN, HostCircuit, RetryBudget, breakers, get_host, get_queue_url, is_host_failure
+from scriptworker.exceptions import CircuitOpenError, Download404, DownloadError, ScriptWorkerException, ScriptWorkerRetryException
+from scriptworker.metrics import registry
+from scriptworker.utils import retry_async
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(mocker):
+    fake = FakeClock()
+    mocker.patch.object(circuit.time, "monotonic", new=fake)
+    return fake
+
+
+async def _fail(host, exc):
+    async with breakers.guard(host):
+        raise exc
+
+
+async def _succeed(host):
+    async with breakers.guard(host):
+        return "ok"
+
+
+# get_host {{{1
+@pytest.mark.parametrize(
+    "url, expected",
+    (
+        ("https://queue.example.com/api/queue/v1/task/x", "queue.example.com"),
+        ("http://localhost:8080/x", "localhost:8080"),
+        ("queue.example.com", "queue.example.com"),
+        ("", None),
+        (None, None),
+    ),
+)
+def test_get_host(url, expected):
+    assert get_host(url) == expected
+
+
+def test_get_queue_url(mocker):
+    queue = mocker.MagicMock()
+    assert get_queue_url(queue) is None
+    queue.options = {"rootUrl": "https://tc.example.com"}
+    assert get_queue_url(queue) == "https://tc.example.com"
+
+
+# is_host_failure {{{1
+@pytest.mark.parametrize(
+    "exc, expected",
+    (
+        (aiohttp.ClientConnectionError(), True),
+        (asyncio.TimeoutError(), True),
+        (ScriptWorkerRetryException("500", status=500), True),
+        (ScriptWorkerRetryException("no status"), False),
+        (DownloadError("503", status=503), True),
+        (DownloadError("403", status=403), False),
+        (DownloadError("truncated"), False),
+        (aiohttp.ClientResponseError(None, (), status=502), True),
+        (aiohttp.ClientResponseError(None, (), status=410), False),
+        (TaskclusterRestFailure("x", None, status_code=502), True),
+        (TaskclusterRestFailure("x", None, status_code=409), False),
+        (TaskclusterFailure("empty"), False),
+        (Download404("404"), False),
+        (ScriptWorkerException("403"), False),
+        (CircuitOpenError("open"), False),
+    ),
+)
+def test_is_host_failure(exc, expected):
+    assert is_host_failure(exc) is expected
+
+
+# RetryBudget {{{1
+def test_retry_budget(clock):
+    budget = RetryBudget(2)
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    clock.now += 30
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    clock.now += 3600
+    assert budget.tokens == 2
+
+
+def test_retry_budget_unlimited():
+    budget = RetryBudget(0)
+    for _ in range(1000):
+        assert budget.withdraw()
+
+
+# HostCircuit {{{1
+@pytest.mark.asyncio
+async def test_circuit_opens_and_fails_fast(clock):
+    breakers.configure(3, 30, 0)
+    for _ in range(3):
+        with pytest.raises(DownloadError):
+            await _fail("host", DownloadError("503", status=503))
+    assert breakers.get("host").state == OPEN
+    before = registry.get_counter("circuit_rejections_total", host="host")
+    with pytest.raises(CircuitOpenError):
+        await _succeed("host")
+    assert registry.get_counter("circuit_rejections_total", host="host") == before + 1
+    # other hosts are unaffected
+    assert await _succeed("other") == "ok"
+
+
+@pytest.mark.asyncio
+async def test_circuit_success_resets_failures(clock):
+    breakers.configure(2, 30, 0)
+    with pytest.raises(DownloadError):
+        await _fail("host", DownloadError("503", status=503))
+    # A 404 means the host is up.
+    with pytest.raises(Download404):
+        await _fail("host", Download404("404"))
+    with pytest.raises(DownloadError):
+        await _fail("host", DownloadError("503", status=503))
+    assert breakers.get("host").state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_circuit_disabled(clock):
+    breakers.configure(0, 30, 0)
+    for _ in range(20):
+        with pytest.raises(DownloadError):
+            await _fail("host", DownloadError("503", status=503))
+    assert breakers.get("host").state == CLOSED
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("probe_succeeds", (True, False))
+async def test_circuit_shared_probe(clock, probe_succeeds):
+    host_circuit = HostCircuit("host", 1, 30, 0)
+    host_circuit.record_failure()
+    assert host_circuit.state == OPEN
+    clock.now += 31
+    release_probe = asyncio.Event()
+    results = []
+
+    async def probe():
+        async with host_circuit.guard():
+            await release_probe.wait()
+            if not probe_succeeds:
+                raise aiohttp.ClientConnectionError()
+
+    async def waiter():
+        try:
+            async with host_circuit.guard():
+                results.append("ran")
+        except CircuitOpenError:
+            results.append("rejected")
+
+    probe_fut = asyncio.ensure_future(probe())
+    await asyncio.sleep(0)
+    assert host_circuit.state == HALF_OPEN
+    waiters = [asyncio.ensure_future(waiter()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert results == []
+    release_probe.set()
+    await asyncio.gather(probe_fut, *waiters, return_exceptions=True)
+    if probe_succeeds:
+        assert host_circuit.state == CLOSED
+        assert results == ["ran"] * 3
+    else:
+        assert host_circuit.state == OPEN
+        assert results == ["rejected"] * 3
+
+
+@pytest.mark.asyncio
+async def test_circuit_cancelled_probe(clock):
+    host_circuit = HostCircuit("host", 1, 30, 0)
+    host_circuit.record_failure()
+    clock.now += 31
+
+    async def probe():
+        async with host_circuit.guard():
+            await asyncio.sleep(60)
+
+    probe_fut = asyncio.ensure_future(probe())
+    await asyncio.sleep(0)
+    probe_fut.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe_fut
+    # the next caller gets to probe right away
+    assert host_circuit.state == OPEN
+    assert await host_circuit.acquire() is True
+    assert host_circuit.state == HALF_OPEN
+
+
+@pytest.mark.asyncio
+async def test_circuit_wait(clock, mocker):
+    host_circuit = HostCircuit("host", 1, 30, 0)
+    host_circuit.record_failure()
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    mocker.patch.object(circuit.asyncio, "sleep", new=fake_sleep)
+    assert await host_circuit.acquire(fail_fast=False) is True
+    assert sleeps == [30]
+
+
+# retry_async {{{1
+@pytest.mark.asyncio
+async def test_retry_async_budget(clock):
+    breakers.configure(0, 30, 2)
+    calls = []
+
+    async def download():
+        calls.append(1)
+        await _fail("https://s3.example.com/x", DownloadError("503", status=503))
+
+    before = registry.get_counter("retry_budget_exhausted_total", host="s3.example.com")
+    with pytest.raises(DownloadError):
+        await retry_async(download, attempts=10, sleeptime_kwargs={"delay_factor": 0}, retry_exceptions=(DownloadError,))
+    # one call plus two retries
+    assert len(calls) == 3
+    assert registry.get_counter("retry_budget_exhausted_total", host="s3.example.com") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_retry_async_unguarded_failures_ignore_budget(clock):
+    breakers.configure(0, 30, 1)
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        raise DownloadError("503", status=503)
+
+    with pytest.raises(DownloadError):
+        await retry_async(fail, attempts=4, sleeptime_kwargs={"delay_factor": 0}, retry_exceptions=(DownloadError,))
+    assert len(calls) == 4
+
+
+@pytest.mark.asyncio
+async def test_retry_async_circuit_open(clock):
+    breakers.configure(2, 30, 0)
+    calls = []
+
+    async def download():
+        calls.append(1)
+        await _fail("s3.example.com", DownloadError("503", status=503))
+
+    with pytest.raises(CircuitOpenError):
+        await retry_async(download, attempts=10, sleeptime_kwargs={"delay_factor": 0}, retry_exceptions=(ScriptWorkerRetryException, DownloadError))
+    # the third call is rejected without being retried
+    assert len(calls) == 3
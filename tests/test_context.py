@@ -5,13 +5,15 @@
 import asyncio
 import json
 import os
-from copy import deepcopy
 
+import aiohttp
 import mock
 import pytest
 
 import scriptworker.context as swcontext
 from scriptworker.exceptions import CoTError
+from scriptworker.projects import Projects
+from scriptworker.scheduler import PrioritySemaphore
 
 
 # constants helpers and fixtures {{{1
@@ -53,6 +55,19 @@ async def test_set_task(rw_context, claim_task):
     assert get_json(get_task_file(rw_context)) == claim_task["task"]
 
 
+def test_upstream_artifacts(rw_context, claim_task):
+    upstream_artifacts = [{"taskId": "build", "taskType": "build", "paths": ["public/target.dmg"], "optional": True}]
+    claim_task["task"]["payload"] = {"upstreamArtifacts": upstream_artifacts}
+    rw_context.claim_task = claim_task
+    index = rw_context.upstream_artifacts
+    assert index.is_optional("build", "public/target.dmg")
+    assert rw_context.upstream_artifacts is index
+    rw_context.task = {"payload": {"upstreamArtifacts": [{"taskId": "signing", "paths": ["public/target.apk"]}]}}
+    assert rw_context.upstream_artifacts.task_ids == ("signing",)
+    rw_context.claim_task = None
+    assert rw_context.upstream_artifacts.task_ids == ()
+
+
 @pytest.mark.asyncio
 async def test_set_reclaim_task(rw_context, claim_task, reclaim_task):
     rw_context.claim_task = claim_task
@@ -68,6 +83,7 @@ async def test_set_reclaim_task(rw_context, claim_task, reclaim_task):
 async def test_set_reset_task(rw_context, claim_task, reclaim_task):
     rw_context.claim_task = claim_task
     rw_context.reclaim_task = reclaim_task
+    rw_context.scan_artifact_dir()
     rw_context.claim_task = None
     assert rw_context.claim_task is None
     assert rw_context.task is None
@@ -75,38 +91,154 @@ async def test_set_reset_task(rw_context, claim_task, reclaim_task):
     assert rw_context.proc is None
     assert rw_context.temp_credentials is None
     assert rw_context.temp_queue is None
+    assert rw_context.artifact_manifest is None
+
+
+def test_scan_artifact_dir(rw_context):
+    with open(os.path.join(rw_context.config["artifact_dir"], "one"), "w") as fh:
+        fh.write("1")
+    manifest = rw_context.scan_artifact_dir()
+    assert manifest.filepaths() == ["one"]
+    assert rw_context.scan_artifact_dir() is manifest
+    rw_context.config["artifact_dir"] = rw_context.config["work_dir"]
+    assert rw_context.scan_artifact_dir() is not manifest
 
 
 @pytest.mark.asyncio
 async def test_projects(rw_context, mocker):
     fake_projects = {"mozilla-central": "blah", "count": 0}
+    calls = []
 
-    async def fake_load(*args):
+    async def fake_get(session, url, validators=None, **kwargs):
+        calls.append(validators)
+        if validators:
+            return None, validators
         fake_projects["count"] += 1
-        return deepcopy(fake_projects)
+        return json.dumps(fake_projects), {"ETag": '"v{}"'.format(fake_projects["count"])}
 
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=fake_load)
+    mocker.patch.object(swcontext, "get_if_modified", new=fake_get)
     assert rw_context.projects is None
     await rw_context.populate_projects()
     assert rw_context.projects == fake_projects
     # never set, must be fetched
-    assert fake_projects["count"] == 1
+    assert calls == [None]
+    # frozen once, not copied on access
+    assert rw_context.projects is rw_context.projects
+    assert isinstance(rw_context.projects, Projects)
 
+    projects = rw_context.projects
     await rw_context.populate_projects(force=True)
-    assert rw_context.projects == fake_projects
-    # forced, must be fetched
-    assert fake_projects["count"] == 2
+    # forced, must be fetched, but it's unchanged
+    assert calls == [None, {"ETag": '"v1"'}]
+    assert rw_context.projects is projects
 
     await rw_context.populate_projects()
-    assert rw_context.projects == fake_projects
-    # already exists, and age is less than a day, noop
-    assert fake_projects["count"] == 2
+    # already exists, and age is less than projects_refresh_seconds, noop
+    assert len(calls) == 2
+    assert rw_context.refresh_projects_if_stale() is None
 
     rw_context._projects_timestamp = 0.0
     await rw_context.populate_projects()
-    assert rw_context.projects == fake_projects
-    # age is more than a day, must be fetched
-    assert fake_projects["count"] == 3
+    # stale: refreshed in the background
+    assert len(calls) == 2
+    assert await rw_context.refresh_projects_if_stale() is True
+    assert len(calls) == 3
+    assert rw_context._projects_timestamp > 0
+
+
+def test_share_projects(rw_context):
+    other = swcontext.Context()
+    other.projects = Projects({"mozilla-central": {}})
+    other._projects_timestamp = 123.0
+    other._projects_validators = {"ETag": '"v1"'}
+    rw_context.share_projects(other)
+    assert rw_context.projects is other.projects
+    assert rw_context._projects_timestamp == 123.0
+    assert rw_context._projects_validators == {"ETag": '"v1"'}
+
+
+@pytest.mark.asyncio
+async def test_projects_refresh_failure(rw_context, mocker):
+    fail = []
+
+    async def fake_get(session, url, validators=None, **kwargs):
+        if fail:
+            raise aiohttp.ClientError("offline")
+        return "mozilla-central: {}", {}
+
+    mocker.patch.object(swcontext, "get_if_modified", new=fake_get)
+    mocker.patch.object(swcontext, "retry_async", new=lambda func, args=(), **kwargs: func(*args))
+    fail.append(True)
+    # no copy to fall back to
+    with pytest.raises(aiohttp.ClientError):
+        await rw_context.populate_projects()
+    fail.clear()
+    await rw_context.populate_projects()
+    projects = rw_context.projects
+    fail.append(True)
+    rw_context._projects_timestamp = 1.0
+    # the stale copy is kept
+    assert await rw_context.refresh_projects() is False
+    assert rw_context.projects is projects
+    assert rw_context._projects_timestamp == 1.0
+
+
+@pytest.mark.asyncio
+async def test_refresh_projects_session(rw_context, mocker):
+    sessions = []
+
+    async def fake_get(session, url, validators=None, **kwargs):
+        sessions.append(session)
+        return "mozilla-central: {}", {}
+
+    mocker.patch.object(swcontext, "get_if_modified", new=fake_get)
+    await rw_context.refresh_projects()
+    assert sessions[0] is rw_context.session
+    assert not rw_context.session.closed
+    # without a session, a temporary one is used
+    rw_context.session = None
+    await rw_context.refresh_projects()
+    assert isinstance(sessions[1], aiohttp.ClientSession)
+    assert sessions[1].closed
+
+
+@pytest.mark.asyncio
+async def test_refresh_projects_after_session_closed(rw_context, mocker):
+    sessions = []
+
+    async def fake_get(session, url, validators=None, **kwargs):
+        assert not session.closed
+        sessions.append(session)
+        return "mozilla-central: {}", {}
+
+    mocker.patch.object(swcontext, "get_if_modified", new=fake_get)
+    await rw_context.populate_projects()
+    # async_main closes the worker session once run_tasks returns, before the
+    # refresh started at the end of the task runs.
+    await rw_context.session.close()
+    rw_context._projects_timestamp = 0.0
+    assert await rw_context.refresh_projects_if_stale() is True
+    assert sessions[1] is not rw_context.session
+    assert rw_context._projects_timestamp > 0
+    # a closed session isn't used in the foreground either
+    assert await rw_context.refresh_projects() is True
+    assert sessions[2] is not rw_context.session
+
+
+@pytest.mark.asyncio
+async def test_refresh_projects_unexpected_exception(rw_context, mocker):
+    async def fake_get(session, url, validators=None, **kwargs):
+        raise RuntimeError("unexpected")
+
+    mocker.patch.object(swcontext, "get_if_modified", new=fake_get)
+    rw_context.projects = {"mozilla-central": {}}
+    rw_context._projects_timestamp = 0.0
+    mock_log = mocker.patch.object(swcontext, "log")
+    future = rw_context.refresh_projects_if_stale()
+    with pytest.raises(RuntimeError):
+        await future
+    await asyncio.sleep(0)
+    mock_log.error.assert_called_once()
 
 
 def test_get_credentials(rw_context):
@@ -162,6 +294,6 @@ async def test_download_semaphore():
     context = swcontext.Context()
     context.config = {"foo": "bar"}
     sem = context.download_semaphore
-    assert isinstance(sem, asyncio.BoundedSemaphore)
-    assert sem._value == swcontext.DEFAULT_MAX_CONCURRENT_DOWNLOADS
+    assert isinstance(sem, PrioritySemaphore)
+    assert sem.value == swcontext.DEFAULT_MAX_CONCURRENT_DOWNLOADS
     assert sem is context.download_semaphore
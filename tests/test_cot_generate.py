@@ -87,6 +87,18 @@ def test_generate_cot_unsigned(artifacts, context):
     assert body == cot.format_json(cot.generate_cot_body(context))
 
 
+def test_generate_cot_artifact_manifest(context, tmpdir):
+    context.config["artifact_dir"] = os.path.join(tmpdir, "artifact")
+    os.makedirs(os.path.join(context.config["artifact_dir"], "public"))
+    with open(os.path.join(context.config["artifact_dir"], "public", "build.zip"), "w") as fh:
+        fh.write("zip")
+    cot.generate_cot(context)
+    assert context.artifact_manifest.filepaths() == ["public/build.zip", "public/chain-of-trust.json", "public/chain-of-trust.json.sig"]
+    # written outside artifact_dir
+    cot.generate_cot(context, parent_path=context.config["work_dir"])
+    assert context.artifact_manifest.filepaths() == ["public/build.zip", "public/chain-of-trust.json", "public/chain-of-trust.json.sig"]
+
+
 def test_generate_cot_exception(artifacts, context):
     context.config["cot_schema_path"] = os.path.join(context.config["work_dir"], "not_a_file")
     with pytest.raises(ScriptWorkerException):
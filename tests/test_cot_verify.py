@@ -2,10 +2,12 @@
 # coding=utf-8
 """Test scriptworker.cot.verify"""
 
+import asyncio
 import json
 import logging
 import os
 import tempfile
+import threading
 import time
 from copy import deepcopy
 from functools import partial
@@ -20,6 +22,7 @@ import scriptworker.context as swcontext
 import scriptworker.cot.verify as cotverify
 from scriptworker.artifacts import get_single_upstream_artifact_full_path
 from scriptworker.exceptions import CoTError, DownloadError
+from scriptworker.scheduler import COT_DOWNLOAD, MANDATORY_DOWNLOAD, OPTIONAL_DOWNLOAD, _download_priority
 from scriptworker.utils import load_json_or_yaml, makedirs, read_from_file
 
 from . import create_async, noop_async, noop_sync, touch
@@ -318,6 +321,15 @@ cotv2_load_url = partial(cot_load_url, parent_path=COTV2_DIR)
 cotv4_load_url = partial(cot_load_url, parent_path=COTV4_DIR)
 
 
+async def cot_get_projects(session, url, validators=None, parent_path=None, **kwargs):
+    with open(os.path.join(parent_path, "projects.yml")) as fh:
+        return fh.read(), {}
+
+
+cotv2_get_projects = partial(cot_get_projects, parent_path=COTV2_DIR)
+cotv4_get_projects = partial(cot_get_projects, parent_path=COTV4_DIR)
+
+
 def cot_load(string, is_path=False, parent_dir=None, **kwargs):
     if is_path:
         if string.endswith("parameters.yml"):
@@ -393,6 +405,54 @@ def test_get_link(chain, ids, req, raises):
         chain.get_link(req)
 
 
+def test_get_link_index(chain):
+    one = cotverify.LinkOfTrust(chain.context, "build", "one")
+    two = cotverify.LinkOfTrust(chain.context, "build", "two")
+    chain.links.append(one)
+    assert chain.get_link("one") is one
+    assert not chain.has_link("two")
+    chain.links.append(two)
+    assert chain.get_link("two") is two
+    chain.links = [two]
+    assert chain.dependent_task_ids() == ["two"]
+    chain.links.pop()
+    with pytest.raises(CoTError):
+        chain.get_link("two")
+    # swapping links at the same length
+    chain.links.append(one)
+    assert chain.get_link("one") is one
+    chain.links[0] = two
+    assert chain.get_link("two") is two
+    assert not chain.has_link("one")
+    chain.links.insert(0, one)
+    chain.links.extend([cotverify.LinkOfTrust(chain.context, "build", "three")])
+    assert chain.dependent_task_ids() == ["one", "two", "three"]
+    chain.links.remove(one)
+    del chain.links[-1]
+    assert chain.dependent_task_ids() == ["two"]
+    chain.links.clear()
+    assert not chain.has_link("two")
+
+
+# add_dependency {{{1
+def test_add_dependency(chain):
+    assert chain.add_dependency(chain.task_id, "build")
+    assert chain.add_dependency("build", "decision")
+    assert chain.add_dependency("build", "docker")
+    assert not chain.add_dependency("docker", "decision")
+    # the decision task is its own parent
+    assert not chain.add_dependency("decision", "decision")
+    chain.links = [cotverify.LinkOfTrust(chain.context, "build", "other")]
+    assert not chain.add_dependency("build", "other")
+    assert chain.dependencies == {
+        chain.task_id: {"build"},
+        "build": {"decision", "docker", "other"},
+        "decision": set(),
+        "docker": {"decision"},
+        "other": set(),
+    }
+
+
 # link.task {{{1
 @pytest.mark.asyncio
 async def test_link_task(chain):
@@ -742,6 +802,38 @@ async def test_build_task_dependencies(chain, mocker):
         await cotverify.build_task_dependencies(chain, {}, "build", "task_id")
 
 
+@pytest.mark.asyncio
+async def test_build_task_dependencies_edges(chain, mocker):
+    graph = {
+        "task_id": [("build:decision", "decision_task_id"), ("build:docker-image", "docker_task_id")],
+        "docker_task_id": [("build:docker-image:decision", "decision_task_id")],
+        "decision_task_id": [("build:decision:parent", "decision_task_id")],
+    }
+
+    async def fake_task_defn(queue, task_id, **kwargs):
+        return {
+            "taskGroupId": "decision_task_id",
+            "provisionerId": "",
+            "schedulerId": "",
+            "workerType": "",
+            "scopes": [],
+            "payload": {"image": "x"},
+            "metadata": {},
+        }
+
+    def fake_find(task, name, task_id):
+        return graph[task_id]
+
+    mocker.patch.object(cotverify, "find_sorted_task_dependencies", new=fake_find)
+    mocker.patch.object(cotverify, "retry_get_task_definition", new=fake_task_defn)
+    mocker.patch.object(cotverify, "makedirs")
+    mocker.patch.object(cotverify, "format_json", return_value="{}")
+    mocker.patch("builtins.open", mocker.mock_open())
+    await cotverify.build_task_dependencies(chain, {}, "build", "task_id")
+    assert sorted(chain.dependent_task_ids()) == ["decision_task_id", "docker_task_id"]
+    assert chain.dependencies == {"task_id": {"decision_task_id", "docker_task_id"}, "decision_task_id": set(), "docker_task_id": {"decision_task_id"}}
+
+
 # download_cot {{{1
 @pytest.mark.parametrize(
     "upstream_artifacts, raises, download_artifacts_mock, verify_sig",
@@ -764,8 +856,8 @@ async def test_download_cot(chain, mocker, upstream_artifacts, raises, download_
     if download_artifacts_mock is None:
         download_artifacts_mock = down
 
-    def sha(*args, **kwargs):
-        return "sha"
+    async def sha(paths, **kwargs):
+        return {path: {"sha256": "sha"} for path in paths}
 
     m = MagicMock()
     m.task_id = "task_id"
@@ -779,26 +871,28 @@ async def test_download_cot(chain, mocker, upstream_artifacts, raises, download_
             await cotverify.download_cot(chain)
     else:
         mocker.patch.object(cotverify, "download_artifacts", new=download_artifacts_mock)
-        mocker.patch.object(cotverify, "get_hash", new=sha)
+        mocker.patch.object(cotverify, "hash_files_async", new=sha)
         await cotverify.download_cot(chain)
 
 
 # download_cot_artifact {{{1
-@pytest.mark.parametrize("path,sha,raises", (("one", "sha", False), ("one", "bad_sha", True), ("bad", "bad_sha", True), ("missing", "bad_sha", True)))
+@pytest.mark.parametrize(
+    "path,sha,raises", (("one", "sha", False), ("one", "bad_sha", True), ("bad", "bad_sha", True), ("missing", "bad_sha", True), ("no_shas", "sha", False))
+)
 @pytest.mark.asyncio
 async def test_download_cot_artifact(chain, path, sha, raises, mocker):
-    def fake_get_hash(*args, **kwargs):
-        return sha
+    async def fake_get_hashes_async(path, hash_algs):
+        return {hash_alg: sha for hash_alg in hash_algs}
 
     link = MagicMock()
     link.task_id = "task_id"
     link.name = "name"
     link.cot_dir = "cot_dir"
-    link.cot = {"taskId": "task_id", "artifacts": {"one": {"sha256": "sha"}, "bad": {"illegal": "bad_sha"}}}
+    link.cot = {"taskId": "task_id", "artifacts": {"one": {"sha256": "sha"}, "bad": {"illegal": "bad_sha"}, "no_shas": {}}}
     chain.links = [link]
     mocker.patch.object(cotverify, "get_artifact_url", new=noop_sync)
     mocker.patch.object(cotverify, "download_artifacts", new=noop_async)
-    mocker.patch.object(cotverify, "get_hash", new=fake_get_hash)
+    mocker.patch.object(cotverify, "get_hashes_async", new=fake_get_hashes_async)
     if raises:
         with pytest.raises(CoTError):
             await cotverify.download_cot_artifact(chain, "task_id", path)
@@ -883,6 +977,50 @@ async def test_download_cot_artifacts_wildcard(chain, mocker, upstreamArtifacts,
     assert sorted(result) == sorted(expected)
 
 
+@pytest.mark.asyncio
+async def test_download_cot_artifacts_priority_and_fail_fast(chain, mocker):
+    classes = {}
+    cancelled = []
+
+    async def fake_download(x, task_id, path):
+        classes[path] = _download_priority.get()
+        if path == "failed_path":
+            raise DownloadError("")
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(path)
+            raise
+
+    chain.links = [_craft_decision_link(chain, tasks_for="hg-push")]
+    chain.task["payload"]["upstreamArtifacts"] = [
+        {"taskId": "task_id", "paths": ["path1", "failed_path"]},
+        {"taskId": "task_id", "paths": ["path3"], "optional": True},
+    ]
+    mocker.patch.object(cotverify, "download_cot_artifact", new=fake_download)
+    with pytest.raises(DownloadError):
+        await cotverify.download_cot_artifacts(chain)
+    assert classes["public/task-graph.json"] == COT_DOWNLOAD
+    assert classes["path1"] == MANDATORY_DOWNLOAD
+    assert classes["path3"] == OPTIONAL_DOWNLOAD
+    assert sorted(cancelled) == sorted(set(classes) - {"failed_path"})
+
+
+@pytest.mark.asyncio
+async def test_get_latest_artifacts(chain, mocker):
+    calls = []
+
+    async def fake_artifacts(queue, task_id):
+        calls.append(task_id)
+        await asyncio.sleep(0)
+        return [{"name": "{}/artifact".format(task_id)}]
+
+    mocker.patch.object(cotverify, "retry_list_latest_artifacts", new=fake_artifacts)
+    assert await chain.get_latest_artifacts(["b", "a"]) == {"b": [{"name": "b/artifact"}], "a": [{"name": "a/artifact"}]}
+    assert await chain.get_latest_artifacts(["a", "c"]) == {"a": [{"name": "a/artifact"}], "c": [{"name": "c/artifact"}]}
+    assert calls == ["a", "b", "c"]
+
+
 # is_artifact_optional {{{1
 @pytest.mark.parametrize(
     "upstream_artifacts, task_id, path, expected",
@@ -992,15 +1130,39 @@ def test_verify_link_ed25519_cot_signature(chain, build_link, mocker, unsigned_p
 
 
 # verify_cot_signatures {{{1
+@pytest.mark.asyncio
 @pytest.mark.parametrize("ed25519_mock, raises", ((noop_sync, False), (die_sync, True)))
-def test_verify_link_cot_signature_bad_sig(chain, mocker, build_link, ed25519_mock, raises):
+async def test_verify_link_cot_signature_bad_sig(chain, mocker, build_link, ed25519_mock, raises):
     mocker.patch.object(cotverify, "verify_link_ed25519_cot_signature", new=ed25519_mock)
     chain.links = [build_link]
     if raises:
         with pytest.raises(CoTError):
-            cotverify.verify_cot_signatures(chain)
+            await cotverify.verify_cot_signatures(chain)
     else:
-        cotverify.verify_cot_signatures(chain)
+        await cotverify.verify_cot_signatures(chain)
+
+
+@pytest.mark.asyncio
+async def test_verify_cot_signatures_concurrently(chain, build_link, decision_link, mocker):
+    # Both links have to be verifying at the same time to get past the barrier.
+    barrier = threading.Barrier(2, timeout=10)
+    verified = []
+
+    def verify(chain_, link, unsigned_path, signature_path):
+        barrier.wait()
+        verified.append((link.task_id, unsigned_path, signature_path))
+
+    mocker.patch.object(cotverify, "verify_link_ed25519_cot_signature", new=verify)
+    chain.links = [build_link, decision_link]
+    await cotverify.verify_cot_signatures(chain)
+    assert sorted(verified) == sorted(
+        (
+            link.task_id,
+            link.get_artifact_full_path("public/chain-of-trust.json"),
+            link.get_artifact_full_path("public/chain-of-trust.json.sig"),
+        )
+        for link in chain.links
+    )
 
 
 # verify_link_in_task_graph {{{1
@@ -1428,7 +1590,7 @@ async def test_get_action_context_and_template(
     decision_link.task = load_json_or_yaml(decision_path, is_path=True)
 
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=cotv4_load_url)
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=cotv4_load_url)
+    mocker.patch.object(swcontext, "get_if_modified", new=cotv4_get_projects)
     mocker.patch.object(cotverify, "load_json_or_yaml", new=cotv4_load)
     mocker.patch.object(cotverify, "get_pushlog_info", new=cotv4_pushlog)
 
@@ -1466,7 +1628,7 @@ async def test_broken_action_context_and_template(chain, mocker):
     decision_link = cotverify.LinkOfTrust(chain.context, "decision", "decision_taskid")
     decision_link.task = load_json_or_yaml(os.path.join(COTV4_DIR, "decision_try.json"), is_path=True)
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=cotv4_load_url)
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=cotv4_load_url)
+    mocker.patch.object(swcontext, "get_if_modified", new=cotv4_get_projects)
     mocker.patch.object(cotverify, "get_pushlog_info", new=cotv4_pushlog)
     mocker.patch.object(cotverify, "load_json_or_yaml", new=cotv4_load)
     mocker.patch.object(cotverify, "_get_action_from_actions_json", new=fake_get_action_from_actions_json)
@@ -1517,7 +1679,7 @@ async def test_verify_parent_task_definition(chain, name, task_id, path, decisio
         decision_link.task = load_json_or_yaml(decision_path, is_path=True)
 
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=partial(cot_load_url, parent_path=parent_path))
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=partial(cot_load_url, parent_path=parent_path))
+    mocker.patch.object(swcontext, "get_if_modified", new=partial(cot_get_projects, parent_path=parent_path))
     mocker.patch.object(cotverify, "load_json_or_yaml", new=partial(cot_load, parent_dir=parent_path))
     mocker.patch.object(cotverify, "get_pushlog_info", new=partial(cot_pushlog, parent_dir=parent_path))
 
@@ -1569,7 +1731,7 @@ async def test_verify_parent_task_definition_vpn(vpn_chain, name, task_id, path,
         raise NotImplementedError()
 
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=mocked_load_url)
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=cotv4_load_url)
+    mocker.patch.object(swcontext, "get_if_modified", new=cotv4_get_projects)
     mocker.patch.object(cotverify, "load_json_or_yaml", new=cotv4_load)
     mocker.patch.object(cotverify, "get_pushlog_info", new=cotv4_pushlog)
     mocker.patch.object(cotverify, "GitHubRepository", new=MockedGitHubRepository)
@@ -1740,7 +1902,7 @@ async def test_get_pr_action_context_and_template(mocker, mobile_chain, github_p
     mobile_chain.context.config["min_cot_version"] = 3
 
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=cotv4_load_url)
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=cotv4_load_url)
+    mocker.patch.object(swcontext, "get_if_modified", new=cotv4_get_projects)
     mocker.patch.object(cotverify, "load_json_or_yaml", new=cotv4_load)
 
     mobile_chain.links = list(set([mobile_github_push_link, github_pr_action_link]))
@@ -1761,7 +1923,7 @@ async def test_verify_parent_task_definition_bad_project(chain, mocker):
         return "https://fake_server"
 
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=cotv2_load_url)
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=cotv2_load_url)
+    mocker.patch.object(swcontext, "get_if_modified", new=cotv2_get_projects)
     mocker.patch.object(cotverify, "load_json_or_yaml", new=cotv2_load)
     mocker.patch.object(cotverify, "get_pushlog_info", new=cotv2_pushlog)
     mocker.patch.object(cotverify, "get_source_url", new=fake_url)
@@ -1778,7 +1940,7 @@ async def test_verify_parent_task_definition_bad_comment(chain, mocker):
     link.task["payload"]["env"]["GECKO_COMMIT_MSG"] = "invalid comment"
 
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=cotv2_load_url)
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=cotv2_load_url)
+    mocker.patch.object(swcontext, "get_if_modified", new=cotv2_get_projects)
     mocker.patch.object(cotverify, "load_json_or_yaml", new=cotv2_load)
     mocker.patch.object(cotverify, "get_pushlog_info", new=cotv2_pushlog)
 
@@ -1796,7 +1958,7 @@ async def test_verify_parent_task_definition_failed_jsone(chain, mocker):
         raise jsone.JSONTemplateError("foo")
 
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=cotv2_load_url)
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=cotv2_load_url)
+    mocker.patch.object(swcontext, "get_if_modified", new=cotv2_get_projects)
     mocker.patch.object(cotverify, "load_json_or_yaml", new=cotv2_load)
     mocker.patch.object(cotverify, "get_pushlog_info", new=cotv2_pushlog)
     mocker.patch.object(jsone, "render", new=die)
@@ -1813,7 +1975,7 @@ async def test_verify_parent_task_definition_failed_diff(chain, mocker):
     link.task["illegal"] = "boom"
 
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=cotv2_load_url)
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=cotv2_load_url)
+    mocker.patch.object(swcontext, "get_if_modified", new=cotv2_get_projects)
     mocker.patch.object(cotverify, "load_json_or_yaml", new=cotv2_load)
     mocker.patch.object(cotverify, "get_pushlog_info", new=cotv2_pushlog)
 
@@ -1829,7 +1991,7 @@ async def test_verify_parent_task_definition_failed_tasks_for(chain, mocker):
     link.task["extra"]["tasks_for"] = "illegal"
 
     mocker.patch.object(cotverify, "load_json_or_yaml_from_url", new=cotv2_load_url)
-    mocker.patch.object(swcontext, "load_json_or_yaml_from_url", new=cotv2_load_url)
+    mocker.patch.object(swcontext, "get_if_modified", new=cotv2_get_projects)
     mocker.patch.object(cotverify, "load_json_or_yaml", new=cotv2_load)
     mocker.patch.object(cotverify, "get_pushlog_info", new=cotv2_pushlog)
 
@@ -2216,7 +2378,7 @@ async def test_verify_chain_of_trust(chain, exc, check_task, mocker):
 
     for func in ("build_task_dependencies", "add_link", "download_cot", "download_cot_artifacts", "verify_task_types", "verify_worker_impls"):
         mocker.patch.object(cotverify, func, new=noop_async)
-    mocker.patch.object(cotverify, "verify_cot_signatures", new=noop_sync)
+    mocker.patch.object(cotverify, "verify_cot_signatures", new=noop_async)
     mocker.patch.object(cotverify, "trace_back_to_tree", new=maybe_die)
     if exc:
         with pytest.raises(CoTError):
@@ -2259,6 +2421,134 @@ def test_verify_cot_cmdln(chain, args, tmpdir, mocker, use_github_token, monkeyp
     cotverify.verify_cot_cmdln(args=args)
 
 
+@pytest.mark.asyncio
+async def test_task_definition_cache():
+    calls = []
+
+    class FakeQueue:
+        options = {"rootUrl": "https://tc"}
+
+        async def task(self, task_id):
+            calls.append(task_id)
+            await asyncio.sleep(0)
+            if task_id == "bad" and calls.count("bad") == 1:
+                raise CoTError("flaky")
+            return {"taskId": task_id}
+
+    cache = cotverify._TaskDefinitionCache(FakeQueue())
+    assert cache.options == {"rootUrl": "https://tc"}
+    cache.prime("primed", {"taskId": "primed"})
+    first, second, primed = await asyncio.gather(cache.task("a"), cache.task("a"), cache.task("primed"))
+    assert first == second == {"taskId": "a"}
+    assert first is not second
+    assert primed == {"taskId": "primed"}
+    # Failures aren't cached.
+    with pytest.raises(CoTError):
+        await cache.task("bad")
+    assert await cache.task("bad") == {"taskId": "bad"}
+    assert calls == ["a", "bad", "bad"]
+
+
+def _task_group_page(task_ids, token=None):
+    tasks = []
+    for task_id in task_ids:
+        payload = {} if task_id.startswith("docker") else {"upstreamArtifacts": []}
+        tasks.append({"status": {"taskId": task_id}, "task": {"workerType": task_id.split("-")[0], "payload": payload}})
+    page = {"tasks": tasks}
+    if token:
+        page["continuationToken"] = token
+    return page
+
+
+@pytest.mark.parametrize(
+    "extra_args, expected_task_ids",
+    (
+        (("--task-group-id", "group"), ["signing-1", "beetmover-1", "signing-2"]),
+        (("--task-group-id", "group", "--worker-type", "signing", "signing-1", "x"), ["signing-1", "x", "signing-2"]),
+        (("x", "y", "--concurrency", "1"), ["x", "y"]),
+    ),
+)
+def test_verify_cot_cmdln_batch(tmpdir, mocker, extra_args, expected_task_ids):
+    path = os.path.join(tmpdir, "tmp")
+    report_path = os.path.join(tmpdir, "report.json")
+    makedirs(path)
+    fetched = []
+    verified = []
+    running = []
+    contexts = []
+
+    class FakeQueue:
+        options = {"rootUrl": "https://tc"}
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def task(self, task_id):
+            fetched.append(task_id)
+            return {"workerType": "signing", "payload": {}}
+
+        async def listTaskGroup(self, task_group_id, query=None):
+            assert task_group_id == "group"
+            if not query:
+                return _task_group_page(["signing-1", "docker-1", "beetmover-1"], token="next")
+            assert query == {"continuationToken": "next"}
+            return _task_group_page(["signing-2"])
+
+    def cot(context, name, task_id=None):
+        contexts.append(context)
+        m = MagicMock()
+        m.task_id = task_id
+        m.context = context
+        return m
+
+    async def verify(chain, check_task=False):
+        running.append(chain.task_id)
+        await asyncio.sleep(0.01)
+        assert len(running) <= concurrency
+        running.remove(chain.task_id)
+        verified.append(chain.task_id)
+        if chain.task_id in ("beetmover-1", "y"):
+            raise CoTError("bad chain")
+
+    concurrency = 1 if "--concurrency" in extra_args else 10
+    mocker.patch.object(tempfile, "mkdtemp", new=lambda: path)
+    mocker.patch.object(cotverify, "read_worker_creds", new=noop_sync)
+    mocker.patch.object(cotverify, "Queue", new=FakeQueue)
+    mocker.patch.object(cotverify, "ChainOfTrust", new=cot)
+    mocker.patch.object(cotverify, "verify_chain_of_trust", new=verify)
+    mocker.patch.object(swcontext.Context, "populate_projects", new=noop_async)
+
+    args = ("--task-type", "signing", "--report", report_path) + extra_args
+    should_fail = "beetmover-1" in expected_task_ids or "y" in expected_task_ids
+    if should_fail:
+        with pytest.raises(CoTError):
+            cotverify.verify_cot_cmdln(args=args, event_loop=asyncio.new_event_loop())
+    else:
+        cotverify.verify_cot_cmdln(args=args, event_loop=asyncio.new_event_loop())
+
+    report = load_json_or_yaml(report_path, is_path=True)
+    assert [result["taskId"] for result in report["tasks"]] == expected_task_ids
+    assert sorted(verified) == sorted(expected_task_ids)
+    failed = [result["taskId"] for result in report["tasks"] if result["status"] == "failed"]
+    assert report["summary"]["total"] == len(expected_task_ids)
+    assert report["summary"]["failed"] == len(failed)
+    assert report["summary"]["passed"] == len(expected_task_ids) - len(failed)
+    for result in report["tasks"]:
+        assert result["seconds"] >= 0
+        assert (result["error"] is None) == (result["status"] == "passed")
+    # Tasks listed in the group aren't fetched again.
+    assert fetched == [task_id for task_id in expected_task_ids if task_id in ("x", "y")]
+    # Each task gets its own work_dir, but they share the caches.
+    assert len({context.config["work_dir"] for context in contexts}) == len(expected_task_ids)
+    assert len({id(context.download_cache) for context in contexts}) == 1
+    assert len({id(context.queue) for context in contexts}) == 1
+
+
+def test_verify_cot_cmdln_no_tasks():
+    with pytest.raises(SystemExit):
+        cotverify.verify_cot_cmdln(args=["--task-type", "signing"])
+
+
 # create_test_workdir {{{1
 @pytest.mark.asyncio
 async def test_async_create_test_workdir(mocker, tmpdir):
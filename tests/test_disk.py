@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.disk"""
+
+import os
+from collections import namedtuple
+
+import pytest
+
+import scriptworker.disk as disk
+from scriptworker.disk import DiskSpaceMonitor, disk_usage_of
+from scriptworker.metrics import registry
+
+DiskUsage = namedtuple("DiskUsage", ("total", "used", "free"))
+
+
+def _fake_free(mocker, *frees):
+    frees = list(frees)
+
+    def disk_usage(path):
+        return DiskUsage(0, 0, frees.pop(0) if len(frees) > 1 else frees[0])
+
+    mocker.patch.object(disk.shutil, "disk_usage", new=disk_usage)
+
+
+# disk_usage_of {{{1
+def test_disk_usage_of(tmpdir):
+    os.makedirs(os.path.join(tmpdir, "sub"))
+    for path in ("one", "sub/two"):
+        with open(os.path.join(tmpdir, path), "wb") as fh:
+            fh.write(b"x" * 100000)
+    os.symlink(os.path.join(tmpdir, "sub"), os.path.join(tmpdir, "link"))
+    assert 200000 <= disk_usage_of(str(tmpdir)) < 300000
+    assert disk_usage_of(os.path.join(tmpdir, "nonexistent")) == 0
+
+
+# DiskSpaceMonitor {{{1
+def test_required_bytes(tmpdir):
+    with open(os.path.join(tmpdir, "one"), "wb") as fh:
+        fh.write(b"x" * 100000)
+    monitor = DiskSpaceMonitor([str(tmpdir)], min_free_bytes=10, history=2)
+    assert monitor.required_bytes() == 10
+    used = monitor.record_task_usage()
+    assert used >= 100000
+    assert monitor.required_bytes() == used + 10
+    os.remove(os.path.join(tmpdir, "one"))
+    monitor.record_task_usage()
+    assert monitor.required_bytes() == used + 10
+    monitor.record_task_usage()
+    # the big task fell out of the history
+    assert monitor.required_bytes() == 10
+
+
+@pytest.mark.asyncio
+async def test_ensure_space(tmpdir, mocker):
+    _fake_free(mocker, 2000)
+    monitor = DiskSpaceMonitor([str(tmpdir)], min_free_bytes=1000)
+    assert await monitor.ensure_space()
+    assert registry.gauges["disk_headroom_bytes"][()] == 1000
+    assert not monitor.out_of_space
+
+
+@pytest.mark.asyncio
+async def test_ensure_space_evicts(tmpdir, mocker):
+    _fake_free(mocker, 500, 500, 500, 1500)
+    calls = []
+    monitor = DiskSpaceMonitor([str(tmpdir)], min_free_bytes=1000, evictors=[lambda: calls.append(1), lambda: calls.append(2), lambda: calls.append(3)])
+    assert await monitor.ensure_space()
+    assert calls == [1, 2]
+    assert not monitor.out_of_space
+
+
+@pytest.mark.asyncio
+async def test_ensure_space_exhausted(tmpdir, mocker):
+    _fake_free(mocker, 500)
+    calls = []
+    monitor = DiskSpaceMonitor([str(tmpdir)], min_free_bytes=1000, evictors=[lambda: calls.append(1)])
+    assert not await monitor.ensure_space()
+    assert calls == [1]
+    assert monitor.out_of_space
+
+
+@pytest.mark.asyncio
+async def test_ensure_space_missing_paths(tmpdir):
+    monitor = DiskSpaceMonitor([os.path.join(tmpdir, "missing"), str(tmpdir)], min_free_bytes=1)
+    assert monitor.free_bytes() is not None
+    monitor.paths = [os.path.join(tmpdir, "missing")]
+    assert monitor.free_bytes() is None
+    # nothing to measure yet, so nothing blocks the claim
+    assert await monitor.ensure_space()
+    assert not monitor.out_of_space
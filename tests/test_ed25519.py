@@ -90,3 +90,67 @@ def test_ed25519_cmdln(pubkey_path, file_path, sig_path, exception):
     args.extend([file_path, sig_path])
     with pytest.raises(exception):
         swed25519.verify_ed25519_signature_cmdln(args=args, exception=ScriptWorkerEd25519Error)
+
+
+# Ed25519Keys {{{1
+def test_ed25519_keys_private_key(tmpdir, mocker):
+    keys = swed25519.Ed25519Keys()
+    path = os.path.join(tmpdir, "private_key")
+    with open(path, "w") as fh:
+        fh.write(read_from_file(os.path.join(ED25519_DIR, "scriptworker_private_key")))
+    load = mocker.spy(swed25519, "ed25519_private_key_from_file")
+    key = keys.private_key(path)
+    assert keys.private_key(path) is key
+    assert load.call_count == 1
+    contents = b"signed contents"
+    keys.verify(read_from_file(os.path.join(ED25519_DIR, "scriptworker_public_key")), contents, keys.sign(path, contents), "failed: %(exc)s")
+    # A new key in the same file is picked up.
+    new_key = swed25519.Ed25519PrivateKey.generate()
+    with open(path, "w") as fh:
+        fh.write(swed25519.ed25519_private_key_to_string(new_key))
+    os.utime(path, ns=(0, 0))
+    assert swed25519.ed25519_private_key_to_string(keys.private_key(path)) == swed25519.ed25519_private_key_to_string(new_key)
+    assert load.call_count == 2
+    os.remove(path)
+    with pytest.raises(ScriptWorkerEd25519Error):
+        keys.private_key(path)
+
+
+def test_ed25519_keys_public_key(mocker, caplog):
+    keys = swed25519.Ed25519Keys()
+    seed = read_from_file(os.path.join(ED25519_DIR, "scriptworker_public_key"))
+    parse = mocker.spy(swed25519, "ed25519_public_key_from_string")
+    keys.load_public_keys({"generic-worker": (seed, "bad_base64_string"), "docker-worker": (seed,)})
+    assert parse.call_count == 2
+    assert "Invalid generic-worker ed25519 public key bad_base64_string" in caplog.text
+    assert swed25519.ed25519_public_key_to_string(keys.public_key(seed)) == seed
+    for _ in range(2):
+        with pytest.raises(ScriptWorkerEd25519Error):
+            keys.public_key("bad_base64_string")
+    assert parse.call_count == 2
+    with pytest.raises(ScriptWorkerEd25519Error):
+        keys.verify(seed, b"contents", b"bad signature", "failed: %(exc)s")
+    keys.clear()
+    keys.public_key(seed)
+    assert parse.call_count == 3
+
+
+def test_ed25519_keys_ordered_seeds():
+    keys = swed25519.Ed25519Keys()
+    good_seed = read_from_file(os.path.join(ED25519_DIR, "scriptworker_public_key"))
+    other_seed = read_from_file(os.path.join(ED25519_DIR, "docker-worker_public_key"))
+    seeds = (other_seed, good_seed)
+    assert keys.ordered_seeds("generic-worker", seeds) == [other_seed, good_seed]
+    contents = read_from_file(os.path.join(ED25519_DIR, "foo.json"), file_type="binary")
+    signature = read_from_file(os.path.join(ED25519_DIR, "foo.json.scriptworker.sig"), file_type="binary")
+    keys.verify(good_seed, contents, signature, "failed: %(exc)s")
+    # Only verifications for a worker_impl are remembered.
+    assert keys.ordered_seeds("generic-worker", seeds) == [other_seed, good_seed]
+    keys.verify(good_seed, contents, signature, "failed: %(exc)s", worker_impl="generic-worker")
+    assert keys.ordered_seeds("generic-worker", seeds) == [good_seed, other_seed]
+    assert keys.ordered_seeds("docker-worker", seeds) == [other_seed, good_seed]
+    # Seeds that were removed from the config aren't added back.
+    assert keys.ordered_seeds("generic-worker", (other_seed,)) == [other_seed]
+    with pytest.raises(ScriptWorkerEd25519Error):
+        keys.verify(other_seed, contents, signature, "failed: %(exc)s", worker_impl="generic-worker")
+    assert keys.ordered_seeds("generic-worker", seeds) == [good_seed, other_seed]
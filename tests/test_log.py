@@ -117,6 +117,37 @@ def test_contextual_log_handler(rw_context, mocker):
     assert contents[0].endswith("foo")
 
 
+def test_contextual_log_handler_exception(rw_context):
+    contextual_path = os.path.join(rw_context.config["artifact_dir"], "test.log")
+    handlers = list(swlog.log.handlers)
+    with pytest.raises(ValueError):
+        with swlog.contextual_log_handler(rw_context, path=contextual_path):
+            raise ValueError("failed verification")
+    assert swlog.log.handlers == handlers
+
+
+@pytest.mark.asyncio
+async def test_contextual_log_handler_concurrent(rw_context):
+    swlog.log.setLevel(logging.DEBUG)
+
+    async def verify(name):
+        path = os.path.join(rw_context.config["artifact_dir"], name, "test.log")
+        with swlog.contextual_log_handler(rw_context, path=path):
+            for i in range(3):
+                # a task started in the block logs to its file too
+                await asyncio.ensure_future(_log("{} {}".format(name, i)))
+        with open(path, "r") as fh:
+            return [line.split(" - ")[-1] for line in fh.read().splitlines()]
+
+    async def _log(message):
+        swlog.log.info(message)
+        await asyncio.sleep(0)
+
+    one, two = await asyncio.gather(verify("one"), verify("two"))
+    assert one == ["one 0", "one 1", "one 2"]
+    assert two == ["two 0", "two 1", "two 2"]
+
+
 def test_watched_log_file(rw_context):
     rw_context.config["watch_log_file"] = True
     rw_context.config["log_fmt"] = "%(levelname)s - %(message)s"
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.metrics"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+import scriptworker.metrics as metrics
+
+
+# fixtures {{{1
+@pytest.fixture(scope="function")
+def fresh_registry(mocker):
+    reg = metrics.MetricsRegistry()
+    mocker.patch.object(metrics, "registry", new=reg)
+    yield reg
+
+
+# Histogram {{{1
+def test_histogram():
+    hist = metrics.Histogram(buckets=(1, 2, 4))
+    assert hist.percentile(50) is None
+    for value in (0.5, 1, 1.5, 3, 10):
+        hist.observe(value)
+    assert hist.count == 5
+    assert hist.sum == 16
+    assert hist.counts == [2, 1, 1, 1]
+    assert hist.cumulative_counts() == [(1, 2), (2, 3), (4, 4), (float("inf"), 5)]
+    assert hist.percentile(20) == 0.5
+    assert hist.percentile(60) == 2
+    assert hist.percentile(100) == 4
+
+
+# MetricsRegistry {{{1
+def test_registry(fresh_registry):
+    fresh_registry.inc("retries_total", func="a")
+    fresh_registry.inc("retries_total", 2, func="b")
+    fresh_registry.set("gauge", 3)
+    fresh_registry.observe("duration", 0.1, stage="x")
+    assert fresh_registry.get_counter("retries_total", func="b") == 2
+    assert fresh_registry.get_counter("retries_total", func="c") == 0
+    assert fresh_registry.counter_total("retries_total") == 3
+    assert fresh_registry.gauges["gauge"] == {(): 3}
+    assert fresh_registry.get_histogram("duration", stage="x").count == 1
+    assert fresh_registry.get_histogram("duration", stage="y") is None
+    fresh_registry.reset()
+    assert fresh_registry.counter_total("retries_total") == 0
+
+
+# TaskTimings {{{1
+def test_task_timings(fresh_registry):
+    fresh_registry.inc("download_bytes_total", 100)
+    timings = metrics.TaskTimings()
+    fresh_registry.inc("download_bytes_total", 25)
+    fresh_registry.inc("cache_hits_total", cache="url")
+    timings.record("run_task", 1.5)
+    timings.record("run_task", 0.5)
+    contents = timings.to_dict()
+    assert contents["stages"] == {"run_task": 2.0}
+    assert contents["counters"] == {"download_bytes_total": 25, "upload_bytes_total": 0, "retries_total": 0, "cache_hits_total": 1}
+    assert contents["elapsed"] >= 0
+
+
+# timed {{{1
+@pytest.mark.parametrize("has_timings", (True, False))
+def test_timed(fresh_registry, rw_context, has_timings):
+    if has_timings:
+        rw_context.task_timings = metrics.TaskTimings()
+    with pytest.raises(ValueError):
+        with metrics.timed(rw_context, "stage"):
+            raise ValueError("boom")
+    assert fresh_registry.get_histogram("stage_duration_seconds", stage="stage").count == 1
+    if has_timings:
+        assert "stage" in rw_context.task_timings.stages
+
+
+# write_task_timings {{{1
+def test_write_task_timings(fresh_registry, rw_context):
+    assert metrics.write_task_timings(rw_context) is None
+    rw_context.claim_task = {"status": {"taskId": "taskid"}, "runId": 0, "task": {"payload": {}}, "credentials": {}}
+    rw_context.task_timings = metrics.TaskTimings()
+    rw_context.task_timings.record("run_task", 1)
+    path = metrics.write_task_timings(rw_context)
+    assert path == os.path.join(rw_context.config["task_log_dir"], "timings.json")
+    with open(path) as fh:
+        contents = json.load(fh)
+    assert contents["taskId"] == "taskid"
+    assert contents["runId"] == 0
+    assert contents["stages"] == {"run_task": 1}
+
+
+# render_prometheus {{{1
+def test_render_prometheus(fresh_registry):
+    fresh_registry.inc("tasks_completed_total", status="success")
+    fresh_registry.inc("tasks_completed_total", status='we"ird')
+    fresh_registry.set("event_loop_lag_last_seconds", 0.5)
+    fresh_registry.observe("reclaim_duration_seconds", 0.2, buckets=(0.1, 1))
+    assert metrics.render_prometheus().splitlines() == [
+        "# TYPE scriptworker_tasks_completed_total counter",
+        'scriptworker_tasks_completed_total{status="success"} 1',
+        'scriptworker_tasks_completed_total{status="we\\"ird"} 1',
+        "# TYPE scriptworker_event_loop_lag_last_seconds gauge",
+        "scriptworker_event_loop_lag_last_seconds 0.5",
+        "# TYPE scriptworker_reclaim_duration_seconds histogram",
+        'scriptworker_reclaim_duration_seconds_bucket{le="0.1"} 0',
+        'scriptworker_reclaim_duration_seconds_bucket{le="1.0"} 1',
+        'scriptworker_reclaim_duration_seconds_bucket{le="+Inf"} 1',
+        "scriptworker_reclaim_duration_seconds_sum 0.2",
+        "scriptworker_reclaim_duration_seconds_count 1",
+    ]
+
+
+# start_metrics_server {{{1
+@pytest.mark.asyncio
+async def test_start_metrics_server_disabled(rw_context):
+    assert await metrics.start_metrics_server(rw_context) is None
+
+
+@pytest.mark.asyncio
+async def test_start_metrics_server(fresh_registry, rw_context, unused_tcp_port):
+    rw_context.config["metrics_port"] = unused_tcp_port
+    fresh_registry.inc("claimwork_empty_polls_total")
+    runner = await metrics.start_metrics_server(rw_context)
+    try:
+        async with rw_context.session.get("http://127.0.0.1:{}/metrics".format(unused_tcp_port)) as resp:
+            assert resp.status == 200
+            assert "scriptworker_claimwork_empty_polls_total 1\n" in await resp.text()
+    finally:
+        await runner.cleanup()
+
+
+# monitor_event_loop_lag {{{1
+@pytest.mark.asyncio
+async def test_monitor_event_loop_lag(fresh_registry):
+    task = asyncio.ensure_future(metrics.monitor_event_loop_lag(interval=0.01))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert fresh_registry.get_histogram("event_loop_lag_seconds").count >= 1
+    assert fresh_registry.gauges["event_loop_lag_last_seconds"][()] >= 0
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.projects"""
+
+import os
+
+import pytest
+from immutabledict import immutabledict
+
+from scriptworker.projects import Projects
+from scriptworker.utils import load_json_or_yaml
+
+COTV4_DIR = os.path.join(os.path.dirname(__file__), "data", "cotv4")
+PROJECTS = {
+    "releases": {"repo": "https://hg.mozilla.org/releases", "repo_type": "hg", "access": "scm_level_1"},
+    "mozilla-beta": {"repo": "https://hg.mozilla.org/releases/mozilla-beta", "repo_type": "hg", "access": "scm_level_3"},
+    "try": {"repo": "https://hg.mozilla.org/try", "repo_type": "hg", "access": "scm_level_1"},
+    "fenix": {"repo": "https://github.com/mozilla-mobile/fenix", "repo_type": "git", "branches": [{"name": "main", "level": 3}, {"name": "*", "level": 1}]},
+    "vpn": {"repo": "https://github.com/mozilla-mobile/vpn/", "repo_type": "git", "default_branch": "master", "branches": [{"name": "main", "level": 3}]},
+    "no-repo": {},
+}
+
+
+# find_project {{{1
+@pytest.mark.parametrize(
+    "source_url, expected",
+    (
+        ("https://hg.mozilla.org/try", "try"),
+        ("https://hg.mozilla.org/try/rev/abcdef", "try"),
+        ("https://hg.mozilla.org/try-comm-central", None),
+        # releases comes first in projects.yml
+        ("https://hg.mozilla.org/releases/mozilla-beta/rev/abcdef", "releases"),
+        ("https://hg.mozilla.org/releases/mozilla-release", "releases"),
+        ("https://github.com/mozilla-mobile/fenix", "fenix"),
+        ("https://github.com/mozilla-mobile/fenix/", "fenix"),
+        ("https://github.com/mozilla-mobile/fenix.git", None),
+        ("https://github.com/mozilla-mobile/vpn", None),
+        ("https://github.com/mozilla-mobile/vpn//x", "vpn"),
+        ("", None),
+    ),
+)
+def test_find_project(source_url, expected):
+    assert Projects(PROJECTS).find_project(source_url) == expected
+
+
+def test_find_project_order():
+    projects = dict(PROJECTS)
+    del projects["releases"]
+    assert Projects(projects).find_project("https://hg.mozilla.org/releases/mozilla-beta/rev/abcdef") == "mozilla-beta"
+
+
+# get_scm_level {{{1
+@pytest.mark.parametrize("project, expected", (("releases", "1"), ("mozilla-beta", "3"), ("fenix", "3"), ("vpn", None)))
+def test_get_scm_level(project, expected):
+    assert Projects(PROJECTS).get_scm_level(project) == expected
+
+
+@pytest.mark.parametrize(
+    "project, config",
+    (
+        ("unknown", None),
+        ("no-repo", {}),
+        ("no-access", {"repo_type": "hg"}),
+        ("no-branches", {"repo_type": "git"}),
+        ("no-level", {"repo_type": "git", "branches": [{"name": "main"}]}),
+    ),
+)
+def test_get_scm_level_missing(project, config):
+    projects = dict(PROJECTS)
+    if config is not None:
+        projects[project] = config
+    with pytest.raises(KeyError):
+        Projects(projects).get_scm_level(project)
+
+
+# Projects {{{1
+def test_projects_frozen():
+    projects = Projects(PROJECTS)
+    assert list(projects) == list(PROJECTS)
+    assert len(projects) == len(PROJECTS)
+    assert isinstance(projects["fenix"], immutabledict)
+    assert projects["fenix"]["branches"][0] == {"name": "main", "level": 3}
+    with pytest.raises(TypeError):
+        projects["try"]["access"] = "scm_level_3"
+
+
+def test_projects_yml():
+    projects = Projects(load_json_or_yaml(os.path.join(COTV4_DIR, "projects.yml"), is_path=True, file_type="yaml"))
+    for project, config in projects.items():
+        if "repo" in config:
+            assert projects.find_project(config["repo"]) is not None
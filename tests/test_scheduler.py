@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.scheduler"""
+
+import asyncio
+
+import pytest
+
+from scriptworker.scheduler import COT_DOWNLOAD, MANDATORY_DOWNLOAD, OPTIONAL_DOWNLOAD, PrioritySemaphore, download_priority
+
+
+async def _start(semaphore, order, name, download_class):
+    with download_priority(download_class):
+        future = asyncio.ensure_future(_download(semaphore, order, name))
+    await asyncio.sleep(0)
+    return future
+
+
+async def _download(semaphore, order, name):
+    async with semaphore:
+        order.append(name)
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_priority_order():
+    semaphore = PrioritySemaphore(1)
+    order = []
+    await semaphore.acquire()
+    futures = [
+        await _start(semaphore, order, "optional", OPTIONAL_DOWNLOAD),
+        await _start(semaphore, order, "first", MANDATORY_DOWNLOAD),
+        await _start(semaphore, order, "second", MANDATORY_DOWNLOAD),
+        await _start(semaphore, order, "task-graph.json", COT_DOWNLOAD),
+    ]
+    assert order == []
+    semaphore.release()
+    await asyncio.gather(*futures)
+    assert order == ["task-graph.json", "first", "second", "optional"]
+    assert not semaphore.locked()
+
+
+@pytest.mark.asyncio
+async def test_class_limits():
+    semaphore = PrioritySemaphore(3, class_limits={OPTIONAL_DOWNLOAD: 1})
+    with download_priority(OPTIONAL_DOWNLOAD):
+        assert await semaphore.acquire() == OPTIONAL_DOWNLOAD
+    order = []
+    future = await _start(semaphore, order, "optional", OPTIONAL_DOWNLOAD)
+    # A slot is free, but optional downloads already use their share.
+    assert order == []
+    assert await semaphore.acquire(MANDATORY_DOWNLOAD) == MANDATORY_DOWNLOAD
+    semaphore.release(OPTIONAL_DOWNLOAD)
+    await future
+    assert order == ["optional"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter():
+    semaphore = PrioritySemaphore(1)
+    order = []
+    await semaphore.acquire()
+    cancelled = await _start(semaphore, order, "cancelled", COT_DOWNLOAD)
+    waiting = await _start(semaphore, order, "waiting", OPTIONAL_DOWNLOAD)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    semaphore.release()
+    await waiting
+    assert order == ["waiting"]
+    assert not semaphore.locked()
+
+
+def test_unknown_class():
+    with pytest.raises(ValueError):
+        PrioritySemaphore(1, class_limits={"bogus": 1})
+    with pytest.raises(ValueError):
+        with download_priority("bogus"):
+            pass
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.schema"""
+
+import json
+import os
+
+import jsonschema
+import pytest
+
+from scriptworker.exceptions import ScriptWorkerException, ScriptWorkerTaskException
+from scriptworker.schema import TASK_SCHEMA_PATH, CompiledSchema, SchemaRegistry, schemas
+
+URI_SCHEMA = {"type": "object", "properties": {"uri": {"type": "string", "format": "uri"}}, "required": ["uri"]}
+
+
+def _write_schema(path, schema):
+    with open(path, "w") as fh:
+        json.dump(schema, fh)
+
+
+# CompiledSchema {{{1
+@pytest.mark.parametrize("format_checks", (True, False))
+def test_compiled_schema(format_checks):
+    compiled = CompiledSchema(URI_SCHEMA, format_checks=format_checks)
+    compiled.validate({"uri": "https://example.com"})
+    with pytest.raises(ScriptWorkerTaskException, match="Can't validate payload schema"):
+        compiled.validate({}, name="payload")
+    if format_checks:
+        with pytest.raises(ScriptWorkerTaskException):
+            compiled.validate({"uri": "not-a-uri"})
+    else:
+        compiled.validate({"uri": "not-a-uri"})
+
+
+def test_compiled_schema_bad_schema():
+    with pytest.raises(jsonschema.exceptions.SchemaError):
+        CompiledSchema({"type": "not-a-type"})
+
+
+# SchemaRegistry {{{1
+def test_schema_registry(tmpdir):
+    path = os.path.join(tmpdir, "schema.json")
+    _write_schema(path, URI_SCHEMA)
+    registry = SchemaRegistry()
+    compiled = registry.get(path)
+    assert registry.get(path) is compiled
+    assert registry.get(path, format_checks=False) is not compiled
+    # a changed file is reloaded
+    _write_schema(path, {"type": "object"})
+    os.utime(path, ns=(0, 0))
+    new_compiled = registry.get(path)
+    assert new_compiled is not compiled
+    new_compiled.validate({})
+    registry.clear()
+    assert registry.get(path) is not new_compiled
+
+
+def test_schema_registry_missing_file(tmpdir):
+    path = os.path.join(tmpdir, "missing.json")
+    with pytest.raises(ScriptWorkerException, match="Can't read"):
+        SchemaRegistry().get(path, exception=ScriptWorkerException, message="Can't read schema: %(exc)s")
+
+
+def test_task_schema():
+    assert schemas.get(TASK_SCHEMA_PATH) is schemas.get(TASK_SCHEMA_PATH)
+    with pytest.raises(ScriptWorkerTaskException):
+        schemas.get(TASK_SCHEMA_PATH).validate({})
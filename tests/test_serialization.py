@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.serialization"""
+
+import gc
+import json
+import os
+
+import pytest
+import yaml
+
+import scriptworker.serialization as serialization
+from scriptworker.serialization import JSON_BACKENDS, YAML_BACKENDS, Serializer
+
+
+def _available(backends, kwarg):
+    available = []
+    for backend in backends:
+        try:
+            Serializer(**{kwarg: backend})
+        except ValueError:
+            continue
+        available.append(backend)
+    return available
+
+
+JSON = _available(JSON_BACKENDS, "json_backend")
+YAML = _available(YAML_BACKENDS, "yaml_backend")
+
+DATA = {
+    "b": [1, 2.5, 1e-05, 1e16, None, True],
+    "a": {"unicode": "snowman ☃", "nested": {"z": [], "y": {}}},
+    "big": 2**70,
+}
+
+
+# Serializer {{{1
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        Serializer(json_backend="bogus")
+    with pytest.raises(ValueError):
+        Serializer(yaml_backend="bogus")
+    assert Serializer(json_backend="json", yaml_backend="pure").json_backend == "json"
+
+
+@pytest.mark.parametrize("backend", JSON)
+@pytest.mark.parametrize(
+    "body",
+    (
+        json.dumps(DATA),
+        json.dumps(DATA).encode("utf-8"),
+        '{"nan": NaN, "inf": -Infinity}',
+        '["12345678901234567890123", 18446744073709551615, -9223372036854775808]',
+        '"\ud800"',
+    ),
+    ids=("str", "bytes", "nan", "wide ints", "surrogate"),
+)
+def test_loads_json(backend, body):
+    assert repr(Serializer(json_backend=backend).loads_json(body)) == repr(json.loads(body))
+
+
+@pytest.mark.parametrize("backend", JSON)
+def test_loads_json_error(backend):
+    with pytest.raises(json.JSONDecodeError) as excinfo:
+        Serializer(json_backend=backend).loads_json('{"a": ')
+    with pytest.raises(json.JSONDecodeError) as expected:
+        json.loads('{"a": ')
+    assert str(excinfo.value) == str(expected.value)
+
+
+def test_loads_json_pauses_gc(mocker):
+    mocker.patch.object(serialization, "GC_PAUSE_THRESHOLD", 10)
+    enabled = []
+    real_loads = json.loads
+
+    def fake_loads(*args, **kwargs):
+        enabled.append(gc.isenabled())
+        return real_loads(*args, **kwargs)
+
+    mocker.patch.object(serialization.json, "loads", new=fake_loads)
+    serializer = Serializer(json_backend="json")
+    serializer.loads_json("[1]")
+    serializer.loads_json('["longer than ten"]')
+    assert enabled == [True, False]
+    assert gc.isenabled()
+
+
+@pytest.mark.parametrize("backend", JSON)
+def test_dumps_json(backend):
+    serializer = Serializer(json_backend=backend)
+    assert serializer.dumps_json(DATA) == json.dumps(DATA, indent=2, sort_keys=True)
+    assert json.loads(serializer.dumps_json(DATA, canonical=False)) == DATA
+    small = {"b": [1, "☃"], "a": {}}
+    assert json.loads(serializer.dumps_json(small, canonical=False)) == small
+    # Non-str keys fall back to json.
+    assert serializer.dumps_json({1: "a"}, canonical=False) == json.dumps({1: "a"}, indent=2, sort_keys=True)
+    with pytest.raises(TypeError):
+        serializer.dumps_json({"a": object()}, canonical=False)
+
+
+@pytest.mark.parametrize("backend", YAML)
+def test_loads_yaml(backend):
+    path = os.path.join(os.path.dirname(__file__), "data", "cotv4", ".taskcluster.yml")
+    serializer = Serializer(yaml_backend=backend)
+    with open(path) as fh:
+        body = fh.read()
+    with open(path) as fh:
+        assert serializer.load_yaml(fh) == serializer.loads_yaml(body) == yaml.safe_load(body)
+    with pytest.raises(yaml.YAMLError):
+        serializer.loads_yaml("a: b: c")
@@ -19,6 +19,7 @@ from taskcluster.exceptions import TaskclusterFailure
 import scriptworker.log as log
 import scriptworker.task as swtask
 from scriptworker.exceptions import ScriptWorkerTaskException, WorkerShutdownDuringTask
+from scriptworker.metrics import registry
 from scriptworker.task_process import TaskProcess
 
 from . import TIMEOUT_SCRIPT, noop_async, read
@@ -593,8 +594,10 @@ async def test_reportException(context, successful_queue):
 @pytest.mark.asyncio
 async def test_reversed_statuses(context, successful_queue, exit_code):
     context.temp_queue = successful_queue
+    completed = registry.get_counter("tasks_completed_total", status="intermittent-task")
     await swtask.complete_task(context, exit_code)
     assert successful_queue.info == ["reportException", ("taskId", 0, {"reason": context.config["reversed_statuses"][exit_code]}), {}]
+    assert registry.get_counter("tasks_completed_total", status="intermittent-task") == completed + 1
 
 
 # complete_task {{{1
@@ -629,8 +632,10 @@ async def test_skip_reclaim_task(context, successful_queue):
 async def test_reclaim_task_non_409(context, successful_queue):
     successful_queue.status = 500
     context.temp_queue = successful_queue
+    failures = registry.get_counter("reclaim_failures_total", status_code=500)
     with pytest.raises(taskcluster.exceptions.TaskclusterRestFailure):
         await swtask.reclaim_task(context, context.task)
+    assert registry.get_counter("reclaim_failures_total", status_code=500) == failures + 1
 
 
 @pytest.mark.parametrize("no_proc", (True, False))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.trace"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+import scriptworker.trace as trace
+
+
+# helpers {{{1
+@pytest.fixture(scope="function")
+def trace_path(tmpdir):
+    path = os.path.join(tmpdir, "traces", "spans.jsonl")
+    trace.configure_tracing(path)
+    yield path
+    trace.configure_tracing("")
+
+
+def read_spans(path):
+    spans = []
+    with open(path) as fh:
+        for line in fh:
+            document = json.loads(line)
+            spans.extend(document["resourceSpans"][0]["scopeSpans"][0]["spans"])
+    return {span["name"]: span for span in spans}
+
+
+# span {{{1
+def test_span_disabled():
+    trace.configure_tracing("")
+    with trace.span("foo", a=1) as span:
+        assert span is trace.NOOP_SPAN
+        span.set_attribute("b", 2)
+        span.add("retries")
+        assert trace.current_span() is trace.NOOP_SPAN
+
+
+@pytest.mark.asyncio
+async def test_span_nesting(trace_path):
+    async def child(name):
+        with trace.span(name) as span:
+            await asyncio.sleep(0)
+            trace.current_span().add("retries")
+            trace.current_span().add("retries")
+            span.set_attribute("bytes", 10)
+
+    with trace.span("root", taskId="abc") as root:
+        await asyncio.gather(child("one"), child("two"))
+        assert trace.current_span() is root
+    with pytest.raises(ValueError):
+        with trace.span("broken"):
+            raise ValueError("boom")
+
+    spans = read_spans(trace_path)
+    assert set(spans) == {"root", "one", "two", "broken"}
+    for name in ("one", "two"):
+        assert spans[name]["traceId"] == spans["root"]["traceId"]
+        assert spans[name]["parentSpanId"] == spans["root"]["spanId"]
+        assert spans[name]["attributes"] == [
+            {"key": "bytes", "value": {"intValue": "10"}},
+            {"key": "retries", "value": {"intValue": "2"}},
+        ]
+    assert "parentSpanId" not in spans["root"]
+    assert spans["root"]["attributes"] == [{"key": "taskId", "value": {"stringValue": "abc"}}]
+    assert spans["root"]["status"] == {"code": 1}
+    assert spans["broken"]["traceId"] != spans["root"]["traceId"]
+    assert spans["broken"]["status"] == {"code": 2, "message": "ValueError: boom"}
+    assert int(spans["root"]["endTimeUnixNano"]) >= int(spans["root"]["startTimeUnixNano"])
+
+
+def test_span_sampling(tmpdir):
+    path = os.path.join(tmpdir, "spans.jsonl")
+    tracer = trace.configure_tracing(path, sample_rate=0.5)
+    try:
+        tracer.should_sample = lambda: False
+        with trace.span("root") as root:
+            assert root.sampled is False
+            with trace.span("child") as child:
+                assert child.sampled is False
+        assert not os.path.exists(path)
+    finally:
+        trace.configure_tracing("")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.trash"""
+
+import os
+import threading
+
+import pytest
+
+import scriptworker.trash as trash
+from scriptworker.trash import TRASH_DIR_NAME, TrashCollector
+
+from . import touch
+
+
+def _make_dir(path):
+    os.makedirs(os.path.join(path, "sub"))
+    touch(os.path.join(path, "sub", "file"))
+
+
+# TrashCollector {{{1
+def test_trash(tmpdir):
+    path = os.path.join(tmpdir, "work")
+    _make_dir(path)
+    collector = TrashCollector(max_pending=2)
+    assert collector.trash(path)
+    assert not os.path.exists(path)
+    assert collector.wait(timeout=10)
+    assert collector.pending == 0
+    assert os.listdir(os.path.join(tmpdir, TRASH_DIR_NAME)) == []
+
+
+def test_trash_leftovers(tmpdir):
+    trash_dir = os.path.join(tmpdir, TRASH_DIR_NAME)
+    _make_dir(os.path.join(trash_dir, "old.1234"))
+    touch(os.path.join(trash_dir, "old_file.5678"))
+    path = os.path.join(tmpdir, "work")
+    _make_dir(path)
+    collector = TrashCollector(max_pending=5)
+    assert collector.trash(path)
+    assert collector.wait(timeout=10)
+    assert os.listdir(trash_dir) == []
+
+
+def test_trash_max_pending(tmpdir, mocker):
+    release = threading.Event()
+    real_rmtree = trash.shutil.rmtree
+
+    def slow_rmtree(*args, **kwargs):
+        release.wait(10)
+        real_rmtree(*args, **kwargs)
+
+    mocker.patch.object(trash.shutil, "rmtree", new=slow_rmtree)
+    collector = TrashCollector(max_pending=1)
+    paths = [os.path.join(tmpdir, name) for name in ("one", "two")]
+    for path in paths:
+        _make_dir(path)
+    assert collector.trash(paths[0])
+    assert collector.pending == 1
+    second = threading.Thread(target=collector.trash, args=(paths[1],))
+    second.start()
+    second.join(0.2)
+    # the second trash() is blocked until the first is deleted
+    assert second.is_alive()
+    assert os.path.exists(paths[1])
+    release.set()
+    second.join(10)
+    assert not os.path.exists(paths[1])
+    assert collector.wait(timeout=10)
+
+
+@pytest.mark.parametrize("fail_makedirs", (True, False))
+def test_trash_fails(tmpdir, mocker, fail_makedirs):
+    path = os.path.join(tmpdir, "work")
+    _make_dir(path)
+
+    def fail(*args, **kwargs):
+        raise OSError("nope")
+
+    mocker.patch.object(trash.os, "makedirs" if fail_makedirs else "rename", new=fail)
+    collector = TrashCollector(max_pending=1)
+    assert not collector.trash(path)
+    assert os.path.exists(path)
+
+
+def test_get_trash_collector(mocker):
+    mocker.patch.object(trash, "_collector", new=None)
+    collector = trash.get_trash_collector(3)
+    assert collector.max_pending == 3
+    assert trash.get_trash_collector(5) is collector
+    assert collector.max_pending == 5
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.upstream"""
+
+from copy import deepcopy
+
+import pytest
+
+from scriptworker.upstream import UpstreamArtifacts, compile_artifact_pattern, get_upstream_artifacts, match_artifact_names
+
+UPSTREAM_ARTIFACTS = [
+    {"taskId": "build", "taskType": "build", "paths": ["public/build/target.dmg", "public/build/target.tar.gz"]},
+    {"taskId": "build", "taskType": "build", "paths": ["public/logs/*.log", "public/build/target.dmg"], "optional": True},
+    {"taskId": "signing", "taskType": "signing", "paths": ["public/build/target.apk"]},
+    {"taskId": "signing", "taskType": "l10n", "paths": ["public/build/target.apk"], "optional": False},
+]
+
+
+# compile_artifact_pattern {{{1
+def test_compile_artifact_pattern():
+    compile_artifact_pattern.cache_clear()
+    pattern = compile_artifact_pattern("public/build/*.dmg")
+    assert compile_artifact_pattern("public/build/*.dmg") is pattern
+    assert compile_artifact_pattern.cache_info().hits == 1
+    assert pattern.match("public/build/target.dmg")
+    assert not pattern.match("public/build/target.dmg.asc")
+
+
+# match_artifact_names {{{1
+def test_match_artifact_names():
+    names = ["public/build/target.dmg", "public/build/target.tar.gz", "public/logs/live.log", "private/target.dmg", "public/build/sub/target.dmg"]
+    patterns = ["public/build/*.dmg", "*.log", "public/*", "nothing*"]
+    assert match_artifact_names(names, patterns) == {
+        # like fnmatch, * matches across slashes
+        "public/build/*.dmg": ["public/build/target.dmg", "public/build/sub/target.dmg"],
+        "*.log": ["public/logs/live.log"],
+        "public/*": ["public/build/target.dmg", "public/build/target.tar.gz", "public/logs/live.log", "public/build/sub/target.dmg"],
+        "nothing*": [],
+    }
+
+
+# UpstreamArtifacts {{{1
+def test_upstream_artifacts():
+    index = UpstreamArtifacts(UPSTREAM_ARTIFACTS)
+    assert index.task_ids == ("build", "signing")
+    assert index.definitions[1] == ("build", "build", ("public/logs/*.log", "public/build/target.dmg"), True)
+    assert index.paths_per_task_id["build"] == ("public/build/target.dmg", "public/build/target.tar.gz", "public/logs/*.log")
+    assert index.paths_per_task_id["signing"] == ("public/build/target.apk",)
+    assert index.optional_paths_per_task_id["build"] == frozenset(["public/logs/*.log", "public/build/target.dmg"])
+    assert index.optional_paths_per_task_id["signing"] == frozenset()
+    assert index.patterns("build") == ("public/logs/*.log",)
+    assert index.patterns("signing") == ()
+    assert index.match("build", ["public/logs/live.log", "public/build/target.dmg"]) == {"public/logs/*.log": ["public/logs/live.log"]}
+
+
+@pytest.mark.parametrize(
+    "task_id, path, expected",
+    (
+        ("build", "public/build/target.tar.gz", False),
+        # listed both as mandatory and optional
+        ("build", "public/build/target.dmg", True),
+        ("build", "public/logs/*.log", True),
+        ("signing", "public/build/target.apk", False),
+        ("unknown", "public/build/target.apk", False),
+    ),
+)
+def test_upstream_artifacts_is_optional(task_id, path, expected):
+    assert UpstreamArtifacts(UPSTREAM_ARTIFACTS).is_optional(task_id, path) is expected
+
+
+def test_upstream_artifacts_immutable():
+    index = UpstreamArtifacts(UPSTREAM_ARTIFACTS)
+    with pytest.raises(AttributeError):
+        index.task_ids = ()
+    with pytest.raises(TypeError):
+        index.paths_per_task_id["build"] = ()
+
+
+@pytest.mark.parametrize("task", (None, {}, {"payload": {}}))
+def test_upstream_artifacts_from_task_empty(task):
+    index = UpstreamArtifacts.from_task(task)
+    assert index.task_ids == ()
+    assert not index.is_optional("build", "public/build/target.dmg")
+
+
+# get_upstream_artifacts {{{1
+def test_get_upstream_artifacts():
+    upstream_artifacts = deepcopy(UPSTREAM_ARTIFACTS)
+    index = get_upstream_artifacts(upstream_artifacts)
+    assert get_upstream_artifacts(upstream_artifacts, index) is index
+    # an equal, but different, list
+    assert get_upstream_artifacts(deepcopy(UPSTREAM_ARTIFACTS), index) is index
+    upstream_artifacts.append({"taskId": "beetmover", "paths": ["public/target.zip"]})
+    new_index = get_upstream_artifacts(upstream_artifacts, index)
+    assert new_index is not index
+    assert new_index.paths_per_task_id["beetmover"] == ("public/target.zip",)
+
+
+@pytest.mark.parametrize(
+    "edit",
+    (
+        lambda upstream_artifacts: upstream_artifacts[2].update({"optional": True}),
+        lambda upstream_artifacts: upstream_artifacts[0]["paths"].append("public/build/extra.zip"),
+        lambda upstream_artifacts: upstream_artifacts.reverse(),
+    ),
+    ids=("optional", "paths", "swapped"),
+)
+def test_get_upstream_artifacts_edited_in_place(edit):
+    upstream_artifacts = deepcopy(UPSTREAM_ARTIFACTS)
+    index = get_upstream_artifacts(upstream_artifacts)
+    edit(upstream_artifacts)
+    new_index = get_upstream_artifacts(upstream_artifacts, index)
+    assert new_index is not index
+    assert new_index.definitions == UpstreamArtifacts(deepcopy(upstream_artifacts)).definitions
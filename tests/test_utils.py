@@ -3,17 +3,25 @@
 """Test scriptworker.utils"""
 
 import asyncio
+import gzip
+import hashlib
 import os
 import re
 import shutil
 import tempfile
 import time
 
+import aiohttp
 import mock
 import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from multidict import CIMultiDict
 
 import scriptworker.utils as utils
+from scriptworker.config import get_frozen_copy
 from scriptworker.exceptions import Download404, DownloadError, ScriptWorkerException, ScriptWorkerRetryException
+from scriptworker.trash import get_trash_collector
 
 from . import FakeResponse, touch
 
@@ -93,6 +101,16 @@ def test_cleanup(rw_context):
     # 2nd pass
     utils.rm(rw_context.config["work_dir"])
     utils.cleanup(rw_context)
+    assert get_trash_collector(rw_context.config["max_pending_trash"]).wait(timeout=10)
+
+
+def test_cleanup_in_place(rw_context, mocker):
+    rw_context.config["max_pending_trash"] = 0
+    trash = mocker.patch.object(utils, "get_trash_collector")
+    open(os.path.join(rw_context.config["work_dir"], "tempfile"), "w").close()
+    utils.cleanup(rw_context)
+    assert not os.path.exists(os.path.join(rw_context.config["work_dir"], "tempfile"))
+    trash.assert_not_called()
 
 
 # request and retry_request {{{1
@@ -138,6 +156,52 @@ async def test_retry_request(rw_context, fake_session):
     assert result == "{}"
 
 
+# get_if_modified {{{1
+class _ConditionalResponse(object):
+    def __init__(self, status, body="", headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def text(self):
+        return self.body
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "status, validators, expected_headers, expected",
+    (
+        (200, None, {}, ("body", {"ETag": '"abc"', "Last-Modified": "date"})),
+        (
+            304,
+            {"ETag": '"abc"', "Last-Modified": "date"},
+            {"If-None-Match": '"abc"', "If-Modified-Since": "date"},
+            (None, {"ETag": '"abc"', "Last-Modified": "date"}),
+        ),
+    ),
+)
+async def test_get_if_modified(status, validators, expected_headers, expected):
+    session = mock.MagicMock()
+    session.get.return_value = _ConditionalResponse(status, body="body", headers={"ETag": '"abc"', "Last-Modified": "date", "Other": "x"})
+    assert await utils.get_if_modified(session, "https://example.com/projects.yml", validators=validators) == expected
+    session.get.assert_called_once_with("https://example.com/projects.yml", headers=expected_headers)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status, exception", ((503, ScriptWorkerRetryException), (404, ScriptWorkerException)))
+async def test_get_if_modified_bad_status(status, exception):
+    session = mock.MagicMock()
+    session.get.return_value = _ConditionalResponse(status)
+    with pytest.raises(exception):
+        await utils.get_if_modified(session, "https://example.com/bad/{}".format(status))
+
+
 # calculate_sleep_time {{{1
 @pytest.mark.parametrize("attempt", (-1, 0))
 def test_calculate_no_sleep_time(attempt):
@@ -300,6 +364,59 @@ def test_filepaths_in_dir(tmpdir):
     assert sorted(utils.filepaths_in_dir(tmpdir)) == filepaths
 
 
+def test_filepaths_in_dir_symlinks(tmpdir):
+    os.makedirs(os.path.join(tmpdir, "real", "sub"))
+    touch(os.path.join(tmpdir, "real", "sub", "file"))
+    os.symlink(os.path.join(tmpdir, "real"), os.path.join(tmpdir, "linked_dir"))
+    os.symlink(os.path.join(tmpdir, "real", "sub", "file"), os.path.join(tmpdir, "linked_file"))
+    os.symlink(os.path.join(tmpdir, "nonexistent"), os.path.join(tmpdir, "broken"))
+    # same as os.walk: symlinked files are listed, symlinked dirs are not followed
+    assert sorted(utils.filepaths_in_dir(tmpdir)) == ["broken", "linked_file", "real/sub/file"]
+
+
+# ArtifactManifest {{{1
+def test_artifact_manifest(tmpdir, mocker):
+    os.makedirs(os.path.join(tmpdir, "public", "logs"))
+    for path, contents in (("one", "1"), ("public/two", "22"), ("public/logs/three", "333")):
+        with open(os.path.join(tmpdir, path), "w") as fh:
+            fh.write(contents)
+    os.symlink(os.path.join(tmpdir, "nonexistent"), os.path.join(tmpdir, "broken"))
+    manifest = utils.ArtifactManifest(str(tmpdir)).scan()
+    assert manifest.filepaths() == ["one", "public/logs/three", "public/two"]
+    assert manifest.entries["public/two"].size == 2
+    hashes = manifest.get_hashes(manifest.filepaths())
+    assert hashes["one"] == {"sha256": utils.get_hash(os.path.join(tmpdir, "one"))}
+
+    hash_files = mocker.spy(utils, "hash_files")
+    unchanged = manifest.entries["one"]
+    with open(os.path.join(tmpdir, "public", "two"), "w") as fh:
+        fh.write("changed")
+    os.remove(os.path.join(tmpdir, "public", "logs", "three"))
+    manifest.scan()
+    assert manifest.filepaths() == ["one", "public/two"]
+    assert manifest.entries["one"] is unchanged
+    assert manifest.entries["public/two"].size == 7
+    # only the changed file gets hashed again
+    manifest.get_hashes(manifest.filepaths())
+    hash_files.assert_called_once_with([os.path.join(tmpdir, "public/two")], ("sha256",))
+
+
+def test_artifact_manifest_refresh(tmpdir):
+    path = os.path.join(tmpdir, "one")
+    with open(path, "w") as fh:
+        fh.write("1")
+    manifest = utils.ArtifactManifest(str(tmpdir)).scan()
+    entry = manifest.entries["one"]
+    assert manifest.refresh("one") is entry
+    with open(path, "w") as fh:
+        fh.write("longer")
+    assert manifest.refresh("one").size == 6
+    assert manifest.refresh("new") is None
+    os.remove(path)
+    assert manifest.refresh("one") is None
+    assert manifest.filepaths() == []
+
+
 # get_hash {{{1
 def test_get_hash():
     path = os.path.join(os.path.dirname(__file__), "data", "azure.xml")
@@ -307,6 +424,32 @@ def test_get_hash():
     assert sha == "584818280d7908da33c810a25ffb838b1e7cec1547abd50c859521229942c5a5"
 
 
+@pytest.mark.parametrize("size", (0, 10, utils.HASH_CHUNK_SIZE, utils.HASH_CHUNK_SIZE * 2 + 1))
+def test_get_hashes(tmpdir, size):
+    path = os.path.join(tmpdir, "file")
+    contents = os.urandom(size)
+    with open(path, "wb") as fh:
+        fh.write(contents)
+    assert utils.get_hashes(path, ("sha256", "sha512")) == {
+        "sha256": hashlib.sha256(contents).hexdigest(),
+        "sha512": hashlib.sha512(contents).hexdigest(),
+    }
+
+
+@pytest.mark.asyncio
+async def test_hash_files(tmpdir):
+    paths = []
+    for number in range(5):
+        path = os.path.join(tmpdir, str(number))
+        with open(path, "w") as fh:
+            fh.write(str(number) * number)
+        paths.append(path)
+    expected = {path: {"sha256": utils.get_hash(path), "sha512": utils.get_hash(path, "sha512")} for path in paths}
+    assert utils.hash_files(paths, ("sha256", "sha512")) == expected
+    assert await utils.hash_files_async(paths, ("sha256", "sha512")) == expected
+    assert await utils.get_hashes_async(paths[0]) == {"sha256": expected[paths[0]]["sha256"]}
+
+
 # makedirs {{{1
 def test_makedirs_empty():
     utils.makedirs(None)
@@ -500,6 +643,326 @@ async def test_download_file_atomic_concurrent_no_corruption(rw_context, tmpdir)
     assert os.listdir(tmpdir) == ["foo"]
 
 
+class _RangeResponse(FakeResponse):
+    fail_after = None
+
+    def close(self):
+        self.resp = []
+
+    async def read(self, *args):
+        if self.fail_after is not None and self.sent >= self.fail_after:
+            raise aiohttp.ClientPayloadError("connection reset")
+        if self.resp:
+            chunk = self.resp.pop(0)
+            self.sent += len(chunk)
+            return chunk
+
+
+def _range_session(payload, etag='"v1"', fail_after=None, headers=None, chunk_size=10):
+    """A session that serves ``payload``, honoring Range and If-Range, and records the request headers."""
+    requests = []
+
+    async def _req(method, url, *_args, **kwargs):
+        request_headers = kwargs.get("headers") or {}
+        requests.append(request_headers)
+        first_byte = 0
+        resp_headers = CIMultiDict({"Accept-Ranges": "bytes", "ETag": etag})
+        last_byte = len(payload) - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", request_headers.get("Range", ""))
+        if match and request_headers.get("If-Range") == etag:
+            first_byte = int(match.group(1))
+            last_byte = min(int(match.group(2) or last_byte), last_byte)
+            resp = _RangeResponse(method, url, status=206)
+            resp_headers["Content-Range"] = "bytes {}-{}/{}".format(first_byte, last_byte, len(payload))
+        else:
+            resp = _RangeResponse(method, url, status=200)
+        resp_headers["Content-Length"] = str(last_byte + 1 - first_byte)
+        resp_headers.update(headers or {})
+        resp._headers = resp_headers
+        body = payload[first_byte : last_byte + 1]
+        resp.resp = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+        resp.sent = 0
+        resp.fail_after = fail_after.pop(0) if fail_after else None
+        return resp
+
+    session = utils.scriptworker_session()
+    session._request = _req
+    return session, requests
+
+
+@pytest.mark.asyncio
+async def test_download_file_resume(rw_context, tmpdir):
+    payload = bytes(range(256)) * 4
+    path = os.path.join(tmpdir, "foo")
+    session, requests = _range_session(payload, fail_after=[300, 200])
+    try:
+        for _ in range(2):
+            with pytest.raises(aiohttp.ClientPayloadError):
+                await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+            assert not os.path.exists(path)
+        hashes = await utils.download_file(rw_context, "url", path, session=session, chunk_size=10, hash_algs=("sha256", "sha512"))
+    finally:
+        await session.close()
+    assert requests[0] == {}
+    assert requests[1] == {"Range": "bytes=300-", "If-Range": '"v1"'}
+    assert requests[2] == {"Range": "bytes=500-", "If-Range": '"v1"'}
+    with open(path, "rb") as fh:
+        assert fh.read() == payload
+    assert hashes == {"sha256": hashlib.sha256(payload).hexdigest(), "sha512": hashlib.sha512(payload).hexdigest()}
+    assert os.listdir(tmpdir) == ["foo"]
+
+
+@pytest.mark.asyncio
+async def test_download_file_resume_changed(rw_context, tmpdir):
+    path = os.path.join(tmpdir, "foo")
+    session, _ = _range_session(b"a" * 100, fail_after=[50])
+    try:
+        with pytest.raises(aiohttp.ClientPayloadError):
+            await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+    finally:
+        await session.close()
+    # The artifact changed, so If-Range doesn't match and we get all of it.
+    session, requests = _range_session(b"b" * 80, etag='"v2"')
+    try:
+        await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+    finally:
+        await session.close()
+    assert requests == [{"Range": "bytes=50-", "If-Range": '"v1"'}]
+    with open(path, "rb") as fh:
+        assert fh.read() == b"b" * 80
+    assert os.listdir(tmpdir) == ["foo"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("headers", ({"ETag": ""}, {"ETag": 'W/"weak"'}, {"Accept-Ranges": "none"}))
+async def test_download_file_not_resumable(rw_context, tmpdir, headers):
+    path = os.path.join(tmpdir, "foo")
+    session, requests = _range_session(b"a" * 100, fail_after=[50], headers=headers)
+    try:
+        with pytest.raises(aiohttp.ClientPayloadError):
+            await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+        assert os.listdir(tmpdir) == []
+        await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+    finally:
+        await session.close()
+    assert requests == [{}, {}]
+
+
+@pytest.mark.asyncio
+async def test_download_file_gzip(rw_context, tmpdir):
+    """A gzipped artifact, like the chain of trust artifact, is decoded while
+    it's downloaded, so its Content-Length isn't the length written."""
+    payload = b'{"artifacts": {}}\n' * 1000
+    body = gzip.compress(payload)
+
+    async def handler(request):
+        return web.Response(body=body, headers={"Content-Encoding": "gzip", "Content-Type": "application/json", "ETag": '"v1"', "Accept-Ranges": "bytes"})
+
+    app = web.Application()
+    app.router.add_get("/chain-of-trust.json", handler)
+    server = TestServer(app)
+    await server.start_server()
+    path = os.path.join(tmpdir, "chain-of-trust.json")
+    try:
+        async with aiohttp.ClientSession() as session:
+            hashes = await utils.download_file(rw_context, str(server.make_url("/chain-of-trust.json")), path, session=session, hash_algs=("sha256",))
+    finally:
+        await server.close()
+    with open(path, "rb") as fh:
+        assert fh.read() == payload
+    assert hashes == {"sha256": hashlib.sha256(payload).hexdigest()}
+    assert os.listdir(tmpdir) == ["chain-of-trust.json"]
+
+
+@pytest.mark.asyncio
+async def test_download_file_gzip_not_in_parts(rw_context, tmpdir):
+    rw_context.config["download_parallel_threshold_mb"] = 1
+    rw_context.config["download_part_size_mb"] = 1
+    payload = os.urandom(3 * 1024 * 1024)
+    body = gzip.compress(payload)
+    requests = []
+
+    async def handler(request):
+        requests.append(request.headers.get("Range"))
+        return web.Response(body=body, headers={"Content-Encoding": "gzip", "ETag": '"v1"', "Accept-Ranges": "bytes"})
+
+    app = web.Application()
+    app.router.add_get("/foo", handler)
+    server = TestServer(app)
+    await server.start_server()
+    path = os.path.join(tmpdir, "foo")
+    try:
+        async with aiohttp.ClientSession() as session:
+            await utils.download_file(rw_context, str(server.make_url("/foo")), path, session=session)
+    finally:
+        await server.close()
+    with open(path, "rb") as fh:
+        assert fh.read() == payload
+    # Ranges of the encoded body can't be written at decoded offsets.
+    assert requests == [None]
+
+
+@pytest.mark.asyncio
+async def test_download_file_resume_encoded(rw_context, tmpdir):
+    path = os.path.join(tmpdir, "foo")
+    headers = {}
+    session, requests = _range_session(b"a" * 100, fail_after=[50], headers=headers)
+    try:
+        with pytest.raises(aiohttp.ClientPayloadError):
+            await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+        headers["Content-Encoding"] = "gzip"
+        with pytest.raises(DownloadError):
+            await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+    finally:
+        await session.close()
+    assert requests[1]["Range"] == "bytes=50-"
+    assert os.listdir(tmpdir) == []
+
+
+@pytest.mark.asyncio
+async def test_download_file_resume_ignored_if_range(rw_context, tmpdir):
+    path = os.path.join(tmpdir, "foo")
+    headers = {}
+    session, requests = _range_session(b"a" * 100, fail_after=[50], headers=headers)
+    try:
+        with pytest.raises(aiohttp.ClientPayloadError):
+            await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+        # The file changed, but the server sends a range of it anyway.
+        headers["ETag"] = '"v2"'
+        with pytest.raises(DownloadError):
+            await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+        assert os.listdir(tmpdir) == []
+        await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+    finally:
+        await session.close()
+    assert requests == [{}, {"Range": "bytes=50-", "If-Range": '"v1"'}, {}]
+    assert os.listdir(tmpdir) == ["foo"]
+
+
+@pytest.mark.asyncio
+async def test_download_file_truncated(rw_context, tmpdir):
+    path = os.path.join(tmpdir, "foo")
+    session, requests = _range_session(b"a" * 100, headers={"Content-Length": "150"})
+    try:
+        with pytest.raises(DownloadError):
+            await utils.download_file(rw_context, "url", path, session=session, chunk_size=10)
+    finally:
+        await session.close()
+    assert sorted(os.listdir(tmpdir)) == ["foo.part", "foo.part.json"]
+
+
+@pytest.mark.asyncio
+async def test_download_file_in_parts(rw_context, tmpdir):
+    rw_context.config["download_parallel_threshold_mb"] = 1
+    rw_context.config["download_part_size_mb"] = 1
+    rw_context.config["max_concurrent_downloads"] = 2
+    payload = os.urandom(3 * 1024 * 1024 + 12345)
+    path = os.path.join(tmpdir, "foo")
+    session, requests = _range_session(payload, chunk_size=65536)
+    try:
+        hashes = await utils.download_file(rw_context, "url", path, session=session, hash_algs=("sha256",))
+    finally:
+        await session.close()
+    with open(path, "rb") as fh:
+        assert fh.read() == payload
+    assert hashes == {"sha256": hashlib.sha256(payload).hexdigest()}
+    assert requests[0] == {}
+    assert all(request["Accept-Encoding"] == "identity" for request in requests[1:])
+    mb = 1024 * 1024
+    assert sorted(request["Range"] for request in requests[1:]) == [
+        "bytes={}-{}".format(mb, 2 * mb - 1),
+        "bytes={}-{}".format(2 * mb, 3 * mb - 1),
+        "bytes={}-{}".format(3 * mb, len(payload) - 1),
+    ]
+    assert os.listdir(tmpdir) == ["foo"]
+    # The helpers gave their download slots back.
+    assert not rw_context.download_semaphore.locked()
+
+
+@pytest.mark.asyncio
+async def test_download_file_in_parts_no_free_slots(rw_context, tmpdir):
+    rw_context.config["download_parallel_threshold_mb"] = 1
+    rw_context.config["download_part_size_mb"] = 1
+    payload = os.urandom(2 * 1024 * 1024 + 1)
+    path = os.path.join(tmpdir, "foo")
+    session, requests = _range_session(payload, chunk_size=65536)
+    for _ in range(rw_context.config["max_concurrent_downloads"]):
+        await rw_context.download_semaphore.acquire()
+    try:
+        await utils.download_file(rw_context, "url", path, session=session)
+    finally:
+        await session.close()
+    with open(path, "rb") as fh:
+        assert fh.read() == payload
+    assert len(requests) == 3
+
+
+@pytest.mark.asyncio
+async def test_download_file_in_parts_changed(rw_context, tmpdir):
+    rw_context.config["download_parallel_threshold_mb"] = 1
+    rw_context.config["download_part_size_mb"] = 1
+    payload = os.urandom(2 * 1024 * 1024)
+    path = os.path.join(tmpdir, "foo")
+    session, requests = _range_session(payload, chunk_size=65536)
+    original_request = session._request
+
+    async def changed(method, url, *args, **kwargs):
+        if kwargs.get("headers"):
+            kwargs["headers"] = dict(kwargs["headers"], **{"If-Range": '"v2"'})
+        return await original_request(method, url, *args, **kwargs)
+
+    session._request = changed
+    try:
+        with pytest.raises(DownloadError):
+            await utils.download_file(rw_context, "url", path, session=session)
+    finally:
+        await session.close()
+    assert os.listdir(tmpdir) == []
+
+
+# DownloadCache {{{1
+@pytest.mark.asyncio
+async def test_download_cache(rw_context, tmpdir):
+    rw_context.download_cache = utils.DownloadCache(os.path.join(tmpdir, "cache"))
+    payload = b"a" * 100
+    paths = [os.path.join(tmpdir, "work", str(i), "foo") for i in range(3)]
+    session, requests = _range_session(payload)
+    try:
+        results = await asyncio.gather(*[utils.download_file(rw_context, "url", path, session=session, hash_algs=("sha256",)) for path in paths])
+        await utils.download_file(rw_context, "url", paths[0], session=session)
+    finally:
+        await session.close()
+    assert len(requests) == 1
+    assert results == [{"sha256": hashlib.sha256(payload).hexdigest()}] * 3
+    for path in paths:
+        with open(path, "rb") as fh:
+            assert fh.read() == payload
+    assert len(os.listdir(os.path.join(tmpdir, "cache"))) == 1
+
+
+@pytest.mark.asyncio
+async def test_download_cache_failure(tmpdir):
+    cache = utils.DownloadCache(str(tmpdir))
+    calls = []
+
+    async def download(path):
+        calls.append(path)
+        await asyncio.sleep(0)
+        if len(calls) == 1:
+            raise DownloadError("flaky")
+        with open(path, "w") as fh:
+            fh.write("contents")
+
+    path = os.path.join(tmpdir, "out", "foo")
+    results = await asyncio.gather(cache.fetch("url", path, download), cache.fetch("url", path, download), return_exceptions=True)
+    assert [type(result) for result in results] == [DownloadError, DownloadError]
+    # The failure isn't cached.
+    assert await cache.fetch("url", path, download) is None
+    assert len(calls) == 2
+    with open(path) as fh:
+        assert fh.read() == "contents"
+
+
 # format_json {{{1
 def test_format_json():
     expected = "\n".join(["{", '  "a": 1,', '  "b": [', "    4,", "    3,", "    2", "  ],", '  "c": {', '    "d": 5', "  }", "}"])
@@ -625,6 +1088,33 @@ def test_match_url_regex():
     assert utils.match_url_regex((), "https://hg.mozilla.org/mozilla-central", cb) is None
 
 
+# compile_url_rules {{{1
+def test_compile_url_rules():
+    rules = get_frozen_copy(
+        (
+            {"schemes": ["https"], "netlocs": ["hg.mozilla.org", "hg.example.com"], "path_regexes": ["^/(?P<path>mozilla-central)(/|$)"]},
+            {"schemes": ["https", "ssh"], "netlocs": ["hg.mozilla.org"], "path_regexes": ["^/(?P<path>[^/]+)"]},
+        )
+    )
+    compiled = utils.compile_url_rules(rules)
+    assert utils.compile_url_rules(get_frozen_copy(rules)) is compiled
+    assert utils.compile_url_rules(compiled) is compiled
+    assert sorted(compiled.rules_by_location) == [("https", "hg.example.com"), ("https", "hg.mozilla.org"), ("ssh", "hg.mozilla.org")]
+    # both rules match, in rule order
+    assert [m.group("path") for m in compiled.find_matches("https://hg.mozilla.org/mozilla-central")] == ["mozilla-central", "mozilla-central"]
+    assert [m.group("path") for m in compiled.find_matches("ssh://hg.mozilla.org/mozilla-central")] == ["mozilla-central"]
+    assert compiled.find_matches("http://hg.mozilla.org/mozilla-central") == ()
+    assert compiled.find_matches("https://hg.example.com/try") == ()
+    assert compiled.find_matches.cache_info().currsize == 4
+    assert utils.match_url_regex(rules, "ssh://hg.mozilla.org/try", utils.match_url_path_callback) == "try"
+
+
+def test_compile_url_rules_unhashable():
+    rules = ({"schemes": ["https"], "netlocs": ["hg.mozilla.org"], "path_regexes": ["^/(?P<path>.*)"]},)
+    assert utils.compile_url_rules(rules) is not utils.compile_url_rules(rules)
+    assert utils.match_url_regex(rules, "https://hg.mozilla.org/try", utils.match_url_path_callback) == "try"
+
+
 # add_enumerable_item_to_dict {{{1
 @pytest.mark.parametrize(
     "dict_, key, item, expected",
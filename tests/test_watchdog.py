@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Test scriptworker.watchdog"""
+
+import asyncio
+import logging
+import time
+
+import pytest
+
+from scriptworker.metrics import registry
+from scriptworker.watchdog import EventLoopWatchdog
+
+
+# EventLoopWatchdog {{{1
+@pytest.mark.asyncio
+async def test_watchdog_logs_blocking_stack(caplog):
+    caplog.set_level(logging.WARNING, logger="scriptworker.watchdog")
+    blocked = registry.counter_total("event_loop_blocked_total")
+    watchdog = EventLoopWatchdog(asyncio.get_event_loop(), threshold=0.05)
+    watchdog.start()
+    try:
+        await asyncio.sleep(0.1)
+        time.sleep(0.3)
+        await asyncio.sleep(0.1)
+    finally:
+        watchdog.stop()
+    assert registry.counter_total("event_loop_blocked_total") > blocked
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("loop thread stack" in message and "test_watchdog_logs_blocking_stack" in message for message in messages)
+    assert any(message.startswith("Event loop was blocked for") for message in messages)
+
+
+@pytest.mark.asyncio
+async def test_watchdog_quiet(caplog):
+    caplog.set_level(logging.WARNING, logger="scriptworker.watchdog")
+    watchdog = EventLoopWatchdog(asyncio.get_event_loop(), threshold=0.5, interval=0.01)
+    watchdog.start()
+    await asyncio.sleep(0.1)
+    watchdog.stop()
+    assert watchdog._loop_thread_id is not None
+    assert caplog.records == []
@@ -8,6 +8,7 @@ import os
 import signal
 import sys
 import tempfile
+import threading
 from copy import deepcopy
 
 import aiohttp
@@ -130,6 +131,52 @@ def test_main_running_sigusr1(mocker, context, running):
     assert not run_tasks_cancelled.done()
 
 
+def test_main_out_of_space(mocker, context):
+    """Test that the main loop stops when there's no disk space for another task."""
+    event_loop = asyncio.get_event_loop()
+    calls = []
+
+    async def async_main(internal_context, _):
+        calls.append(internal_context)
+        internal_context.disk_monitor.out_of_space = True
+
+    _, tmp = tempfile.mkstemp()
+    try:
+        with open(tmp, "w") as fh:
+            json.dump(context.config, fh)
+        mocker.patch.object(worker, "async_main", new=async_main)
+        mocker.patch.object(sys, "argv", new=["x", tmp])
+        worker.main(event_loop=event_loop)
+    finally:
+        os.remove(tmp)
+
+    assert len(calls) == 1
+
+
+def test_main_disk_check_disabled(mocker, context):
+    """Test that min_free_disk_mb: 0 turns the disk space check off."""
+    event_loop = asyncio.get_event_loop()
+    calls = []
+
+    async def async_main(internal_context, _):
+        calls.append(internal_context)
+        os.kill(os.getpid(), signal.SIGUSR1)
+
+    config = dict(context.config, min_free_disk_mb=0)
+    _, tmp = tempfile.mkstemp()
+    try:
+        with open(tmp, "w") as fh:
+            json.dump(config, fh)
+        mocker.patch.object(worker, "async_main", new=async_main)
+        mocker.patch.object(sys, "argv", new=["x", tmp])
+        worker.main(event_loop=event_loop)
+    finally:
+        os.remove(tmp)
+
+    assert calls
+    assert calls[0].disk_monitor is None
+
+
 # async_main {{{1
 @pytest.mark.asyncio
 async def test_async_main(context, mocker, tmpdir):
@@ -339,6 +386,15 @@ class MockTaskProcess:
         await self.worker_stop_future
 
 
+@pytest.mark.asyncio
+async def test_run_tasks_no_disk_space(context, mocker):
+    context.disk_monitor = mock.MagicMock()
+    context.disk_monitor.ensure_space = create_async(False)
+    mock_claim_work = mocker.patch("scriptworker.worker.claim_work")
+    assert await RunTasks().invoke(context) is None
+    mock_claim_work.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_run_tasks_no_cancel(context, mocker):
     expected_args = [(context, ["one", "public/two"]), None]
@@ -366,6 +422,70 @@ async def test_run_tasks_no_cancel(context, mocker):
     mock_complete_task.assert_called_once_with(mock.ANY, 0)
 
 
+@pytest.mark.asyncio
+async def test_run_tasks_cleanup_off_the_loop(context, mocker):
+    cleanup_threads = []
+
+    mocker.patch("scriptworker.worker.claim_work", create_async(_MOCK_CLAIM_WORK_RETURN))
+    mocker.patch.object(asyncio, "sleep", noop_async)
+    mocker.patch("scriptworker.worker.prepare_to_run_task", noop_sync)
+    mocker.patch("scriptworker.worker.reclaim_task", noop_async)
+    mocker.patch("scriptworker.worker.do_run_task", create_async(0))
+    mocker.patch("scriptworker.worker.cleanup", new=lambda context: cleanup_threads.append(threading.current_thread()))
+    mocker.patch("scriptworker.worker.filepaths_in_dir", create_sync([]))
+    mocker.patch("scriptworker.worker.do_upload", create_async(0))
+    mocker.patch("scriptworker.worker.complete_task", create_async(None))
+
+    await RunTasks().invoke(context)
+    # cleanup() may block on a full trash, so it runs in the executor.
+    assert len(cleanup_threads) == 1
+    assert cleanup_threads[0] is not threading.current_thread()
+
+
+@pytest.mark.parametrize("scanned", (True, False))
+def test_get_artifact_paths(context, mocker, scanned):
+    with open(os.path.join(context.config["artifact_dir"], "one"), "w") as fh:
+        fh.write("1")
+    if scanned:
+        context.scan_artifact_dir()
+        mocker.patch("scriptworker.worker.filepaths_in_dir", new=lambda path: pytest.fail("walked artifact_dir again"))
+    assert worker.get_artifact_paths(context) == ["one"]
+
+
+@pytest.mark.asyncio
+async def test_run_tasks_uploads_timings_last(context, mocker):
+    context.config["task_log_dir"] = os.path.join(context.config["artifact_dir"], "public", "logs")
+    uploads = []
+
+    async def fake_upload(context, files):
+        uploads.append(files)
+        if files == ["public/logs/timings.json"]:
+            with open(os.path.join(context.config["task_log_dir"], "timings.json")) as fh:
+                timings = json.load(fh)
+            assert "do_upload" in timings["stages"]
+            assert "complete_task" not in timings["stages"]
+            assert timings["counters"]["upload_bytes_total"] == 100
+        else:
+            worker.registry.inc("upload_bytes_total", 100)
+        return 0
+
+    async def fake_complete_task(context, status):
+        # the timings are uploaded before the task is resolved
+        assert uploads[-1] == ["public/logs/timings.json"]
+
+    mocker.patch("scriptworker.worker.claim_work", create_async(_MOCK_CLAIM_WORK_RETURN))
+    mocker.patch("scriptworker.worker.prepare_to_run_task", noop_sync)
+    mocker.patch("scriptworker.worker.reclaim_task", noop_async)
+    mocker.patch("scriptworker.worker.do_run_task", create_async(0))
+    mocker.patch("scriptworker.worker.cleanup", noop_sync)
+    mocker.patch("scriptworker.worker.filepaths_in_dir", create_sync(["one"]))
+    mocker.patch("scriptworker.worker.do_upload", new=fake_upload)
+    mocker.patch("scriptworker.worker.complete_task", new=fake_complete_task)
+
+    assert await RunTasks().invoke(context) == 0
+    assert uploads == [["one"], ["public/logs/timings.json"]]
+
+
 @pytest.mark.asyncio
 async def test_run_tasks_cancel_claim_work(context, mocker):
     async def dont_call_me(*args, **kwargs):